@@ -1,21 +1,63 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, Response, abort, g, jsonify, render_template, request, redirect, url_for, session, flash
+from flask.json.provider import DefaultJSONProvider
+import atexit
+import datetime
+import hmac
 import os
+import click
 from functools import wraps # For login_required decorator
 
 # Import user-defined modules
+import archive
 import auth
 import database_operations as db_ops # Import with an alias
+import db_connection
+import db_metrics
+import db_retry
+import log_config
+import records
+import report_cards
+import tenants
+import write_queue
+
+# Queue-based logging with per-module levels (LOG_LEVEL, LOG_LEVELS, LOG_SAMPLE_RATE);
+# set up before the app and its modules start logging
+log_config.configure_logging()
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """JSON provider that writes records.Record rows (Student, Grade) as objects rather than arrays."""
+
+    def dumps(self, obj, **kwargs):
+        return super().dumps(records.jsonable(obj), **kwargs)
 
 # Initialize Flask App
 app = Flask(__name__)
+app.json = RecordJSONProvider(app)
 
 # Secret Key for session management
 # IMPORTANT: Change this to a random, secure value for production!
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'a_very_secure_and_random_secret_key_123!')
 
+# Return pooled database connections at the end of every request/app context
+app.teardown_appcontext(db_connection.release_connections)
+# Delete this process's read-only snapshot files on exit
+atexit.register(db_ops.close_snapshots)
+
 # --- Database and Default User Initialization ---
+def _initialize_schema():
+    """Creates/upgrades the tables of the database the current context is routed to."""
+    db_ops.initialize_database()
+    auth.initialize_auth_database()
+
 def initialize_app_data():
     """Initializes database tables and creates a default admin user if none exist."""
+    if tenants.multi_tenant_enabled():
+        # One database per school; bring every existing school's schema up to date
+        outcome = tenants.fan_out(_initialize_schema)
+        for tenant_id, error in outcome['errors'].items():
+            app.logger.error("Failed to initialize tenant '%s': %s", tenant_id, error)
+        app.logger.info("Initialized %s tenant databases.", len(outcome['results']))
+        return
     with app.app_context():
         # Initialize main database tables (students, grades)
         db_ops.initialize_database()
@@ -29,9 +71,9 @@ def initialize_app_data():
             default_admin_password = os.environ.get('ADMIN_PASS', 'password') # Ensure this is strong and not default in prod
             
             if auth.create_user(default_admin_username, default_admin_password, role='admin'):
-                app.logger.info(f"Default admin user '{default_admin_username}' created with the specified password.")
+                app.logger.info("Default admin user '%s' created with the specified password.", default_admin_username)
             else:
-                app.logger.error(f"Failed to create default admin user '{default_admin_username}'.")
+                app.logger.error("Failed to create default admin user '%s'.", default_admin_username)
         else:
             app.logger.info("User table is not empty. Skipping default admin creation.")
 
@@ -39,6 +81,45 @@ def initialize_app_data():
 initialize_app_data()
 
 
+# --- Tenant Routing ---
+# Endpoints that work before a school is known (the login form asks for one)
+TENANT_OPTIONAL_ENDPOINTS = {'login', 'static', 'index', 'graduated_student_search', 'metrics'}
+
+@app.before_request
+def route_to_tenant():
+    """
+    In multi-tenant mode, routes this request's database calls to one school's
+    database. The school comes from the subdomain, else the logged-in session,
+    else a 'school' form/query field (login form, public graduate lookup).
+    """
+    if not tenants.multi_tenant_enabled():
+        return None
+    host_tenant = tenants.tenant_from_host(request.host)
+    if host_tenant and session.get('tenant') not in (None, host_tenant):
+        session.clear() # A session from another school's subdomain is not valid here
+    tenant_id = host_tenant or session.get('tenant') or request.values.get('school', '').strip().lower() or None
+    if tenant_id is None:
+        if request.endpoint in TENANT_OPTIONAL_ENDPOINTS:
+            return None
+        return redirect(url_for('login'))
+    if not tenants.tenant_exists(tenant_id):
+        abort(404)
+    g.tenant = tenant_id
+    g.tenant_route = db_connection.route_database(tenants.tenant_database(tenant_id))
+    return None
+
+@app.teardown_request
+def reset_tenant_route(exception=None):
+    token = g.pop('tenant_route', None)
+    if token is not None:
+        db_connection.reset_route(token)
+
+@app.context_processor
+def inject_school_field():
+    # Ask for the school on public forms when neither the subdomain nor the session names one
+    return {'school_field': tenants.multi_tenant_enabled() and not g.get('tenant')}
+
+
 # --- Login Required Decorator ---
 def login_required(f):
     @wraps(f)
@@ -70,9 +151,14 @@ def login():
         if not username or not password:
             flash('Both username and password are required.', 'error')
             return render_template('login.html'), 400
+        if tenants.multi_tenant_enabled() and not g.get('tenant'):
+            flash('Please enter your school.', 'error')
+            return render_template('login.html'), 400
 
         if auth.verify_user(username, password):
             session['username'] = username
+            if g.get('tenant'):
+                session['tenant'] = g.tenant
             # session.permanent = True # Optional: make session persistent for some time
             flash('Login successful!', 'success')
             
@@ -90,6 +176,7 @@ def login():
 @login_required # Ensures only logged-in users can access logout
 def logout():
     logged_out_user = session.pop('username', None)
+    session.pop('tenant', None)
     # session.clear() # Use this if you want to clear everything from session
     if logged_out_user:
         flash(f'You have been successfully logged out, {logged_out_user}.', 'success')
@@ -100,7 +187,24 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('dashboard.html', username=session.get('username'))
+    stats = db_ops.get_student_stats()
+    return render_template('dashboard.html', username=session.get('username'), stats=stats)
+
+@app.route('/api/stats')
+@login_required
+def student_stats_api():
+    """Dashboard figures as JSON, read from the trigger-maintained counters."""
+    recent_days = request.args.get('recent_days', db_ops.DEFAULT_RECENT_DAYS, type=int)
+    return jsonify(db_ops.get_student_stats(recent_days=recent_days))
+
+@app.route('/api/subjects')
+@login_required
+def subject_stats_api():
+    """Grade count and numeric average/min/max per subject, grouped on the subject ids."""
+    stats = db_ops.get_subject_statistics()
+    if stats is None:
+        return jsonify({'error': 'Computing subject statistics failed.'}), 500
+    return jsonify(stats)
 
 @app.route('/add_student', methods=['GET', 'POST'])
 @login_required
@@ -132,39 +236,42 @@ def add_student():
                 flash('Enrollment Year must be a valid number.', 'error')
                 return render_template('add_student.html', student=student_data)
         
-        # Attempt to add student
+        # Collect the initial grades (example for 2 sets of grade inputs) before writing anything
+        initial_grades = []
+        for i in range(1, 3): # For grade inputs 1 and 2
+            year_level_str = request.form.get(f'year_level_{i}')
+            subject = request.form.get(f'subject_{i}')
+            grade_value = request.form.get(f'grade_{i}')
+
+            # Only add if all parts of a grade are present and year_level is a number
+            if year_level_str and subject and grade_value:
+                try:
+                    initial_grades.append({'year_level': int(year_level_str), 'subject': subject, 'grade': grade_value})
+                except ValueError:
+                    flash(f"Year Level for grade entry {i} must be a number. Grade not saved.", 'warning')
+            elif year_level_str or subject or grade_value: # Partial grade info
+                flash(f"Partial grade information for entry {i} was not saved. All fields (Year, Subject, Grade) are required and Year must be a number.", 'warning')
+
+        # Add the student together with its initial grades as one atomic commit
+        # (through the single-writer queue when WRITE_QUEUE is enabled)
         # db_ops.add_student is expected to handle None for optional fields appropriately
-        new_student_id = db_ops.add_student(student_data) 
+        def save(tx):
+            new_student_id = db_ops.add_student(student_data, tx=tx)
+            if not new_student_id:
+                return None, []
+            # Use the returned student_id for the grades
+            return new_student_id, [(grade, db_ops.add_student_grade(dict(grade, student_id=new_student_id), tx=tx))
+                                    for grade in initial_grades]
+
+        new_student_id, grade_results = write_queue.run_in_transaction(save)
 
         if new_student_id:
             flash(f"Student {student_data['full_name']} (ID: {new_student_id}) added successfully!", 'success')
-            
-            # Process initial grades (example for 2 sets of grade inputs)
-            for i in range(1, 3): # For grade inputs 1 and 2
-                year_level_str = request.form.get(f'year_level_{i}')
-                subject = request.form.get(f'subject_{i}')
-                grade_value = request.form.get(f'grade_{i}')
-
-                # Only add if all parts of a grade are present and year_level is a number
-                if year_level_str and subject and grade_value:
-                    try:
-                        year_level = int(year_level_str)
-                        grade_data = {
-                            'student_id': new_student_id, # Use the returned student_id
-                            'year_level': year_level,
-                            'subject': subject,
-                            'grade': grade_value
-                        }
-                        grade_added_id = db_ops.add_student_grade(grade_data)
-                        if grade_added_id:
-                             flash(f"Added grade for {subject} (Year {year_level}).", 'info')
-                        else:
-                             flash(f"Failed to add grade for {subject} (Year {year_level}). Student ID might be invalid or DB error.", 'error')
-                    except ValueError:
-                        flash(f"Year Level for grade entry {i} must be a number. Grade not saved.", 'warning')
-                elif year_level_str or subject or grade_value: # Partial grade info
-                    flash(f"Partial grade information for entry {i} was not saved. All fields (Year, Subject, Grade) are required and Year must be a number.", 'warning')
-                            
+            for grade, grade_added_id in grade_results:
+                if grade_added_id:
+                     flash(f"Added grade for {grade['subject']} (Year {grade['year_level']}).", 'info')
+                else:
+                     flash(f"Failed to add grade for {grade['subject']} (Year {grade['year_level']}). Student ID might be invalid or DB error.", 'error')
             return redirect(url_for('view_students')) # Redirect to student list after success
         else:
             flash('Error adding student. Student ID might already exist or other database error.', 'error')
@@ -179,6 +286,8 @@ def view_students():
     search_term = request.args.get('search_term', '').strip()
     search_by = request.args.get('search_by', 'name') # Default search by name
 
+    page = None # Pagination info, only for the unfiltered list
+
     if search_term:
         students_list = db_ops.search_students(search_term=search_term, search_by=search_by)
         if not students_list:
@@ -186,11 +295,19 @@ def view_students():
         else:
             flash(f"Displaying students matching '{search_term}' by {search_by.capitalize()}.", 'info')
     else:
-        students_list = db_ops.get_all_students()
-        if not students_list and not search_term: # Only show "no students added yet" if it's not a failed search
+        # Keyset pagination: only one page of rows is loaded per request
+        page = db_ops.get_students_page(
+            page_size=request.args.get('page_size', db_ops.DEFAULT_PAGE_SIZE, type=int),
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            sort_by=request.args.get('sort_by', 'student_id'),
+        )
+        students_list = page['students']
+        is_first_page = not request.args.get('after') and not request.args.get('before')
+        if not students_list and is_first_page: # Only show "no students added yet" if it's not a failed search
             flash("No students have been added yet. You can add one using the dashboard.", "info")
             
-    return render_template('view_students.html', students=students_list, search_term=search_term, search_by=search_by)
+    return render_template('view_students.html', students=students_list, search_term=search_term, search_by=search_by, page=page)
 
 @app.route('/student/<student_id>', methods=['GET', 'POST'])
 @login_required
@@ -237,12 +354,8 @@ def edit_student(student_id):
                 return render_template('edit_student.html', student=student_info, student_id_from_route=student_id)
 
 
-        if db_ops.update_student(student_id, updated_student_data):
-            flash('Student details updated successfully!', 'success')
-        else:
-            flash('Error updating student details. Student ID might not exist or data was unchanged.', 'error')
-
-        # Process new grade additions
+        # Collect the new grade additions before writing anything
+        new_grades = []
         for i in range(1, 3): # For new_grade_1 and new_grade_2
             year_level_str = request.form.get(f'new_year_level_{i}')
             subject = request.form.get(f'new_subject_{i}')
@@ -250,23 +363,32 @@ def edit_student(student_id):
 
             if year_level_str and subject and grade_value: # Only if all parts of a new grade are present
                 try:
-                    year_level = int(year_level_str)
-                    new_grade_data = {
-                        'student_id': student_id,
-                        'year_level': year_level,
-                        'subject': subject,
-                        'grade': grade_value
-                    }
-                    grade_added_id = db_ops.add_student_grade(new_grade_data)
-                    if grade_added_id:
-                        flash(f"Added new grade for {subject} (Year {year_level}).", 'info')
-                    else:
-                        flash(f"Failed to add new grade for {subject} (Year {year_level}).", 'error')
+                    new_grades.append({'student_id': student_id, 'year_level': int(year_level_str),
+                                       'subject': subject, 'grade': grade_value})
                 except ValueError:
                     flash(f"Year Level for new grade entry {i} must be a number. Grade not saved.", 'warning')
             elif year_level_str or subject or grade_value:
                  flash(f"Partial information for new grade entry {i} was not saved. All fields are required.", 'warning')
 
+        # Save the detail changes and any new grades as one atomic commit
+        # (through the single-writer queue when WRITE_QUEUE is enabled)
+        def save(tx):
+            updated = db_ops.update_student(student_id, updated_student_data, tx=tx)
+            return updated, [(grade, db_ops.add_student_grade(grade, tx=tx)) for grade in new_grades]
+
+        updated, grade_results = write_queue.run_in_transaction(save)
+
+        if updated:
+            flash('Student details updated successfully!', 'success')
+        elif db_ops.get_student_by_id(student_id): # Nothing was changed (e.g. only grades were added)
+            flash('Student details unchanged.', 'info')
+        else:
+            flash('Error updating student details. Student ID might not exist.', 'error')
+        for grade, grade_added_id in grade_results:
+            if grade_added_id:
+                flash(f"Added new grade for {grade['subject']} (Year {grade['year_level']}).", 'info')
+            else:
+                flash(f"Failed to add new grade for {grade['subject']} (Year {grade['year_level']}).", 'error')
 
         return redirect(url_for('edit_student', student_id=student_id))
 
@@ -281,7 +403,7 @@ def edit_student(student_id):
 @app.route('/grade/<int:grade_id>/delete/<student_id_for_redirect>')
 @login_required
 def delete_grade(grade_id, student_id_for_redirect):
-    if db_ops.delete_student_grade(grade_id):
+    if write_queue.delete_student_grade(grade_id):
         flash('Grade deleted successfully!', 'success')
     else:
         flash('Error deleting grade. It might have already been deleted or does not exist.', 'error')
@@ -294,7 +416,7 @@ def delete_student(student_id):
     student_details = db_ops.get_student_by_id(student_id)
     student_name = student_details['full_name'] if student_details else f"ID {student_id}"
     
-    if db_ops.delete_student(student_id):
+    if write_queue.delete_student(student_id):
         flash(f"Student record for {student_name} and all associated grades deleted successfully!", 'success')
         return redirect(url_for('view_students'))
     else:
@@ -308,7 +430,9 @@ def graduated_student_search():
     student_data_result = None
     message_to_display = None 
 
-    if student_id_query:
+    if student_id_query and tenants.multi_tenant_enabled() and not g.get('tenant'):
+        message_to_display = "Please enter your school."
+    elif student_id_query:
         # Using the existing get_graduated_student_record function
         student_data_result = db_ops.get_graduated_student_record(student_id=student_id_query)
         if not student_data_result:
@@ -319,10 +443,110 @@ def graduated_student_search():
         # but the template already handles this by showing "Enter your student ID..."
         # message_to_display = "Please enter your Student ID to view your record."
 
+    # Lookups read a periodically refreshed snapshot; tell visitors how current it is
+    looked_up = student_id_query and (g.get('tenant') or not tenants.multi_tenant_enabled())
+    snapshot_status = db_ops.get_snapshot_status() if looked_up else None
+    data_as_of = None
+    if snapshot_status and snapshot_status['taken_at']:
+        data_as_of = datetime.datetime.fromtimestamp(snapshot_status['taken_at']).strftime('%Y-%m-%d %H:%M')
+
     return render_template('graduated_access.html', 
                            student_data=student_data_result, 
                            searched_id=student_id_query,
-                           message=message_to_display)
+                           message=message_to_display,
+                           snapshot_status=snapshot_status,
+                           data_as_of=data_as_of)
+
+
+@app.route('/export/register')
+@login_required
+def export_register():
+    """Streams the full student register (buku induk) with grades as CSV or JSONL, optionally gzipped."""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        flash(f"Unsupported export format '{export_format}'.", 'error')
+        return redirect(url_for('dashboard'))
+
+    chunks = db_ops.export_register(export_format)
+    filename = f"buku_induk.{export_format}"
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    if request.args.get('gzip'):
+        chunks = db_ops.gzip_stream(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+# Bearer token for Prometheus scrapers; without it /metrics needs a logged-in session
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+# Bearer token for mirrors (e.g. the district office); without it /api/changes needs a logged-in session
+SYNC_TOKEN = os.environ.get('SYNC_TOKEN') or None
+
+def _has_bearer_token(expected: str | None) -> bool:
+    """True if the request carries `Authorization: Bearer <expected>` (never true when no token is configured)."""
+    authorization = request.headers.get('Authorization', '')
+    token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else ''
+    return bool(expected) and hmac.compare_digest(token.encode(), expected.encode())
+
+def _bearer_unauthorized():
+    return Response('Unauthorized\n', status=401, mimetype='text/plain', headers={'WWW-Authenticate': 'Bearer'})
+
+def _database_metric_families():
+    """Retry, cache and write queue counters of this process, as Prometheus metric families."""
+    retry_stats = db_retry.get_retry_stats()
+    families = [
+        db_metrics.family(metric, 'counter', help_text,
+                          [({'function': name}, stats[key]) for name, stats in retry_stats.items()])
+        for metric, key, help_text in (
+            ('db_retries_total', 'retries', 'Retries after lock contention.'),
+            ('db_retry_wait_seconds_total', 'retry_wait_seconds', 'Time spent backing off before retries.'),
+            ('db_retry_recovered_total', 'recovered', 'Calls that succeeded after retrying.'),
+            ('db_retry_failures_total', 'failures', 'Calls that still hit lock contention on their last attempt.'))
+    ]
+    cache_stats = db_ops.get_cache_stats()
+    families.append(db_metrics.family('record_cache_lookups_total', 'counter', 'Record cache lookups by result.',
+                                      [({'result': 'hit'}, cache_stats['hits']),
+                                       ({'result': 'miss'}, cache_stats['misses'])]))
+    families.append(db_metrics.family('record_cache_entries', 'gauge', 'Entries in the record cache.',
+                                      [({}, cache_stats['size'])]))
+    statement_stats = db_ops.get_statement_cache_stats()
+    families.append(db_metrics.family('update_statement_cache_lookups_total', 'counter',
+                                      'Compiled UPDATE statement lookups by result.',
+                                      [({'table': table, 'result': result}, stats[key])
+                                       for table, stats in statement_stats.items()
+                                       for result, key in (('hit', 'hits'), ('miss', 'misses'))]))
+    queue_stats = write_queue.get_write_queue_stats()
+    families.append(db_metrics.family('write_queue_commits_total', 'counter', 'Group commits by the writer thread.',
+                                      [({'database': database}, stats['groups'])
+                                       for database, stats in queue_stats.items()]))
+    families.append(db_metrics.family('write_queue_writes_total', 'counter', 'Writes committed by the writer thread.',
+                                      [({'database': database}, stats['writes'])
+                                       for database, stats in queue_stats.items()]))
+    return families
+
+@app.route('/metrics')
+def metrics():
+    """Database profiling metrics in the Prometheus text format (logged-in users or METRICS_TOKEN)."""
+    if 'username' not in session and not _has_bearer_token(METRICS_TOKEN):
+        return _bearer_unauthorized()
+    return Response(db_metrics.render_prometheus(_database_metric_families()),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/changes')
+def changes_api():
+    """
+    Incremental sync for mirrors of the register (logged-in users or SYNC_TOKEN):
+    GET /api/changes?since=<next_version>&limit=<n>, see db_ops.get_changes_since().
+    """
+    if 'username' not in session and not _has_bearer_token(SYNC_TOKEN):
+        return _bearer_unauthorized()
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', db_ops.CHANGES_PAGE_SIZE, type=int)
+    result = db_ops.get_changes_since(since, limit)
+    if result is None:
+        return jsonify({'error': 'Reading the change log failed.'}), 500
+    return jsonify(result)
 
 
 # Example of another protected route (profile) - can be kept or removed if not central to current task
@@ -335,6 +559,224 @@ def profile():
     <p><a href='{url_for('dashboard')}'>Dashboard</a> | <a href='{url_for('logout')}'>Logout</a></p>
     """
 
+# --- Command Line Tools ---
+@app.cli.command('import-csv')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--kind', type=click.Choice(['students', 'grades']), default='students', show_default=True,
+              help='What the CSV file contains.')
+@click.option('--chunk-size', type=int, default=db_ops.BULK_CHUNK_SIZE, show_default=True,
+              help='Rows committed per transaction.')
+@click.option('--restart', is_flag=True, help='Ignore saved progress and import from the first row.')
+def import_csv_command(csv_path, kind, chunk_size, restart):
+    """Stream students or grades from a CSV file into the database.
+
+    Example: flask --app app import-csv students.csv --kind students
+    """
+    report = db_ops.import_csv(csv_path, kind=kind, chunk_size=chunk_size, resume=not restart)
+    for error in report['errors']:
+        click.echo(f"Line {error['row'] + 1} (student {error['student_id']}): {error['error']}", err=True)
+    if report['skipped']:
+        click.echo(f"Skipped {report['skipped']} rows already imported by an earlier run.")
+    click.echo(f"Imported {report['inserted']} {kind} in {report['chunks']} chunks, "
+               f"{len(report['errors'])} rows rejected.")
+    if 'failed' in report:
+        raise click.ClickException(f"Import stopped after row {report['rows']}: {report['failed']}. "
+                                   f"Run the command again to resume.")
+
+
+
+@app.cli.command('export-register')
+@click.argument('output_path', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--format', 'export_format', type=click.Choice(['csv', 'jsonl']), default='csv', show_default=True)
+@click.option('--gzip', 'use_gzip', is_flag=True, help='Compress the output with gzip.')
+def export_register_command(output_path, export_format, use_gzip):
+    """Stream the full student register with grades to a file ('-' for stdout).
+
+    Example: flask --app app export-register buku_induk.csv.gz --gzip
+    """
+    chunks = db_ops.export_register(export_format)
+    if use_gzip:
+        chunks = db_ops.gzip_stream(chunks)
+    else:
+        chunks = (chunk.encode('utf-8') for chunk in chunks)
+    with click.open_file(output_path, 'wb') as output:
+        for chunk in chunks:
+            output.write(chunk)
+    if output_path != '-':
+        click.echo(f"Register exported to {output_path}.")
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the dashboard counters from the student and grade tables.
+
+    Example: flask --app app rebuild-stats
+    """
+    result = db_ops.rebuild_student_stats()
+    if result is None:
+        raise click.ClickException("Rebuilding the statistics failed; see the log for details.")
+    click.echo(f"Rebuilt {result['counters']} counters, {result['corrected']} had drifted.")
+
+
+@app.cli.command('recompute-rankings')
+@click.option('--full', is_flag=True, help='Re-rank every cohort, not only those changed since the last run.')
+def recompute_rankings_command(full):
+    """Recompute GPAs and class ranks per cohort (enrollment year and year level).
+
+    GPA and ranking reads never recompute; they report 'stale' until this runs,
+    so schedule it (e.g. from cron) after grade entry.
+
+    Example: flask --app app recompute-rankings
+    """
+    result = db_ops.recompute_rankings(full=full)
+    if result is None:
+        raise click.ClickException("Recomputing the rankings failed; see the log for details.")
+    click.echo(f"Recomputed {result['cohorts']} cohorts ({result['students']} students ranked).")
+
+
+@app.cli.command('render-documents')
+@click.argument('output_path', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--status', type=click.Choice(db_ops.STUDENT_STATUSES), help='Only students with this status.')
+@click.option('--enrollment-year', type=int, help='Only students of this enrollment year.')
+@click.option('--pdf', is_flag=True, help='Render PDF instead of HTML (requires WeasyPrint).')
+@click.option('--workers', type=int, default=report_cards.RENDER_WORKERS, show_default=True,
+              help='Worker processes rendering documents.')
+def render_documents_command(output_path, status, enrollment_year, pdf, workers):
+    """Render report cards (and transcripts for graduates) into a zip file ('-' for stdout).
+
+    Example: flask --app app render-documents report_cards.zip --status active
+    """
+    def show_progress(documents, elapsed):
+        rate = documents / elapsed if elapsed else 0.0
+        click.echo(f"\r{documents} documents rendered ({rate:.1f}/sec)", nl=False, err=True)
+
+    try:
+        with click.open_file(output_path, 'wb') as output:
+            report = report_cards.render_documents(output, status=status, enrollment_year=enrollment_year,
+                                                   pdf=pdf, workers=workers, progress=show_progress)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(err=True)
+    for error in report['errors']:
+        click.echo(f"Student {error['student_id']}: {error['error']}", err=True)
+    click.echo(f"Rendered {report['documents']} {report['format'].upper()} documents in {report['seconds']}s "
+               f"({report['documents_per_second']} documents/sec, {report['workers']} workers), "
+               f"{len(report['errors'])} failed.", err=True)
+
+
+@app.cli.command('refresh-snapshot')
+def refresh_snapshot_command():
+    """Take a fresh read-only snapshot for the public graduate lookup.
+
+    Only affects this process; running app workers refresh their own snapshots
+    every SNAPSHOT_REFRESH_SECONDS. Example: flask --app app refresh-snapshot
+    """
+    status = db_ops.refresh_snapshot()
+    if status is None:
+        raise click.ClickException("No snapshot taken (snapshots disabled or the copy failed; see the log).")
+    click.echo(f"Snapshot generation {status['generation']} taken.")
+
+
+@app.cli.command('archive-students')
+@click.option('--older-than', 'older_than_years', type=int, default=archive.ARCHIVE_AFTER_YEARS, show_default=True,
+              help='Archive students who graduated or dropped out at least this many years ago.')
+@click.option('--batch-size', type=int, default=archive.ARCHIVE_BATCH_SIZE, show_default=True,
+              help='Students moved per transaction.')
+def archive_students_command(older_than_years, batch_size):
+    """Move former students (graduated or dropped out) to the archive database.
+
+    Graduates stay available through the public lookup. In multi-tenant mode
+    every school is archived. Example: flask --app app archive-students --older-than 5
+    """
+    if tenants.multi_tenant_enabled():
+        outcome = tenants.fan_out(db_ops.archive_students, older_than_years, batch_size)
+        reports = outcome['results']
+        for tenant_id, error in outcome['errors'].items():
+            click.echo(f"{tenant_id}: failed ({error})", err=True)
+    else:
+        reports = {None: db_ops.archive_students(older_than_years, batch_size)}
+    failed = False
+    for tenant_id, report in sorted(reports.items(), key=lambda item: item[0] or ''):
+        prefix = f"{tenant_id}: " if tenant_id else ''
+        if report is None:
+            failed = True
+            click.echo(f"{prefix}archiving failed; see the log for details.", err=True)
+            continue
+        click.echo(f"{prefix}archived {report['archived']} students from {report['cutoff_year']} or earlier"
+                   + (f", {report['kept']} changed during the run and stay live." if report['kept'] else "."))
+    if failed or (tenants.multi_tenant_enabled() and outcome['errors']):
+        raise click.ClickException("Archiving did not complete.")
+
+
+@app.cli.command('compact-changes')
+@click.option('--max-entries', type=int, default=db_ops.CHANGE_LOG_MAX_ENTRIES, show_default=True,
+              help='Entries kept at most after dropping superseded ones.')
+@click.option('--retention-days', type=int, default=db_ops.CHANGE_LOG_RETENTION_DAYS, show_default=True,
+              help='Entries older than this are dropped.')
+def compact_changes_command(max_entries, retention_days):
+    """Bound the size of the change log used by /api/changes.
+
+    Mirrors that fall behind the dropped entries are asked to download the
+    register again. Example: flask --app app compact-changes --retention-days 30
+    """
+    result = db_ops.compact_change_log(max_entries=max_entries, retention_days=retention_days)
+    if result is None:
+        raise click.ClickException("Compacting the change log failed; see the log for details.")
+    click.echo(f"Removed {result['superseded']} superseded and {result['expired']} expired entries, "
+               f"{result['remaining']} remain.")
+
+
+@app.cli.command('migrate-grades')
+@click.option('--batch-size', type=int, default=db_ops.GRADE_MIGRATION_BATCH_SIZE, show_default=True,
+              help='Grades updated per transaction.')
+def migrate_grades_command(batch_size):
+    """Fill in subject ids and numeric grade values for grades stored before they existed.
+
+    The app also does this at startup; run it beforehand to choose the batch
+    size. Example: flask --app app migrate-grades --batch-size 2000
+    """
+    result = db_ops.migrate_grade_columns(batch_size)
+    if result is None:
+        raise click.ClickException("The migration stopped; see the log. Run the command again to continue.")
+    click.echo(f"Migrated {result['migrated']} grades in {result['batches']} batches.")
+
+
+@app.cli.command('create-tenant')
+@click.argument('tenant_id')
+@click.option('--admin-user', help='Username of the first admin (default: ADMIN_USER or admin).')
+@click.option('--admin-pass', help='Password of the first admin (default: ADMIN_PASS or password).')
+def create_tenant_command(tenant_id, admin_user, admin_pass):
+    """Create a school's database (multi-tenant mode, TENANT_DATA_DIR must be set).
+
+    Example: TENANT_DATA_DIR=/srv/schools flask --app app create-tenant sman1
+    """
+    try:
+        ok = tenants.initialize_tenant(tenant_id, admin_user, admin_pass)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if not ok:
+        raise click.ClickException(f"Creating tenant '{tenant_id}' failed; see the log for details.")
+    click.echo(f"Tenant '{tenant_id}' is ready at {tenants.tenant_database(tenant_id)}.")
+
+
+@app.cli.command('tenant-stats')
+def tenant_stats_command():
+    """Print student and grade counts for every school, queried in parallel.
+
+    Example: TENANT_DATA_DIR=/srv/schools flask --app app tenant-stats
+    """
+    if not tenants.multi_tenant_enabled():
+        raise click.ClickException("Multi-tenancy is disabled; set TENANT_DATA_DIR.")
+    outcome = tenants.fan_out(db_ops.get_student_stats)
+    for tenant_id, stats in outcome['results'].items():
+        click.echo(f"{tenant_id}: {stats['total_students']} students, {stats['total_grades']} grades, "
+                   f"{stats['recent_additions']} added in the last {stats['recent_days']} days")
+    for tenant_id, error in outcome['errors'].items():
+        click.echo(f"{tenant_id}: failed ({error})", err=True)
+    click.echo(f"{len(outcome['results'])} schools, "
+               f"{sum(stats['total_students'] for stats in outcome['results'].values())} students in total.")
+
+
 if __name__ == '__main__':
     # Note: In a production environment, use a WSGI server like Gunicorn or uWSGI
     # The debug mode should be disabled in production.
@@ -0,0 +1,135 @@
+"""
+Cold storage for students who graduated or dropped out long ago.
+
+database_operations.archive_students() moves such students out of the live
+database into an archive file next to it (`student_records.archive.db`), so
+the tables every request works on only hold current students. Each archived
+student is one row holding their details and grades as zlib-compressed JSON,
+plus the few columns needed to find and count them; the archive is written
+only by the archival job and read by the graduate lookup.
+"""
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Students whose graduation year (or enrollment year, if they have none) is at
+# least this many years ago are archived.
+ARCHIVE_AFTER_YEARS = int(os.environ.get('ARCHIVE_AFTER_YEARS', 5))
+# Students moved per batch; each batch holds the write lock of the live database once, briefly.
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 200))
+# Pause between batches (seconds), so writers waiting for the lock get their turn.
+ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE_MS', 50)) / 1000
+# Longest a batch should hold the write lock (seconds); slower batches make the next ones smaller.
+ARCHIVE_MAX_LOCK_SECONDS = float(os.environ.get('ARCHIVE_MAX_LOCK_MS', 200)) / 1000
+# Directory for archive files; defaults to the directory of the database they belong to.
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or None
+ARCHIVED_STATUSES = ('graduated', 'dropped_out')
+
+
+def archive_path(database: str, directory: str | None = ARCHIVE_DIR) -> str:
+    """Returns the archive file of `database`, e.g. 'student_records.archive.db' for 'student_records.db'."""
+    stem, _ = os.path.splitext(os.path.basename(database))
+    return os.path.join(directory or os.path.dirname(os.path.abspath(database)), f"{stem}.archive.db")
+
+
+def encode_record(record: dict) -> bytes:
+    return zlib.compress(json.dumps(record, separators=(',', ':'), sort_keys=True).encode('utf-8'), 9)
+
+
+def decode_record(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob))
+
+
+class Archive:
+    """
+    The archive database of one live database. Records are
+    {'details': {...students row...}, 'grades': [{...student_grades row...}, ...]}.
+    Each thread gets its own connection; the file is created by the first store().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self, create: bool) -> sqlite3.Connection | None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+        if not create and not os.path.exists(self.path):
+            return None # Nothing archived yet; lookups must not create an empty file
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS archived_students (
+                        student_id TEXT PRIMARY KEY,
+                        full_name TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        enrollment_year INTEGER,
+                        graduation_year INTEGER,
+                        archived_at TEXT NOT NULL,
+                        record BLOB NOT NULL
+                    )
+                ''')
+                conn.commit()
+                self._schema_ready = True
+        self._local.conn = conn
+        return conn
+
+    def store(self, records: list[dict]) -> None:
+        """Writes `records` in one transaction, replacing earlier copies of the same students."""
+        conn = self._connection(create=True)
+        archived_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO archived_students VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(r['details']['student_id'], r['details']['full_name'], r['details']['status'],
+                  r['details'].get('enrollment_year'), r['details'].get('graduation_year'),
+                  archived_at, encode_record(r)) for r in records])
+
+    def get(self, student_id: str) -> dict | None:
+        """Returns the archived record of `student_id`, or None if the student is not archived."""
+        conn = self._connection(create=False)
+        if conn is None:
+            return None
+        row = conn.execute("SELECT record FROM archived_students WHERE student_id = ?", (student_id,)).fetchone()
+        return decode_record(row[0]) if row else None
+
+    def remove(self, student_ids: list[str]) -> int:
+        """Deletes the given students from the archive; returns how many were there."""
+        conn = self._connection(create=False)
+        if conn is None or not student_ids:
+            return 0
+        with conn:
+            cursor = conn.executemany("DELETE FROM archived_students WHERE student_id = ?",
+                                      [(student_id,) for student_id in student_ids])
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        """Returns {'path', 'students', 'by_status': {status: count}, 'file_bytes'}."""
+        conn = self._connection(create=False)
+        by_status = dict.fromkeys(ARCHIVED_STATUSES, 0)
+        if conn is not None:
+            by_status.update(conn.execute(
+                "SELECT status, COUNT(*) FROM archived_students GROUP BY status").fetchall())
+        return {
+            'path': self.path,
+            'students': sum(by_status.values()),
+            'by_status': by_status,
+            'file_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+    def close(self) -> None:
+        """Closes this thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,164 @@
+"""
+Asyncio counterparts of the functions in database_operations and auth, for
+running the app under an ASGI server.
+
+Every coroutine has the same signature as the function it wraps and returns
+the same value:
+
+    student = await async_operations.get_student_by_id('S001')
+    if await async_operations.verify_user(username, password): ...
+
+SQLite work runs on a dedicated thread pool of DB_ASYNC_WORKERS threads, so at
+most that many pooled connections are used by async callers at any time and the
+event loop never blocks on the database. Each call returns its connection to
+the pool when it finishes. Password hashing in verify_user() runs on the event
+loop's default executor, so slow logins do not occupy database threads.
+
+The `tx` argument of the CRUD functions cannot be used here, because a
+transaction is bound to one thread; use run_in_transaction() instead.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import os
+import threading
+
+import auth
+import database_operations
+import db_connection
+
+logger = logging.getLogger(__name__)
+
+# Number of threads (and so at most pooled connections) used for async database calls.
+ASYNC_WORKERS = int(os.environ.get('DB_ASYNC_WORKERS', min(4, db_connection.POOL_SIZE)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Returns the database thread pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=ASYNC_WORKERS, thread_name_prefix='sqlite-async')
+            logger.info("Started async database executor with %s threads.", ASYNC_WORKERS)
+        return _executor
+
+
+def _call_and_release(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Hand the worker's connection back so sync callers can use it too
+        db_connection.release_connections()
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Runs a blocking database function on the database executor and awaits its result.
+    The caller's context (e.g. the school the request is routed to) is carried over.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), context.run, _call_and_release, func, args, kwargs)
+
+
+async def run_in_transaction(func, *args, **kwargs):
+    """
+    Runs `func(tx, *args, **kwargs)` inside database_operations.transaction() on a
+    single database thread, so several CRUD calls commit or roll back together:
+
+        def enroll(tx, student, grades):
+            database_operations.add_student(student, tx=tx)
+            for grade in grades:
+                database_operations.add_student_grade(grade, tx=tx)
+
+        await async_operations.run_in_transaction(enroll, student, grades)
+    """
+    def in_transaction():
+        with database_operations.transaction() as tx:
+            return func(tx, *args, **kwargs)
+    return await run_sync(in_transaction)
+
+
+def _async_version(func):
+    """Wraps a blocking function in a coroutine function with the same signature."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if kwargs.get('tx') is not None:
+            raise ValueError("Transactions cannot span async calls; use run_in_transaction().")
+        return await run_sync(func, *args, **kwargs)
+    return wrapper
+
+
+# --- database_operations ---
+
+initialize_database = _async_version(database_operations.initialize_database)
+get_all_students = _async_version(database_operations.get_all_students)
+get_students_page = _async_version(database_operations.get_students_page)
+get_student_by_id = _async_version(database_operations.get_student_by_id)
+search_students = _async_version(database_operations.search_students)
+get_student_details_with_grades = _async_version(database_operations.get_student_details_with_grades)
+get_grades_for_student = _async_version(database_operations.get_grades_for_student)
+get_graduated_student_record = _async_version(database_operations.get_graduated_student_record)
+get_snapshot_status = _async_version(database_operations.get_snapshot_status)
+add_student = _async_version(database_operations.add_student)
+update_student = _async_version(database_operations.update_student)
+delete_student = _async_version(database_operations.delete_student)
+add_student_grade = _async_version(database_operations.add_student_grade)
+update_student_grade = _async_version(database_operations.update_student_grade)
+delete_student_grade = _async_version(database_operations.delete_student_grade)
+add_students_bulk = _async_version(database_operations.add_students_bulk)
+add_student_grades_bulk = _async_version(database_operations.add_student_grades_bulk)
+import_csv = _async_version(database_operations.import_csv)
+
+
+async def export_register(fmt: str = 'csv'):
+    """
+    Async generator version of database_operations.export_register(). Each chunk
+    is produced on the database executor; the export keeps its own connection
+    until the generator is exhausted or closed.
+    """
+    chunks = database_operations.export_register(fmt)
+    done = object()
+    try:
+        while True:
+            chunk = await run_sync(next, chunks, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        await run_sync(chunks.close)
+
+
+# --- auth ---
+
+initialize_auth_database = _async_version(auth.initialize_auth_database)
+create_user = _async_version(auth.create_user)
+get_user_count = _async_version(auth.get_user_count)
+
+
+@functools.wraps(auth.verify_user)
+async def verify_user(username: str, password: str) -> bool:
+    if not username or not password:
+        logger.error("Username and password cannot be empty for verification.")
+        return False
+    stored_hash = await run_sync(auth.get_password_hash, username)
+    if stored_hash is None:
+        return False
+    # bcrypt is CPU-bound and releases the GIL; keep it off the database threads
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, auth.check_password, username, password, stored_hash)
+
+
+def shutdown(wait: bool = True) -> None:
+    """Stops the database executor (e.g. on ASGI lifespan shutdown). It is recreated on next use."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
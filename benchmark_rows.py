@@ -0,0 +1,77 @@
+"""
+Compares the memory and time cost of materializing query results as dictionaries
+(dict(row), the old behaviour) versus the slotted Student records from records.py.
+
+Usage:
+    python benchmark_rows.py [ROWS]
+
+ROWS defaults to 100000. The benchmark uses its own in-memory database.
+"""
+import gc
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+from records import Student
+
+SELECT_SQL = f"SELECT {', '.join(Student._fields)} FROM students"
+
+
+def build_database(row_count: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"CREATE TABLE students ({', '.join(Student._fields)})")
+    conn.executemany(
+        f"INSERT INTO students VALUES ({', '.join('?' for _ in Student._fields)})",
+        ((f"S{i:06d}", f"Student Number {i}", '2008-01-01', 'Female', f"Jalan Merdeka {i}",
+          '555-0100', f"student{i}@example.com", 2020, None, 'active') for i in range(row_count)))
+    return conn
+
+
+def fetch_dicts(conn: sqlite3.Connection) -> list:
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    return [dict(row) for row in cursor.execute(SELECT_SQL).fetchall()]
+
+
+def fetch_records(conn: sqlite3.Connection) -> list:
+    cursor = conn.cursor()
+    cursor.row_factory = Student.from_row
+    return cursor.execute(SELECT_SQL).fetchall()
+
+
+def measure(label: str, fetch, conn: sqlite3.Connection, row_count: int) -> None:
+    gc.collect()
+    started = time.perf_counter()
+    rows = fetch(conn)
+    elapsed = time.perf_counter() - started
+
+    # Read two fields of every row, as the student list template does
+    started = time.perf_counter()
+    for row in rows:
+        row['full_name'], row['status']
+    access = time.perf_counter() - started
+    del rows
+
+    # Memory is measured in a separate run because tracing slows allocation down
+    gc.collect()
+    tracemalloc.start()
+    rows = fetch(conn)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    print(f"{label:<10} fetch {elapsed * 1000:8.1f} ms  access {access * 1000:7.1f} ms  "
+          f"retained {retained / row_count:7.1f} B/row  peak {peak / 1024 / 1024:7.1f} MiB")
+
+
+def main() -> None:
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    conn = build_database(row_count)
+    print(f"{row_count} rows, {len(Student._fields)} columns")
+    measure('dict(row)', fetch_dicts, conn, row_count)
+    measure('Student', fetch_records, conn, row_count)
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
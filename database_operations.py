@@ -1,22 +1,161 @@
 import sqlite3
 import logging
+import re
+import json
+import base64
+import contextlib
+import copy
+import csv
+import datetime
+import itertools
+import io
+import os
+import threading
+import time
+import zlib
+
+import archive
+import db_connection
+import db_metrics
+import db_retry
+import record_cache
+import snapshot
+import update_statements
+from records import Student, Grade
 
 DATABASE_NAME = 'student_records.db'
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Handlers, levels and sampling are set up once at app startup by log_config.configure_logging()
+logger = logging.getLogger(__name__)
+
+def current_database() -> str:
+    """
+    Returns the database file used by the current request or task: DATABASE_NAME,
+    unless the context is routed to another one (e.g. a school's database, see tenants.py).
+    """
+    return db_connection.resolve_database(DATABASE_NAME)
 
 def get_db_connection():
-    """Establishes and returns a database connection."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    conn.row_factory = sqlite3.Row  # Access columns by name
-    conn.execute("PRAGMA foreign_keys = ON;") # Enforce foreign key constraints
-    return conn
+    """
+    Returns the pooled database connection bound to the current thread.
+    Row factory and foreign key enforcement are set up once when the pool opens it.
+    """
+    return db_connection.get_connection(current_database())
+
+# --- Transactions (Unit of Work) ---
 
+class Transaction:
+    """Handle for a transaction() block. Pass it as `tx=` to the CRUD functions."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+@contextlib.contextmanager
+def transaction():
+    """
+    Groups several CRUD calls into one atomic commit:
+
+        with db_ops.transaction() as tx:
+            db_ops.add_student(student_data, tx=tx)
+            db_ops.add_student_grade(grade_data, tx=tx)
+
+    The write lock is taken up front (BEGIN IMMEDIATE). Everything is committed
+    when the block exits normally and rolled back if it raises; a BEGIN or COMMIT
+    that hits lock contention is retried under the db_retry policy. CRUD functions
+    called inside the block skip their own commits but still report failures
+    through their return values; a failed statement does not undo the others.
+    A nested transaction() joins the outer one.
+    """
+    conn = get_db_connection()
+    if conn.in_unit_of_work:
+        yield Transaction(conn)
+        return
+
+    # Nothing has run yet, so a busy BEGIN can simply be retried
+    db_retry.call_with_retry(conn.execute, "BEGIN IMMEDIATE", name='transaction')
+    conn.in_unit_of_work = True
+    conn.cache_invalidations = set()
+    try:
+        yield Transaction(conn)
+        # A busy COMMIT leaves the transaction open, so it can be retried as it is
+        db_retry.call_with_retry(conn.commit, name='transaction commit')
+        _publish_subjects(conn)
+    except BaseException:
+        conn.rollback()
+        logger.warning("Transaction rolled back.")
+        raise
+    finally:
+        conn.in_unit_of_work = False
+        # Other threads may have re-cached the old rows while the transaction was open
+        _invalidate_student(conn, *conn.cache_invalidations)
+        conn.cache_invalidations = set()
+
+def _connection_for(tx: Transaction | None) -> sqlite3.Connection:
+    """Returns the transaction's connection, or the thread's pooled connection without one."""
+    return tx.conn if tx is not None else get_db_connection()
+
+def _commit(conn: sqlite3.Connection) -> None:
+    """Commits unless a transaction() block is open; that block commits once at its end."""
+    if not conn.in_unit_of_work:
+        conn.commit()
+        _publish_subjects(conn)
+
+# --- Record Cache ---
+
+# Read-through cache for get_student_by_id(), get_grades_for_student() and
+# get_graduated_student_record(). Entries are dropped when this process writes
+# the student or their grades; the TTL bounds how long writes made by other
+# processes (other app workers, the CLI) can go unnoticed. Size 0 disables it.
+# Keys start with the database file, so schools never see each other's entries.
+_record_cache = record_cache.LRUCache(
+    max_size=int(os.environ.get('STUDENT_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('STUDENT_CACHE_TTL', 30.0)),
+)
+
+def _cache_lookup(conn: sqlite3.Connection, key: tuple) -> tuple[bool, object]:
+    """Returns (hit, copy of the cached value). Inside a transaction() block the cache is bypassed."""
+    if conn.in_unit_of_work:
+        return False, None
+    hit, value = _record_cache.get((current_database(), *key))
+    return hit, copy.deepcopy(value)
+
+def _cache_store(conn: sqlite3.Connection, key: tuple, value) -> None:
+    """Caches a copy of a committed value; rows read inside a transaction() block may still be rolled back."""
+    if not conn.in_unit_of_work:
+        _record_cache.put((current_database(), *key), copy.deepcopy(value))
+
+def _invalidate_student(conn: sqlite3.Connection, *student_ids: str) -> None:
+    """
+    Drops the cached records of the given students. Inside a transaction() block the
+    ids are remembered and dropped again once the transaction has finished.
+    """
+    database = current_database()
+    for student_id in student_ids:
+        _record_cache.invalidate((database, 'student', student_id), (database, 'grades', student_id),
+                                 (database, 'graduated', student_id))
+    if conn.in_unit_of_work:
+        conn.cache_invalidations.update(student_ids)
+
+def get_cache_stats() -> dict:
+    """
+    Returns the record cache counters: size, max_size, ttl, hits, misses,
+    evictions, expirations, invalidations and hit_rate.
+    """
+    return _record_cache.stats()
+
+def clear_record_cache() -> None:
+    """Empties the record cache, e.g. after the database was changed by another tool."""
+    _record_cache.clear()
+
+@db_retry.retry_on_busy
 def initialize_database():
     """
     Connects to the SQLite database and creates the 'students' and 'student_grades'
-    tables if they don't already exist.
+    tables, their secondary indexes, the subjects table, the name search index,
+    the dashboard counters and the change log if they don't already exist, then
+    logs the effective PRAGMA settings (journal mode, synchronous, cache sizes)
+    of the active profile. Grades from older files get their subject ids and
+    numeric values filled in (migrate_grade_columns()).
     """
     try:
         with get_db_connection() as conn:
@@ -37,7 +176,7 @@ def initialize_database():
                     status TEXT DEFAULT 'active' CHECK(status IN ('active', 'graduated', 'dropped_out', 'inactive'))
                 )
             ''')
-            logging.info("Checked/created 'students' table.")
+            logger.info("Checked/created 'students' table.")
 
             # Create student_grades table
             cursor.execute('''
@@ -47,41 +186,73 @@ def initialize_database():
                     year_level INTEGER,
                     subject TEXT,
                     grade TEXT,
+                    subject_id INTEGER REFERENCES subjects(subject_id),
+                    grade_value REAL,
                     FOREIGN KEY (student_id) REFERENCES students(student_id) ON DELETE CASCADE
                 )
             ''')
-            logging.info("Checked/created 'student_grades' table.")
+            logger.info("Checked/created 'student_grades' table.")
+
+            # Secondary indexes for the common read paths. The student_grades index
+            # leads with student_id, so it serves grade lookups and the ON DELETE
+            # CASCADE from students, and it covers (student_id, year_level, subject,
+            # grade) so grade pages are answered from the index alone.
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_student_grades_student
+                ON student_grades (student_id, year_level, subject, grade)
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_status ON students (status)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_full_name ON students (full_name, student_id)")
+            logger.info("Checked/created secondary indexes.")
+
+            # Progress of CSV imports, so an interrupted import can resume after its last committed chunk
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS import_progress (
+                    import_key TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    rows_done INTEGER NOT NULL,
+                    updated_at TEXT
+                )
+            ''')
+
+            _initialize_subjects(cursor)
+            _initialize_name_search(cursor)
+            _initialize_student_stats(cursor)
+            _initialize_rankings(cursor)
+            _initialize_change_log(cursor)
             conn.commit()
-            logging.info("Database initialized successfully.")
+            _record_cache.clear() # The database may have been replaced
+            _clear_subject_cache()
+            _discard_snapshot(current_database())
+            cursor.execute("PRAGMA optimize")
+            logger.info("Database initialized successfully.")
+            db_connection.log_effective_pragmas(conn, current_database())
+        migrate_grade_columns()
     except sqlite3.Error as e:
-        logging.error(f"Database initialization error: {e}")
+        db_retry.raise_if_retryable(e)
+        logger.error("Database initialization error: %s", e)
         raise
 
 # --- CRUD Functions for Students ---
 
-def add_student(student_data: dict) -> str | None:
-    """
-    Adds a new student to the database.
-    student_data is a dictionary containing student information.
-    Expected keys: 'student_id', 'full_name', 'date_of_birth', 'gender',
-                   'address', 'phone_number', 'email', 'enrollment_year',
-                   'graduation_year' (optional), 'status' (optional, defaults to 'active').
-    Returns the student_id of the new student, or None if an error occurs.
-    """
-    required_fields = ['student_id', 'full_name', 'enrollment_year']
-    for field in required_fields:
-        if field not in student_data or student_data[field] is None:
-            logging.error(f"Missing required field: {field} for add_student")
-            return None
+# Partial UPDATE statements, compiled once per set of updated columns (see update_statements.py)
+_STUDENT_UPDATES = update_statements.UpdateStatementFamily(
+    'students', 'student_id',
+    ['full_name', 'date_of_birth', 'gender', 'address', 'phone_number', 'email',
+     'enrollment_year', 'graduation_year', 'status'])
 
-    sql = '''
-        INSERT INTO students (student_id, full_name, date_of_birth, gender, address, 
-                              phone_number, email, enrollment_year, graduation_year, status)
-        VALUES (:student_id, :full_name, :date_of_birth, :gender, :address, 
-                :phone_number, :email, :enrollment_year, :graduation_year, :status)
-    '''
-    # Provide default values for optional fields if not present
-    data_to_insert = {
+_STUDENT_REQUIRED_FIELDS = ['student_id', 'full_name', 'enrollment_year']
+
+_STUDENT_INSERT_SQL = '''
+    INSERT INTO students (student_id, full_name, date_of_birth, gender, address, 
+                          phone_number, email, enrollment_year, graduation_year, status)
+    VALUES (:student_id, :full_name, :date_of_birth, :gender, :address, 
+            :phone_number, :email, :enrollment_year, :graduation_year, :status)
+'''
+
+def _student_insert_params(student_data: dict) -> dict:
+    """Builds the parameters for _STUDENT_INSERT_SQL, providing defaults for optional fields."""
+    return {
         'student_id': student_data.get('student_id'),
         'full_name': student_data.get('full_name'),
         'date_of_birth': student_data.get('date_of_birth'),
@@ -94,239 +265,908 @@ def add_student(student_data: dict) -> str | None:
         'status': student_data.get('status', 'active')
     }
 
+@db_metrics.timed
+@db_retry.retry_on_busy
+def add_student(student_data: dict, tx: Transaction | None = None) -> str | None:
+    """
+    Adds a new student to the database.
+    student_data is a dictionary containing student information.
+    Expected keys: 'student_id', 'full_name', 'date_of_birth', 'gender',
+                   'address', 'phone_number', 'email', 'enrollment_year',
+                   'graduation_year' (optional), 'status' (optional, defaults to 'active').
+    Pass `tx` to run inside a transaction() block.
+    Returns the student_id of the new student, or None if an error occurs.
+    """
+    for field in _STUDENT_REQUIRED_FIELDS:
+        if field not in student_data or student_data[field] is None:
+            logger.error("Missing required field: %s for add_student", field)
+            return None
+
+    sql = _STUDENT_INSERT_SQL
+    data_to_insert = _student_insert_params(student_data)
+
     try:
-        with get_db_connection() as conn:
+        with _connection_for(tx) as conn:
             cursor = conn.cursor()
             cursor.execute(sql, data_to_insert)
-            conn.commit()
-            logging.info(f"Student {data_to_insert['student_id']} added successfully.")
+            _commit(conn)
+            _invalidate_student(conn, data_to_insert['student_id']) # May be cached as "not found"
+            logger.info("Student %s added successfully.", data_to_insert['student_id'])
             return data_to_insert['student_id']
     except sqlite3.IntegrityError as e:
-        logging.error(f"Error adding student {student_data.get('student_id')}: {e}. Likely duplicate student_id.")
+        logger.error("Error adding student %s: %s. Likely duplicate student_id.", student_data.get('student_id'), e)
         return None
     except sqlite3.Error as e:
-        logging.error(f"Database error adding student {student_data.get('student_id')}: {e}")
+        db_retry.raise_if_retryable(e)
+        logger.error("Database error adding student %s: %s", student_data.get('student_id'), e)
         return None
 
 
-def get_all_students() -> list[dict]:
+# Column lists for queries that build Student/Grade records directly (see records.py);
+# the row factories rely on the columns coming back in this order.
+_STUDENT_SELECT = ', '.join(Student._fields)
+_GRADE_SELECT = ', '.join(Grade._fields)
+
+@db_metrics.timed
+def get_all_students() -> list[Student]:
     """
     Retrieves all students from the database.
-    Returns a list of dictionaries, where each dictionary represents a student.
+    Returns a list of Student records, which can be read like dictionaries.
     """
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM students")
-            students = [dict(row) for row in cursor.fetchall()]
-            logging.info(f"Retrieved {len(students)} students.")
+            cursor.row_factory = Student.from_row
+            cursor.execute(f"SELECT {_STUDENT_SELECT} FROM students")
+            students = cursor.fetchall()
+            logger.debug("Retrieved %s students.", len(students))
             return students
     except sqlite3.Error as e:
-        logging.error(f"Database error retrieving all students: {e}")
+        logger.error("Database error retrieving all students: %s", e)
         return []
 
+# --- Paginated Student Listing ---
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Sort orders supported by get_students_page(). Each key ends with student_id so
+# it is unique, and each is served by an index (the primary key and
+# idx_students_full_name respectively).
+PAGE_SORT_KEYS = {
+    'student_id': ('student_id',),
+    'full_name': ('full_name', 'student_id'),
+}
+
+def _encode_page_cursor(row: Student, sort_columns: tuple) -> str:
+    """Encodes the sort key of a row as an opaque, URL-safe cursor string."""
+    key = json.dumps([row[column] for column in sort_columns])
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+def _decode_page_cursor(cursor_value: str, sort_columns: tuple) -> list:
+    """Decodes a cursor produced by _encode_page_cursor. Raises ValueError if it is malformed."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor_value.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Malformed page cursor: {e}")
+    if not isinstance(key, list) or len(key) != len(sort_columns):
+        raise ValueError("Page cursor does not match the sort order.")
+    return key
+
+def _estimate_student_count(conn: sqlite3.Connection) -> int:
+    """
+    Returns an approximate number of students without scanning the table: the row
+    count recorded by ANALYZE when available, otherwise the highest rowid.
+    """
+    try:
+        row = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = 'students' AND stat IS NOT NULL LIMIT 1").fetchone()
+        if row:
+            return int(row['stat'].split()[0])
+    except (sqlite3.OperationalError, ValueError):
+        pass # No statistics yet (ANALYZE has never run)
+    row = conn.execute("SELECT MAX(rowid) FROM students").fetchone()
+    return row[0] or 0
+
+@db_metrics.timed
+def get_students_page(page_size: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+                      before: str | None = None, sort_by: str = 'student_id') -> dict:
+    """
+    Retrieves one page of students using keyset pagination, so each page costs an
+    index seek plus `page_size` rows no matter how deep into the list it is.
+
+    Args:
+        page_size (int): Number of students per page (clamped to 1..MAX_PAGE_SIZE).
+        after (str | None): Cursor of the last row of the previous page; returns the page after it.
+        before (str | None): Cursor of the first row of the next page; returns the page before it.
+        sort_by (str): 'student_id' or 'full_name'.
+
+    Returns:
+        dict: {
+                  'students': [...],           # list of Student records
+                  'next_cursor': str | None,   # pass as `after` for the next page
+                  'prev_cursor': str | None,   # pass as `before` for the previous page
+                  'total_estimate': int,       # approximate number of students
+                  'page_size': int,
+                  'sort_by': str
+              }
+        On a database error the page is empty.
+    """
+    if sort_by not in PAGE_SORT_KEYS:
+        logger.warning("Unsupported sort_by '%s' for student pages. Using 'student_id'.", sort_by)
+        sort_by = 'student_id'
+    sort_columns = PAGE_SORT_KEYS[sort_by]
+    page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+    page = {'students': [], 'next_cursor': None, 'prev_cursor': None,
+            'total_estimate': 0, 'page_size': page_size, 'sort_by': sort_by}
+
+    key_sql = f"({', '.join(sort_columns)})" if len(sort_columns) > 1 else sort_columns[0]
+    placeholders = f"({', '.join('?' for _ in sort_columns)})" if len(sort_columns) > 1 else '?'
+    order_asc = ', '.join(sort_columns)
+    order_desc = ', '.join(f"{column} DESC" for column in sort_columns)
+
+    backwards = False
+    params = []
+    if before:
+        try:
+            params = _decode_page_cursor(before, sort_columns)
+            backwards = True
+        except ValueError as e:
+            logger.warning("Ignoring invalid 'before' cursor: %s", e)
+    elif after:
+        try:
+            params = _decode_page_cursor(after, sort_columns)
+        except ValueError as e:
+            logger.warning("Ignoring invalid 'after' cursor: %s", e)
+
+    if params and backwards:
+        sql = f"SELECT {_STUDENT_SELECT} FROM students WHERE {key_sql} < {placeholders} ORDER BY {order_desc} LIMIT ?"
+    elif params:
+        sql = f"SELECT {_STUDENT_SELECT} FROM students WHERE {key_sql} > {placeholders} ORDER BY {order_asc} LIMIT ?"
+    else:
+        sql = f"SELECT {_STUDENT_SELECT} FROM students ORDER BY {order_asc} LIMIT ?"
+
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = Student.from_row
+            # Fetch one extra row to learn whether another page exists in that direction
+            cursor.execute(sql, (*params, page_size + 1))
+            rows = cursor.fetchall()
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            if backwards:
+                rows.reverse()
+                has_prev, has_next = has_more, True
+            else:
+                has_prev, has_next = bool(params), has_more
+
+            page['students'] = rows
+            if rows and has_next:
+                page['next_cursor'] = _encode_page_cursor(rows[-1], sort_columns)
+            if rows and has_prev:
+                page['prev_cursor'] = _encode_page_cursor(rows[0], sort_columns)
+            page['total_estimate'] = _estimate_student_count(conn)
+            logger.debug("Retrieved page of %s students sorted by %s.", len(rows), sort_by)
+    except sqlite3.Error as e:
+        logger.error("Database error retrieving student page: %s", e)
+    return page
+
+@db_metrics.timed
 def get_student_by_id(student_id: str) -> dict | None:
     """
-    Retrieves a single student by their student_id.
+    Retrieves a single student by their student_id. Results (including "not found")
+    are served from the record cache when possible.
     Returns a dictionary representing the student, or None if not found or error.
     """
     try:
         with get_db_connection() as conn:
+            hit, student = _cache_lookup(conn, ('student', student_id))
+            if hit:
+                return student
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM students WHERE student_id = ?", (student_id,))
             student = cursor.fetchone()
+            student = dict(student) if student else None
+            _cache_store(conn, ('student', student_id), student)
             if student:
-                logging.info(f"Student {student_id} retrieved successfully.")
-                return dict(student)
+                logger.debug("Student %s retrieved successfully.", student_id)
             else:
-                logging.info(f"Student {student_id} not found.")
-                return None
+                logger.debug("Student %s not found.", student_id)
+            return student
     except sqlite3.Error as e:
-        logging.error(f"Database error retrieving student {student_id}: {e}")
+        logger.error("Database error retrieving student %s: %s", student_id, e)
         return None
 
-def update_student(student_id: str, student_data: dict) -> bool:
+@db_metrics.timed
+@db_retry.retry_on_busy
+def update_student(student_id: str, student_data: dict, tx: Transaction | None = None) -> bool:
     """
     Updates an existing student's information.
     student_data is a dictionary containing the fields to update.
+    Pass `tx` to run inside a transaction() block.
     Returns True if update was successful, False otherwise.
     """
     if not student_data:
-        logging.warning(f"No data provided for updating student {student_id}.")
+        logger.warning("No data provided for updating student %s.", student_id)
         return False
 
-    fields = []
-    values = []
-    for key, value in student_data.items():
-        # Ensure only valid columns are updated
-        if key in ['full_name', 'date_of_birth', 'gender', 'address', 
-                   'phone_number', 'email', 'enrollment_year', 'graduation_year', 'status']:
-            fields.append(f"{key} = ?")
-            values.append(value)
-
-    if not fields:
-        logging.warning(f"No valid fields provided for updating student {student_id}.")
+    # Only valid columns are updated; one prepared statement per combination of them
+    statement = _STUDENT_UPDATES.build(student_id, student_data)
+    if statement is None:
+        logger.warning("No valid fields provided for updating student %s.", student_id)
         return False
-
-    sql = f"UPDATE students SET {', '.join(fields)} WHERE student_id = ?"
-    values.append(student_id)
+    sql, params = statement
 
     try:
-        with get_db_connection() as conn:
+        with _connection_for(tx) as conn:
             cursor = conn.cursor()
-            cursor.execute(sql, tuple(values))
-            conn.commit()
+            cursor.execute(sql, params)
+            _commit(conn)
+            _invalidate_student(conn, student_id)
             if cursor.rowcount > 0:
-                logging.info(f"Student {student_id} updated successfully.")
+                logger.info("Student %s updated successfully.", student_id)
                 return True
             else:
-                logging.warning(f"Student {student_id} not found or no data changed for update.")
+                logger.warning("Student %s not found or no data changed for update.", student_id)
                 return False # No rows affected, student_id might not exist or data is the same
     except sqlite3.Error as e:
-        logging.error(f"Database error updating student {student_id}: {e}")
+        db_retry.raise_if_retryable(e)
+        logger.error("Database error updating student %s: %s", student_id, e)
         return False
 
-def delete_student(student_id: str) -> bool:
+@db_metrics.timed
+@db_retry.retry_on_busy
+def delete_student(student_id: str, tx: Transaction | None = None) -> bool:
     """
     Deletes a student from the database.
+    Pass `tx` to run inside a transaction() block.
     Returns True if deletion was successful, False otherwise.
     """
     try:
-        with get_db_connection() as conn:
+        with _connection_for(tx) as conn:
             cursor = conn.cursor()
             # The ON DELETE CASCADE for student_grades table will handle associated grades
             cursor.execute("DELETE FROM students WHERE student_id = ?", (student_id,))
-            conn.commit()
+            _commit(conn)
+            _invalidate_student(conn, student_id)
             if cursor.rowcount > 0:
-                logging.info(f"Student {student_id} and their grades deleted successfully.")
+                logger.info("Student %s and their grades deleted successfully.", student_id)
                 return True
             else:
-                logging.warning(f"Student {student_id} not found for deletion.")
+                logger.warning("Student %s not found for deletion.", student_id)
                 return False # No rows affected
     except sqlite3.Error as e:
-        logging.error(f"Database error deleting student {student_id}: {e}")
+        db_retry.raise_if_retryable(e)
+        logger.error("Database error deleting student %s: %s", student_id, e)
         return False
 
 # --- CRUD Functions for Student Grades ---
 
-def add_student_grade(grade_data: dict) -> int | None:
+# RETURNING names the owning student, so their cached grades can be dropped without another query
+_GRADE_UPDATES = update_statements.UpdateStatementFamily(
+    'student_grades', 'grade_id', ['year_level', 'subject', 'grade', 'subject_id', 'grade_value'],
+    returning='student_id')
+
+def get_statement_cache_stats() -> dict:
+    """
+    Returns the hit/miss counters of the compiled UPDATE statements per table,
+    e.g. {'students': {'hits': 120, 'misses': 3, 'hit_rate': 0.9756, ...}, 'student_grades': {...}}.
+    """
+    return {family.table: family.stats() for family in (_STUDENT_UPDATES, _GRADE_UPDATES)}
+
+_GRADE_REQUIRED_FIELDS = ['student_id', 'year_level', 'subject', 'grade']
+
+_GRADE_INSERT_SQL = '''
+    INSERT INTO student_grades (student_id, year_level, subject, grade, subject_id, grade_value)
+    VALUES (:student_id, :year_level, :subject, :grade, :subject_id, :grade_value)
+'''
+
+@db_metrics.timed
+@db_retry.retry_on_busy
+def add_student_grade(grade_data: dict, tx: Transaction | None = None) -> int | None:
     """
     Adds a new grade for a student.
     grade_data is a dictionary, must include 'student_id', 'year_level', 'subject', 'grade'.
+    Pass `tx` to run inside a transaction() block; the student's existence is then
+    checked by the foreign key alone instead of a separate lookup.
     Returns the grade_id of the new grade, or None if an error occurs.
     """
-    required_fields = ['student_id', 'year_level', 'subject', 'grade']
-    for field in required_fields:
+    for field in _GRADE_REQUIRED_FIELDS:
         if field not in grade_data or grade_data[field] is None:
-            logging.error(f"Missing required field: {field} for add_student_grade")
+            logger.error("Missing required field: %s for add_student_grade", field)
             return None
             
-    # Check if student_id exists
-    if not get_student_by_id(grade_data['student_id']):
-        logging.error(f"Cannot add grade. Student with ID {grade_data['student_id']} does not exist.")
+    # Check if student_id exists (inside a transaction the foreign key is enough)
+    if tx is None and not get_student_by_id(grade_data['student_id']):
+        logger.error("Cannot add grade. Student with ID %s does not exist.", grade_data['student_id'])
         return None
 
-    sql = '''
-        INSERT INTO student_grades (student_id, year_level, subject, grade)
-        VALUES (:student_id, :year_level, :subject, :grade)
-    '''
+    sql = _GRADE_INSERT_SQL
     try:
-        with get_db_connection() as conn:
+        with _connection_for(tx) as conn:
             cursor = conn.cursor()
-            cursor.execute(sql, grade_data)
-            conn.commit()
-            logging.info(f"Grade added successfully for student {grade_data['student_id']}. New grade_id: {cursor.lastrowid}")
+            cursor.execute(sql, _with_grade_columns(conn, _grade_insert_params(grade_data)))
+            _commit(conn)
+            _invalidate_student(conn, grade_data['student_id'])
+            logger.info("Grade added successfully for student %s. New grade_id: %s",
+                        grade_data['student_id'], cursor.lastrowid)
             return cursor.lastrowid
     except sqlite3.IntegrityError as e: # Handles foreign key constraint failure if student_id doesn't exist
-        logging.error(f"Error adding grade for student {grade_data.get('student_id')}: {e}. Check if student ID exists.")
+        logger.error("Error adding grade for student %s: %s. Check if student ID exists.", grade_data.get('student_id'), e)
         return None
     except sqlite3.Error as e:
-        logging.error(f"Database error adding grade for student {grade_data.get('student_id')}: {e}")
+        db_retry.raise_if_retryable(e)
+        logger.error("Database error adding grade for student %s: %s", grade_data.get('student_id'), e)
         return None
 
 
-def get_grades_for_student(student_id: str) -> list[dict]:
+@db_metrics.timed
+def get_grades_for_student(student_id: str) -> list[Grade]:
     """
-    Retrieves all grades for a specific student.
-    Returns a list of dictionaries, each representing a grade.
+    Retrieves all grades for a specific student, from the record cache when possible.
+    Returns a list of Grade records, which can be read like dictionaries.
     """
     try:
         with get_db_connection() as conn:
+            hit, grades = _cache_lookup(conn, ('grades', student_id))
+            if hit:
+                return grades
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM student_grades WHERE student_id = ?", (student_id,))
-            grades = [dict(row) for row in cursor.fetchall()]
-            logging.info(f"Retrieved {len(grades)} grades for student {student_id}.")
+            cursor.row_factory = Grade.from_row
+            cursor.execute(f"SELECT {_GRADE_SELECT} FROM student_grades WHERE student_id = ?", (student_id,))
+            grades = cursor.fetchall()
+            _cache_store(conn, ('grades', student_id), grades)
+            logger.debug("Retrieved %s grades for student %s.", len(grades), student_id)
             return grades
     except sqlite3.Error as e:
-        logging.error(f"Database error retrieving grades for student {student_id}: {e}")
+        logger.error("Database error retrieving grades for student %s: %s", student_id, e)
         return []
 
-def update_student_grade(grade_id: int, grade_data: dict) -> bool:
+@db_metrics.timed
+@db_retry.retry_on_busy
+def update_student_grade(grade_id: int, grade_data: dict, tx: Transaction | None = None) -> bool:
     """
     Updates an existing grade.
     grade_data is a dictionary containing fields to update (e.g., 'year_level', 'subject', 'grade').
     'student_id' in grade_data will be ignored if present, as grade_id is the primary key.
+    Pass `tx` to run inside a transaction() block.
     Returns True if update was successful, False otherwise.
     """
     if not grade_data:
-        logging.warning(f"No data provided for updating grade {grade_id}.")
+        logger.warning("No data provided for updating grade %s.", grade_id)
         return False
 
-    fields = []
-    values = []
     # student_id should not be updated via this function, only grade details
-    for key, value in grade_data.items():
-        if key in ['year_level', 'subject', 'grade']:
-            fields.append(f"{key} = ?")
-            values.append(value)
-
-    if not fields:
-        logging.warning(f"No valid fields for updating grade {grade_id}.")
+    if _GRADE_UPDATES.mask(grade_data) == 0:
+        logger.warning("No valid fields for updating grade %s.", grade_id)
         return False
 
-    sql = f"UPDATE student_grades SET {', '.join(fields)} WHERE grade_id = ?"
-    values.append(grade_id)
-
     try:
-        with get_db_connection() as conn:
+        with _connection_for(tx) as conn:
+            # A new subject is added before the UPDATE; do not add one for a grade that does not exist
+            if 'subject' in grade_data and conn.execute(
+                    "SELECT 1 FROM student_grades WHERE grade_id = ?", (grade_id,)).fetchone() is None:
+                logger.warning("Grade %s not found for update.", grade_id)
+                return False
+            sql, params = _GRADE_UPDATES.build(grade_id, _with_grade_columns(conn, grade_data))
             cursor = conn.cursor()
-            cursor.execute(sql, tuple(values))
-            conn.commit()
-            if cursor.rowcount > 0:
-                logging.info(f"Grade {grade_id} updated successfully.")
+            updated = cursor.execute(sql, params).fetchall()
+            _commit(conn)
+            _invalidate_student(conn, *(row['student_id'] for row in updated))
+            if updated:
+                logger.info("Grade %s updated successfully.", grade_id)
                 return True
             else:
-                logging.warning(f"Grade {grade_id} not found or no data changed for update.")
+                logger.warning("Grade %s not found or no data changed for update.", grade_id)
                 return False # No rows affected
     except sqlite3.Error as e:
-        logging.error(f"Database error updating grade {grade_id}: {e}")
+        db_retry.raise_if_retryable(e)
+        logger.error("Database error updating grade %s: %s", grade_id, e)
         return False
 
-def delete_student_grade(grade_id: int) -> bool:
+@db_metrics.timed
+@db_retry.retry_on_busy
+def delete_student_grade(grade_id: int, tx: Transaction | None = None) -> bool:
     """
     Deletes a specific grade by its grade_id.
+    Pass `tx` to run inside a transaction() block.
     Returns True if deletion was successful, False otherwise.
     """
     try:
-        with get_db_connection() as conn:
+        with _connection_for(tx) as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM student_grades WHERE grade_id = ?", (grade_id,))
-            conn.commit()
-            if cursor.rowcount > 0:
-                logging.info(f"Grade {grade_id} deleted successfully.")
+            deleted = cursor.execute(
+                "DELETE FROM student_grades WHERE grade_id = ? RETURNING student_id", (grade_id,)).fetchall()
+            _commit(conn)
+            _invalidate_student(conn, *(row['student_id'] for row in deleted))
+            if deleted:
+                logger.info("Grade %s deleted successfully.", grade_id)
                 return True
             else:
-                logging.warning(f"Grade {grade_id} not found for deletion.")
+                logger.warning("Grade %s not found for deletion.", grade_id)
                 return False # No rows affected
     except sqlite3.Error as e:
-        logging.error(f"Database error deleting grade {grade_id}: {e}")
+        db_retry.raise_if_retryable(e)
+        logger.error("Database error deleting grade %s: %s", grade_id, e)
         return False
 
+# --- Subjects and Numeric Grades ---
+
+# Each distinct subject name is stored once in 'subjects'; grades refer to it by
+# 'subject_id', next to the original 'subject' text. 'grade_value' holds the grade
+# as a number when it is written as one ('85', '92.5'); letter grades leave it NULL
+# (their points are in 'grade_points'). Aggregates group and average on these two
+# columns through idx_student_grades_subject instead of comparing text.
+GRADE_MIGRATION_BATCH_SIZE = int(os.environ.get('GRADE_MIGRATION_BATCH_SIZE', 5000))
+
+_NUMERIC_GRADE = re.compile(r"\d+(?:\.\d*)?")
+
+# (database, subject name) -> subject_id, for committed subjects only
+_subject_ids: dict[tuple[str, str], int] = {}
+_subject_ids_lock = threading.Lock()
+
+def parse_grade_value(grade) -> float | None:
+    """Returns the grade as a number if it is written as one ('85', ' 92.5 '), else None ('B+', 'Incomplete')."""
+    if isinstance(grade, (int, float)) and not isinstance(grade, bool):
+        return float(grade)
+    if not isinstance(grade, str):
+        return None
+    text = grade.strip()
+    return float(text) if _NUMERIC_GRADE.fullmatch(text) else None
+
+def _initialize_subjects(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the 'subjects' table and adds 'subject_id' and 'grade_value' to
+    'student_grades' files created before they existed. Existing rows are filled
+    in by migrate_grade_columns().
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subjects (
+            subject_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(student_grades)").fetchall()}
+    if 'subject_id' not in columns:
+        cursor.execute("ALTER TABLE student_grades ADD COLUMN subject_id INTEGER REFERENCES subjects(subject_id)")
+    if 'grade_value' not in columns:
+        cursor.execute("ALTER TABLE student_grades ADD COLUMN grade_value REAL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_student_grades_subject ON student_grades (subject_id, grade_value)")
+    logger.info("Checked/created 'subjects' table and numeric grade columns.")
+
+def _intern_subject(conn: sqlite3.Connection, name) -> int | None:
+    """
+    Returns the subject_id of `name`, adding the subject if it is new. Known
+    subjects come from _subject_ids without a query. A subject added here is only
+    cached by _publish_subjects() after its write has committed, because the
+    write may still be rolled back.
+    """
+    if name is None:
+        return None
+    key = (current_database(), name)
+    subject_id = _subject_ids.get(key)
+    if subject_id is not None:
+        return subject_id
+    created = getattr(conn, 'new_subjects', None)
+    if created is None:
+        created = conn.new_subjects = set()
+    row = conn.execute("SELECT subject_id FROM subjects WHERE name = ?", (name,)).fetchone()
+    if row is not None:
+        if name not in created:  # Otherwise it is this connection's own uncommitted row
+            with _subject_ids_lock:
+                _subject_ids[key] = row[0]
+        return row[0]
+    created.add(name)
+    return conn.execute("INSERT INTO subjects (name) VALUES (?) RETURNING subject_id", (name,)).fetchone()[0]
+
+def _publish_subjects(conn: sqlite3.Connection) -> None:
+    """
+    Caches the subjects this connection added, once its transaction has committed.
+    They are read back first, as the write that added them may have been rolled back.
+    """
+    created = getattr(conn, 'new_subjects', None)
+    if not created:
+        return
+    conn.new_subjects = set()
+    names = list(created)
+    rows = conn.execute(f"SELECT subject_id, name FROM subjects WHERE name IN ({', '.join('?' * len(names))})",
+                        names).fetchall()
+    database = current_database()
+    with _subject_ids_lock:
+        for subject_id, name in rows:
+            _subject_ids[(database, name)] = subject_id
+
+def _clear_subject_cache() -> None:
+    database = current_database()
+    with _subject_ids_lock:
+        for key in [key for key in _subject_ids if key[0] == database]:
+            del _subject_ids[key]
+
+def _with_grade_columns(conn: sqlite3.Connection, data: dict) -> dict:
+    """Adds 'subject_id' and 'grade_value' for the 'subject' and 'grade' present in `data`."""
+    data = dict(data)
+    if 'subject' in data:
+        data['subject_id'] = _intern_subject(conn, data['subject'])
+    if 'grade' in data:
+        data['grade_value'] = parse_grade_value(data['grade'])
+    return data
+
+@db_metrics.timed
+def migrate_grade_columns(batch_size: int | None = None) -> dict | None:
+    """
+    Fills 'subject_id' and 'grade_value' for grades stored before those columns
+    existed, `batch_size` rows per short transaction. Safe to interrupt and re-run;
+    initialize_database() runs it, so it only has work to do once per file.
+
+    Returns:
+        dict | None: {'migrated': int, 'batches': int}, or None if an error occurs.
+    """
+    size = max(1, batch_size or GRADE_MIGRATION_BATCH_SIZE)
+    report = {'migrated': 0, 'batches': 0}
+    last_id = 0
+    try:
+        while True:
+            with transaction() as tx:
+                rows = tx.conn.execute('''
+                    SELECT grade_id, subject, grade FROM student_grades
+                    WHERE subject_id IS NULL AND subject IS NOT NULL AND grade_id > ?
+                    ORDER BY grade_id LIMIT ?
+                ''', (last_id, size)).fetchall()
+                if not rows:
+                    break
+                tx.conn.executemany(
+                    "UPDATE student_grades SET subject_id = ?, grade_value = ? WHERE grade_id = ?",
+                    [(_intern_subject(tx.conn, row['subject']), parse_grade_value(row['grade']), row['grade_id'])
+                     for row in rows])
+            last_id = rows[-1]['grade_id']
+            report['migrated'] += len(rows)
+            report['batches'] += 1
+    except sqlite3.Error as e:
+        logger.error("Grade column migration stopped after %s rows: %s", report['migrated'], e)
+        return None
+    if report['migrated']:
+        logger.info("Filled subject ids and numeric grades for %s grades in %s batches.",
+                    report['migrated'], report['batches'])
+    return report
+
+@db_metrics.timed
+def get_subject_statistics() -> list[dict] | None:
+    """
+    Returns per-subject grade statistics, ordered by subject name:
+    [{'subject_id', 'subject', 'grades', 'numeric_grades', 'average', 'lowest', 'highest'}, ...].
+    'average', 'lowest' and 'highest' cover numeric grades only (None if a subject has none).
+    Returns None if an error occurs.
+    """
+    try:
+        with get_db_connection() as conn:
+            rows = conn.execute('''
+                SELECT g.subject_id, s.name AS subject, g.grades, g.numeric_grades,
+                       round(g.average, 2) AS average, g.lowest, g.highest
+                FROM (SELECT subject_id, COUNT(*) AS grades, COUNT(grade_value) AS numeric_grades,
+                             AVG(grade_value) AS average, MIN(grade_value) AS lowest, MAX(grade_value) AS highest
+                      FROM student_grades WHERE subject_id IS NOT NULL GROUP BY subject_id) AS g
+                JOIN subjects s ON s.subject_id = g.subject_id
+                ORDER BY s.name
+            ''').fetchall()
+            return [dict(row) for row in rows]
+    except sqlite3.Error as e:
+        logger.error("Database error computing subject statistics: %s", e)
+        return None
+
+# --- Bulk Ingestion ---
+
+BULK_CHUNK_SIZE = 1000
+
+def _grade_insert_params(grade_data: dict) -> dict:
+    """Builds the parameters for _GRADE_INSERT_SQL."""
+    return {field: grade_data.get(field) for field in _GRADE_REQUIRED_FIELDS}
+
+# kind -> (insert SQL, required fields, parameter builder, integer columns in CSV files)
+_BULK_KINDS = {
+    'students': (_STUDENT_INSERT_SQL, _STUDENT_REQUIRED_FIELDS, _student_insert_params,
+                 ('enrollment_year', 'graduation_year')),
+    'grades': (_GRADE_INSERT_SQL, _GRADE_REQUIRED_FIELDS, _grade_insert_params,
+               ('year_level',)),
+}
+
+@db_retry.retry_on_busy
+def _insert_chunk(conn: sqlite3.Connection, kind: str, chunk: list, errors: list,
+                  progress: tuple | None = None) -> int:
+    """
+    Inserts a chunk of (row_number, params) pairs in one transaction and returns
+    the number of rows inserted.
+
+    The chunk goes through a single executemany(). If a row violates a constraint
+    (duplicate student_id, grade for an unknown student), the chunk is rolled back
+    and replayed row by row so only the offending rows are reported in `errors`.
+    `progress` is an (import_key, fingerprint, rows_done) tuple saved in the same
+    transaction, so a committed chunk is never imported twice. A chunk rolled back
+    on lock contention is retried as a whole.
+    """
+    sql = _BULK_KINDS[kind][0]
+    # Grades get their subject ids inside the transaction, so new subjects commit with them
+    prepare = (lambda params: _with_grade_columns(conn, params)) if kind == 'grades' else (lambda params: params)
+    chunk_errors = [] # Only reported once the chunk is committed
+    conn.execute("BEGIN")
+    try:
+        try:
+            conn.executemany(sql, [prepare(params) for _, params in chunk])
+            inserted = len(chunk)
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            conn.execute("BEGIN")
+            inserted = 0
+            for row_number, params in chunk:
+                try:
+                    conn.execute(sql, prepare(params))
+                    inserted += 1
+                except sqlite3.IntegrityError as e:
+                    chunk_errors.append({'row': row_number, 'student_id': params.get('student_id'), 'error': str(e)})
+        if progress:
+            conn.execute('''
+                INSERT INTO import_progress (import_key, fingerprint, rows_done, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (import_key) DO UPDATE SET
+                    fingerprint = excluded.fingerprint,
+                    rows_done = excluded.rows_done,
+                    updated_at = excluded.updated_at
+            ''', progress)
+        conn.commit()
+        _publish_subjects(conn)
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    errors.extend(chunk_errors)
+    return inserted
+
+def _bulk_insert(kind: str, records, chunk_size: int = BULK_CHUNK_SIZE, convert=None,
+                 start_row: int = 0, progress_key: tuple | None = None) -> dict:
+    """
+    Shared driver for add_students_bulk, add_student_grades_bulk and import_csv.
+    Validates each record, groups them into chunks of `chunk_size` and inserts each
+    chunk with _insert_chunk. Row numbers in the report are 1-based and continue
+    from `start_row`.
+    """
+    _, required_fields, build_params, _ = _BULK_KINDS[kind]
+    chunk_size = max(1, int(chunk_size))
+    report = {'inserted': 0, 'errors': [], 'chunks': 0, 'rows': start_row}
+    chunk = []
+    row_number = start_row
+
+    def flush():
+        progress = (*progress_key, row_number) if progress_key else None
+        report['inserted'] += _insert_chunk(conn, kind, chunk, report['errors'], progress)
+        report['chunks'] += 1
+        _invalidate_student(conn, *{params['student_id'] for _, params in chunk})
+        chunk.clear()
+
+    try:
+        conn = get_db_connection()
+        for record in records:
+            row_number += 1
+            try:
+                if convert:
+                    record = convert(record)
+                missing = [field for field in required_fields if record.get(field) is None]
+                if missing:
+                    raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+            except ValueError as e:
+                report['errors'].append({'row': row_number, 'student_id': record.get('student_id'), 'error': str(e)})
+                continue
+            chunk.append((row_number, build_params(record)))
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk or (progress_key and row_number > start_row):
+            flush()
+    except sqlite3.Error as e:
+        logger.error("Database error during bulk %s insert at row %s: %s", kind, row_number, e)
+        report['failed'] = str(e)
+    report['rows'] = row_number
+    report['errors'].sort(key=lambda error: error['row']) # Constraint errors are found after validation errors
+    logger.info("Bulk %s insert: %s inserted, %s rejected in %s chunks.",
+                kind, report['inserted'], len(report['errors']), report['chunks'])
+    return report
+
+@db_metrics.timed
+def add_students_bulk(students, chunk_size: int = BULK_CHUNK_SIZE) -> dict:
+    """
+    Adds many students using executemany() inside chunked transactions, so a chunk
+    of `chunk_size` rows costs one commit instead of one per student.
+
+    Args:
+        students (Iterable[dict]): Student dictionaries with the same keys as add_student().
+        chunk_size (int): Number of rows committed per transaction.
+
+    Returns:
+        dict: {'inserted': int, 'errors': [{'row', 'student_id', 'error'}, ...], 'chunks': int, 'rows': int}
+              plus 'failed' (error message) if a database error stopped the insert.
+    """
+    return _bulk_insert('students', students, chunk_size)
+
+@db_metrics.timed
+def add_student_grades_bulk(grades, chunk_size: int = BULK_CHUNK_SIZE) -> dict:
+    """
+    Adds many grades using executemany() inside chunked transactions. Unlike
+    add_student_grade() there is no per-row student lookup; grades for unknown
+    students are rejected by the foreign key and reported per row.
+
+    Args:
+        grades (Iterable[dict]): Grade dictionaries with 'student_id', 'year_level', 'subject', 'grade'.
+        chunk_size (int): Number of rows committed per transaction.
+
+    Returns:
+        dict: Same structure as add_students_bulk().
+    """
+    return _bulk_insert('grades', grades, chunk_size)
+
+def _csv_record_converter(kind: str):
+    """Returns a function that turns a csv.DictReader row into a record for `kind`."""
+    int_fields = _BULK_KINDS[kind][3]
+
+    def convert(raw: dict) -> dict:
+        # Empty cells are left out so optional fields get their defaults
+        record = {key.strip(): value.strip() for key, value in raw.items()
+                  if key and isinstance(value, str) and value.strip()}
+        for field in int_fields:
+            if field in record:
+                try:
+                    record[field] = int(record[field])
+                except ValueError:
+                    raise ValueError(f"{field} must be a number, got '{record[field]}'")
+        return record
+    return convert
+
+@db_metrics.timed
+def import_csv(csv_path: str, kind: str = 'students', chunk_size: int = BULK_CHUNK_SIZE,
+               resume: bool = True) -> dict:
+    """
+    Streams a CSV file (with a header row) into the database in chunked transactions.
+
+    Progress is saved with every committed chunk. When the same file is imported
+    again with `resume=True`, the rows of chunks that were already committed are
+    skipped. If the file changed since the saved progress (size or modification
+    time differ), the import starts from the first row.
+
+    Args:
+        csv_path (str): Path to the CSV file. Column names match the add_student()/add_student_grade() keys.
+        kind (str): 'students' or 'grades'.
+        chunk_size (int): Number of rows committed per transaction.
+        resume (bool): Continue after the last committed chunk of a previous run.
+
+    Returns:
+        dict: Same structure as add_students_bulk(), plus 'skipped' (rows skipped because they
+              were committed by an earlier run). Error 'row' numbers count data rows, so the CSV
+              line number is row + 1.
+    """
+    if kind not in _BULK_KINDS:
+        raise ValueError(f"Unsupported import kind '{kind}'. Choose 'students' or 'grades'.")
+
+    abs_path = os.path.abspath(csv_path)
+    file_stat = os.stat(abs_path)
+    fingerprint = f"{file_stat.st_size}:{file_stat.st_mtime_ns}"
+    import_key = f"{kind}:{abs_path}"
+
+    start_row = 0
+    if resume:
+        try:
+            saved = get_db_connection().execute(
+                "SELECT fingerprint, rows_done FROM import_progress WHERE import_key = ?", (import_key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Database error reading import progress for %s: %s", abs_path, e)
+            saved = None
+        if saved and saved['fingerprint'] == fingerprint:
+            start_row = saved['rows_done']
+            logger.info("Resuming import of %s after row %s.", abs_path, start_row)
+        elif saved:
+            logger.warning("%s changed since the last import. Starting from the first row.", abs_path)
+
+    with open(abs_path, newline='', encoding='utf-8-sig') as csv_file:
+        rows = itertools.islice(csv.DictReader(csv_file), start_row, None)
+        report = _bulk_insert(kind, rows, chunk_size, convert=_csv_record_converter(kind),
+                              start_row=start_row, progress_key=(import_key, fingerprint))
+    report['skipped'] = start_row
+    return report
+
 # --- Graduated Student Record Access ---
 
+# The public graduate lookup reads from a read-only snapshot of each database
+# (see snapshot.py) instead of the live file, so lookup traffic never contends
+# with teachers' writes. Set SNAPSHOT_REFRESH_SECONDS=0 to read the live file.
+_snapshots: dict[str, snapshot.Snapshot] = {}
+_snapshots_lock = threading.Lock()
+
+def _get_snapshot() -> snapshot.Snapshot | None:
+    """Returns the snapshot of the current database, or None if snapshots are disabled or not possible."""
+    database = current_database()
+    if snapshot.SNAPSHOT_REFRESH_SECONDS <= 0 or database == ':memory:' or database.startswith('file:'):
+        return None
+    with _snapshots_lock:
+        replica = _snapshots.get(database)
+        if replica is None:
+            replica = snapshot.Snapshot(database, refresh_interval=snapshot.SNAPSHOT_REFRESH_SECONDS,
+                                        directory=snapshot.SNAPSHOT_DIR)
+            _snapshots[database] = replica
+        return replica
+
+def get_snapshot_status() -> dict | None:
+    """
+    Reports how fresh the data served by get_graduated_student_record() is.
+
+    Returns:
+        dict | None: Snapshot.status() for the current database
+                     ({'taken_at', 'age_seconds', 'refresh_interval', 'stale', ...}),
+                     or None if lookups read the live database.
+    """
+    replica = _get_snapshot()
+    return replica.status() if replica is not None else None
+
+def refresh_snapshot() -> dict | None:
+    """
+    Takes a new snapshot of the current database now, instead of waiting for
+    the refresh interval (e.g. right after publishing graduation results).
+
+    Returns:
+        dict | None: The new snapshot status, or None if snapshots are disabled or the copy failed.
+    """
+    replica = _get_snapshot()
+    if replica is None:
+        return None
+    try:
+        replica.refresh()
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Failed to refresh the snapshot of %s: %s", replica.database, e)
+        return None
+    return replica.status()
+
+def _discard_snapshot(database: str) -> None:
+    with _snapshots_lock:
+        replica = _snapshots.pop(database, None)
+    if replica is not None:
+        replica.close()
+
+def close_snapshots() -> None:
+    """Deletes all snapshot files of this process (e.g. at shutdown or between tests)."""
+    with _snapshots_lock:
+        replicas = list(_snapshots.values())
+        _snapshots.clear()
+    for replica in replicas:
+        replica.close()
+
+def _fetch_graduated_student_record(conn: sqlite3.Connection, student_id: str) -> dict | None:
+    cursor = conn.cursor()
+
+    # First, fetch the student details and check if they are graduated
+    cursor.execute("SELECT * FROM students WHERE student_id = ? AND status = 'graduated'", (student_id,))
+    student_details_row = cursor.fetchone()
+
+    if not student_details_row:
+        logger.debug("No graduated student found with ID %s, or student is not marked as 'graduated'.", student_id)
+        return None
+
+    student_details = dict(student_details_row)
+    logger.debug("Found graduated student: %s (%s)", student_details['full_name'], student_id)
+
+    # Next, fetch all associated grades for this student
+    cursor.execute("SELECT subject, grade, year_level FROM student_grades WHERE student_id = ?", (student_id,))
+    grades_rows = cursor.fetchall()
+
+    student_grades = [dict(row) for row in grades_rows]
+    logger.debug("Retrieved %s grades for graduated student %s.", len(student_grades), student_id)
+
+    return {
+        'details': student_details,
+        'grades': student_grades
+    }
+
+@db_metrics.timed
 def get_graduated_student_record(student_id: str) -> dict | None:
     """
     Retrieves the record of a graduated student, including their details and grades.
+    The record is read from the read-only snapshot of the database, so it can be
+    up to SNAPSHOT_REFRESH_SECONDS old (see get_snapshot_status()). When snapshots
+    are disabled it is read from the live database and the record cache.
+    Graduates moved out by archive_students() are then looked up in the archive.
 
     Args:
         student_id (str): The ID of the student to retrieve.
@@ -342,106 +1182,1210 @@ def get_graduated_student_record(student_id: str) -> dict | None:
                      Returns None if the student is not found, not graduated, or an error occurs.
     """
     try:
+        replica = _get_snapshot()
+        if replica is not None:
+            record = _fetch_graduated_student_record(replica.connection(), student_id)
+            return record if record is not None else _fetch_archived_graduate(student_id)
+
         with get_db_connection() as conn:
-            cursor = conn.cursor()
+            hit, record = _cache_lookup(conn, ('graduated', student_id))
+            if hit:
+                return record
+            record = _fetch_graduated_student_record(conn, student_id)
+            if record is None:
+                record = _fetch_archived_graduate(student_id)
+            _cache_store(conn, ('graduated', student_id), record)
+            return record
 
-            # First, fetch the student details and check if they are graduated
-            cursor.execute("SELECT * FROM students WHERE student_id = ? AND status = 'graduated'", (student_id,))
-            student_details_row = cursor.fetchone()
+    except sqlite3.Error as e:
+        logger.error("Database error retrieving graduated student record for %s: %s", student_id, e)
+        return None
+    except Exception as e:
+        logger.error("An unexpected error occurred while retrieving graduated student record for %s: %s", student_id, e)
+        return None
 
-            if not student_details_row:
-                logging.info(f"No graduated student found with ID {student_id}, or student is not marked as 'graduated'.")
-                return None
+# --- Archive of Former Students ---
 
-            student_details = dict(student_details_row)
-            logging.info(f"Found graduated student: {student_details['full_name']} ({student_id})")
+# Graduated and dropped-out students are moved to a compressed archive database
+# after ARCHIVE_AFTER_YEARS (see archive.py); graduate lookups fall back to it.
+_archives: dict[str, archive.Archive] = {}
+_archives_lock = threading.Lock()
 
-            # Next, fetch all associated grades for this student
-            cursor.execute("SELECT subject, grade, year_level FROM student_grades WHERE student_id = ?", (student_id,))
-            grades_rows = cursor.fetchall()
-            
-            student_grades = [dict(row) for row in grades_rows]
-            logging.info(f"Retrieved {len(student_grades)} grades for graduated student {student_id}.")
+def _get_archive() -> archive.Archive | None:
+    """Returns the archive of the current database, or None for in-memory databases."""
+    database = current_database()
+    if database == ':memory:' or database.startswith('file:'):
+        return None
+    with _archives_lock:
+        store = _archives.get(database)
+        if store is None:
+            store = _archives[database] = archive.Archive(archive.archive_path(database))
+        return store
+
+def _fetch_archived_graduate(student_id: str) -> dict | None:
+    """Returns an archived graduate in the shape of _fetch_graduated_student_record(), or None."""
+    store = _get_archive()
+    record = store.get(student_id) if store is not None else None
+    if record is None or record['details']['status'] != 'graduated':
+        return None
+    logger.debug("Found graduated student %s in the archive.", student_id)
+    return {
+        'details': record['details'],
+        'grades': [{'subject': g['subject'], 'grade': g['grade'], 'year_level': g['year_level']}
+                   for g in record['grades']],
+    }
 
-            return {
-                'details': student_details,
-                'grades': student_grades
-            }
+def _fetch_archivable(conn: sqlite3.Connection, student_ids: list[str], cutoff_year: int) -> dict:
+    """Returns {student_id: {'details', 'grades'}} for those of `student_ids` that are still due for archiving."""
+    placeholders = ', '.join('?' * len(student_ids))
+    statuses = ', '.join('?' * len(archive.ARCHIVED_STATUSES))
+    rows = conn.execute(f"""
+        SELECT * FROM students
+        WHERE student_id IN ({placeholders}) AND status IN ({statuses})
+          AND COALESCE(graduation_year, enrollment_year) <= ?
+    """, (*student_ids, *archive.ARCHIVED_STATUSES, cutoff_year)).fetchall()
+    records = {row['student_id']: {'details': dict(row), 'grades': []} for row in rows}
+    if records:
+        grades = conn.execute(f"""
+            SELECT * FROM student_grades WHERE student_id IN ({', '.join('?' * len(records))})
+            ORDER BY grade_id
+        """, tuple(records)).fetchall()
+        for grade in grades:
+            records[grade['student_id']]['grades'].append(dict(grade))
+    return records
+
+@db_metrics.timed
+def archive_students(older_than_years: int | None = None, batch_size: int | None = None,
+                     max_batches: int | None = None, current_year: int | None = None) -> dict | None:
+    """
+    Moves graduated and dropped-out students whose graduation year (or, without
+    one, enrollment year) is at least `older_than_years` ago, with their grades,
+    from the live database to its archive.
+
+    Each batch is read without locks, written to the archive, and then removed
+    from the live database in one short transaction that re-reads the batch
+    first: students changed in the meantime stay live and their archive copies
+    are dropped again. Batches are separated by ARCHIVE_BATCH_PAUSE so other
+    writers are not starved, and a batch that held the write lock longer than
+    ARCHIVE_MAX_LOCK_SECONDS halves the size of the next one (it grows back
+    towards `batch_size` while batches stay well under the limit). The job can
+    be interrupted and re-run at any time.
 
+    Args:
+        older_than_years (int | None): Defaults to archive.ARCHIVE_AFTER_YEARS.
+        batch_size (int | None): Students per batch, default archive.ARCHIVE_BATCH_SIZE.
+        max_batches (int | None): Stop after this many batches (None: until done).
+        current_year (int | None): Reference year, default the current year.
+
+    Returns:
+        dict | None: {'archived': int, 'kept': int, 'batches': int, 'cutoff_year': int},
+                     where 'kept' counts students that changed while being archived;
+                     None if the database has no archive or an error occurs.
+    """
+    store = _get_archive()
+    if store is None:
+        logger.warning("Archiving is not available for database %s.", current_database())
+        return None
+    years = archive.ARCHIVE_AFTER_YEARS if older_than_years is None else older_than_years
+    max_size = batch_size or archive.ARCHIVE_BATCH_SIZE
+    size = max_size
+    cutoff_year = (current_year or datetime.date.today().year) - years
+    report = {'archived': 0, 'kept': 0, 'batches': 0, 'cutoff_year': cutoff_year}
+    statuses = ', '.join('?' * len(archive.ARCHIVED_STATUSES))
+    last_id = ''
+    try:
+        while max_batches is None or report['batches'] < max_batches:
+            conn = get_db_connection()
+            student_ids = [row[0] for row in conn.execute(f"""
+                SELECT student_id FROM students
+                WHERE status IN ({statuses}) AND COALESCE(graduation_year, enrollment_year) <= ?
+                  AND student_id > ?
+                ORDER BY student_id LIMIT ?
+            """, (*archive.ARCHIVED_STATUSES, cutoff_year, last_id, size))]
+            if not student_ids:
+                break
+            last_id = student_ids[-1]
+            records = _fetch_archivable(conn, student_ids, cutoff_year)
+            store.store(list(records.values()))
+
+            with transaction() as tx:
+                locked_at = time.perf_counter()
+                current = _fetch_archivable(tx.conn, list(records), cutoff_year)
+                moved = [student_id for student_id, record in records.items() if current.get(student_id) == record]
+                tx.conn.executemany("DELETE FROM students WHERE student_id = ?",
+                                    [(student_id,) for student_id in moved])
+                _invalidate_student(tx.conn, *moved)
+            lock_seconds = time.perf_counter() - locked_at
+            changed = [student_id for student_id in records if student_id not in moved]
+            store.remove(changed)
+
+            report['archived'] += len(moved)
+            report['kept'] += len(changed)
+            report['batches'] += 1
+            if len(student_ids) < size:
+                break
+            if lock_seconds > archive.ARCHIVE_MAX_LOCK_SECONDS and size > 1:
+                size = max(1, size // 2)
+                logger.info("Archive batch held the write lock for %.0f ms; next batches hold %s students.",
+                            lock_seconds * 1000, size)
+            elif lock_seconds < archive.ARCHIVE_MAX_LOCK_SECONDS / 4 and size < max_size:
+                size = min(max_size, size * 2)
+            time.sleep(archive.ARCHIVE_BATCH_PAUSE)
     except sqlite3.Error as e:
-        logging.error(f"Database error retrieving graduated student record for {student_id}: {e}")
+        logger.error("Archiving stopped after %s students: %s", report['archived'], e)
         return None
-    except Exception as e:
-        logging.error(f"An unexpected error occurred while retrieving graduated student record for {student_id}: {e}")
+    logger.info("Archived %s students (graduated or dropped out in %s or earlier) in %s batches.",
+                report['archived'], cutoff_year, report['batches'])
+    return report
+
+def close_archives() -> None:
+    """Closes this thread's archive connections and forgets the archives (e.g. between tests)."""
+    with _archives_lock:
+        stores = list(_archives.values())
+        _archives.clear()
+    for store in stores:
+        store.close()
+
+def get_archive_stats() -> dict | None:
+    """Returns archive.Archive.stats() for the current database, or None if it has no archive."""
+    store = _get_archive()
+    return store.stats() if store is not None else None
+
+# --- Change Log (Incremental Sync) ---
+
+# Mirrors (e.g. the district office's copy of a school's register) follow the
+# change log instead of re-downloading everything. Triggers append one entry per
+# inserted, updated or deleted row of 'students' and 'student_grades'; the entry
+# holds the row's key only, and get_changes_since() returns each row's current
+# state, so a mirror that applies the changes in order ends up identical.
+CHANGES_PAGE_SIZE = int(os.environ.get('CHANGES_PAGE_SIZE', 500))
+CHANGES_MAX_PAGE_SIZE = 5000
+# compact_change_log() keeps at most this many entries (after dropping superseded ones)...
+CHANGE_LOG_MAX_ENTRIES = int(os.environ.get('CHANGE_LOG_MAX_ENTRIES', 100000))
+# ...and none older than this many days. Mirrors further behind must download the register again.
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get('CHANGE_LOG_RETENTION_DAYS', 90))
+
+_CHANGE_KEYS = {'students': 'student_id', 'student_grades': 'grade_id'}
+
+def _initialize_change_log(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the 'change_log' table and its triggers. Versions come from
+    AUTOINCREMENT, so they only ever grow, even after compaction deletes entries.
+    'change_log_state' remembers the highest version compaction has removed.
+    """
+    # No declared type on 'row_key', so grade ids stay integers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            operation TEXT NOT NULL CHECK(operation IN ('insert', 'update', 'delete')),
+            row_key NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+        )
+    ''')
+    # Lets compaction find the newest entry of each row
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_key, version)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    for table, key in _CHANGE_KEYS.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO change_log (table_name, operation, row_key) VALUES ('{table}', 'insert', new.{key});
+            END
+        ''')
+        # A changed key is logged as a delete of the old row and an update of the new one
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_update AFTER UPDATE ON {table} BEGIN
+                INSERT INTO change_log (table_name, operation, row_key)
+                    SELECT '{table}', 'delete', old.{key} WHERE old.{key} IS NOT new.{key};
+                INSERT INTO change_log (table_name, operation, row_key) VALUES ('{table}', 'update', new.{key});
+            END
+        ''')
+        # Also fired for grades removed by the ON DELETE CASCADE from students
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO change_log (table_name, operation, row_key) VALUES ('{table}', 'delete', old.{key});
+            END
+        ''')
+    logger.info("Checked/created 'change_log' table and triggers.")
+
+def _current_change_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+def _compacted_through(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM change_log_state WHERE name = 'compacted_through'").fetchone()
+    return row[0] if row else 0
+
+def _current_rows(conn: sqlite3.Connection, table: str, keys: list) -> dict:
+    """Returns {key: row dict} for those of `keys` that still exist in `table`."""
+    if not keys:
+        return {}
+    key_column = _CHANGE_KEYS[table]
+    rows = conn.execute(f"SELECT * FROM {table} WHERE {key_column} IN ({', '.join('?' * len(keys))})",
+                        keys).fetchall()
+    return {row[key_column]: dict(row) for row in rows}
+
+@db_metrics.timed
+def get_changes_since(version: int = 0, limit: int = CHANGES_PAGE_SIZE) -> dict | None:
+    """
+    Returns the changes made after `version`, oldest first, for incremental sync.
+
+    Each change carries the row's current data; a row changed several times
+    within one page is reported once, at its newest version. A change whose row
+    no longer exists is reported as a 'delete' with data None. To sync, apply
+    the changes in order (upsert `data`, or delete the key) and call again with
+    'next_version' until 'has_more' is False.
+
+    Args:
+        version (int): The 'next_version' of the previous call; 0 for the first sync.
+        limit (int): Log entries read per call (1..CHANGES_MAX_PAGE_SIZE).
+
+    Returns:
+        dict | None: {
+                         'changes': [{'version': int, 'table': 'students' | 'student_grades',
+                                      'operation': 'insert' | 'update' | 'delete',
+                                      'key': student_id | grade_id, 'data': dict | None}, ...],
+                         'next_version': int, 'current_version': int, 'has_more': bool,
+                         'resync_required': bool
+                     }
+                     'resync_required' means entries after `version` have been compacted
+                     away: download the full register and continue from 'next_version'
+                     (the version current when the register was read).
+                     Returns None if an error occurs.
+    """
+    limit = max(1, min(int(limit), CHANGES_MAX_PAGE_SIZE))
+    try:
+        with get_db_connection() as conn:
+            conn.execute("BEGIN")  # One read snapshot for the log and the rows it points to
+            try:
+                current_version = _current_change_version(conn)
+                if version < _compacted_through(conn):
+                    return {'changes': [], 'next_version': current_version, 'current_version': current_version,
+                            'has_more': False, 'resync_required': True}
+                entries = conn.execute('''
+                    SELECT version, table_name, operation, row_key FROM change_log
+                    WHERE version > ? ORDER BY version LIMIT ?
+                ''', (version, limit + 1)).fetchall()
+                has_more = len(entries) > limit
+                entries = entries[:limit]
+
+                latest = {}  # (table, key) -> newest entry, in the order of that entry's version
+                for entry in entries:
+                    latest.pop((entry['table_name'], entry['row_key']), None)
+                    latest[(entry['table_name'], entry['row_key'])] = entry
+                rows = {table: _current_rows(conn, table, [key for t, key in latest if t == table])
+                        for table in _CHANGE_KEYS}
+            finally:
+                conn.commit()
+
+        changes = []
+        for (table, key), entry in latest.items():
+            data = rows[table].get(key)
+            changes.append({
+                'version': entry['version'],
+                'table': table,
+                'operation': entry['operation'] if data is not None else 'delete',
+                'key': key,
+                'data': data,
+            })
+        next_version = entries[-1]['version'] if entries else version
+        logger.debug("Returned %s changes after version %s.", len(changes), version)
+        return {'changes': changes, 'next_version': next_version, 'current_version': current_version,
+                'has_more': has_more, 'resync_required': False}
+    except sqlite3.Error as e:
+        logger.error("Database error reading changes since version %s: %s", version, e)
         return None
 
+@db_metrics.timed
+@db_retry.retry_on_busy
+def compact_change_log(max_entries: int | None = None, retention_days: int | None = None) -> dict | None:
+    """
+    Bounds the size of the change log. Entries superseded by a newer entry for
+    the same row are dropped first; this never changes what a mirror receives.
+    Then the oldest entries beyond `max_entries` or older than `retention_days`
+    are dropped, and mirrors still behind them are told to resync.
+
+    Args:
+        max_entries (int | None): Defaults to CHANGE_LOG_MAX_ENTRIES.
+        retention_days (int | None): Defaults to CHANGE_LOG_RETENTION_DAYS.
+
+    Returns:
+        dict | None: {'superseded': int, 'expired': int, 'remaining': int, 'compacted_through': int},
+                     or None if an error occurs.
+    """
+    max_entries = CHANGE_LOG_MAX_ENTRIES if max_entries is None else max_entries
+    retention_days = CHANGE_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    try:
+        with transaction() as tx:
+            cursor = tx.conn.cursor()
+            cursor.execute('''
+                DELETE FROM change_log
+                WHERE version < (SELECT MAX(newer.version) FROM change_log AS newer
+                                 WHERE newer.table_name = change_log.table_name
+                                   AND newer.row_key = change_log.row_key)
+            ''')
+            superseded = cursor.rowcount
+
+            # Highest version to drop: beyond the size limit or past the retention period
+            cursor.execute('''
+                SELECT MAX(
+                    COALESCE((SELECT version FROM change_log ORDER BY version DESC LIMIT 1 OFFSET ?), 0),
+                    COALESCE((SELECT MAX(version) FROM change_log
+                              WHERE changed_at < strftime('%Y-%m-%dT%H:%M:%fZ', 'now', ?)), 0))
+            ''', (max_entries, f"-{retention_days} days"))
+            expire_through = cursor.fetchone()[0]
+            cursor.execute("DELETE FROM change_log WHERE version <= ?", (expire_through,))
+            expired = cursor.rowcount
+            compacted_through = max(_compacted_through(tx.conn), expire_through)
+            if expired:
+                cursor.execute('''
+                    INSERT INTO change_log_state (name, value) VALUES ('compacted_through', ?)
+                    ON CONFLICT (name) DO UPDATE SET value = excluded.value
+                ''', (compacted_through,))
+            remaining = cursor.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+    except sqlite3.Error as e:
+        db_retry.raise_if_retryable(e)
+        logger.error("Database error compacting the change log: %s", e)
+        return None
+    logger.info("Compacted the change log: %s superseded and %s expired entries removed, %s remain.",
+                superseded, expired, remaining)
+    return {'superseded': superseded, 'expired': expired, 'remaining': remaining,
+            'compacted_through': compacted_through}
+
+# --- Full-Text Name Search ---
+
+# Whether the FTS5 name index exists, per database file (tenant and archive
+# databases may differ). Filled on the first search; initialize_database() sets it directly.
+_fts_name_search: dict[str, bool] = {}
+
+def _initialize_name_search(cursor: sqlite3.Cursor) -> bool:
+    """
+    Creates the 'students_fts' FTS5 index over students.full_name and the triggers
+    that keep it in sync. The table stores its own copy of the name rather than
+    being an external-content table keyed by the rowid of 'students', because
+    that rowid is not stable across VACUUM. Instead 'students_fts_keys' gives
+    each student_id its own FTS rowid, so the triggers find the row to replace
+    by rowid (student_id is UNINDEXED; matching on it scans the whole index).
+    Returns False, leaving name search on LIKE, if this SQLite build lacks FTS5.
+    """
+    database = current_database()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'students_fts_keys'")
+    keyed = cursor.fetchone() is not None
+    try:
+        # remove_diacritics 2 folds accents (e.g. 'José' matches 'jose') for names
+        # that are written with and without diacritics.
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+                student_id UNINDEXED,
+                full_name,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        logger.warning("FTS5 is not available (%s). Name search will use LIKE.", e)
+        _fts_name_search[database] = False
+        return False
+
+    if not keyed:
+        # Missing, or built by an earlier version whose triggers matched on student_id: rebuild
+        for trigger in ('insert', 'delete', 'update'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS students_fts_{trigger}")
+        cursor.execute("DELETE FROM students_fts")
+        cursor.execute('''
+            CREATE TABLE students_fts_keys (
+                fts_rowid INTEGER PRIMARY KEY,
+                student_id TEXT NOT NULL UNIQUE
+            )
+        ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+            INSERT INTO students_fts_keys (student_id) VALUES (new.student_id);
+            INSERT INTO students_fts (rowid, student_id, full_name)
+                VALUES ((SELECT fts_rowid FROM students_fts_keys WHERE student_id = new.student_id),
+                        new.student_id, new.full_name);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+            DELETE FROM students_fts
+                WHERE rowid = (SELECT fts_rowid FROM students_fts_keys WHERE student_id = old.student_id);
+            DELETE FROM students_fts_keys WHERE student_id = old.student_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF student_id, full_name ON students BEGIN
+            UPDATE students_fts SET student_id = new.student_id, full_name = new.full_name
+                WHERE rowid = (SELECT fts_rowid FROM students_fts_keys WHERE student_id = old.student_id);
+            UPDATE students_fts_keys SET student_id = new.student_id
+                WHERE student_id = old.student_id AND old.student_id IS NOT new.student_id;
+        END
+    ''')
+
+    if not keyed:
+        # Index students that were added before the keyed index existed
+        cursor.execute("INSERT INTO students_fts_keys (student_id) SELECT student_id FROM students")
+        cursor.execute('''
+            INSERT INTO students_fts (rowid, student_id, full_name)
+            SELECT k.fts_rowid, s.student_id, s.full_name
+            FROM students s JOIN students_fts_keys k ON k.student_id = s.student_id
+        ''')
+        logger.info("Built 'students_fts' name index for %s existing students.", cursor.rowcount)
+    logger.info("Checked/created 'students_fts' name search index.")
+    _fts_name_search[database] = True
+    return True
+
+def _fts_name_search_available(conn: sqlite3.Connection) -> bool:
+    """Returns True if the FTS5 name index exists in the current database."""
+    database = current_database()
+    enabled = _fts_name_search.get(database)
+    if enabled is None:
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'students_fts'").fetchone()
+        enabled = _fts_name_search[database] = row is not None
+    return enabled
+
+def _build_fts_prefix_query(search_term: str) -> str | None:
+    """
+    Turns free text into an FTS5 query in which every word must match as a prefix,
+    e.g. 'sri wah' -> '"sri"* "wah"*'. Words are quoted so FTS5 operators typed by
+    the user are matched literally. Returns None if the term has no searchable words.
+    """
+    words = re.findall(r"\w+", search_term)
+    if not words:
+        return None
+    return ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+
 # --- Student Search ---
-def search_students(search_term: str, search_by: str) -> list[dict]:
+@db_metrics.timed
+def search_students(search_term: str, search_by: str) -> list[Student]:
     """
     Searches for students by name or ID.
 
+    Name searches use the FTS5 index when it is available: every word in the
+    term is matched as a prefix of a word in the name, accents are ignored and
+    results are ordered by bm25 relevance. Without FTS5, or for ID searches,
+    a LIKE '%term%' scan is used.
+
     Args:
         search_term (str): The term to search for.
         search_by (str): The field to search by ('name' or 'id').
 
     Returns:
-        list[dict]: A list of student dictionaries matching the search criteria.
+        list[Student]: A list of Student records matching the search criteria.
                     Returns an empty list if no matches or an error occurs.
     """
     students = []
     if not search_term or not search_by:
-        logging.warning("Search term or search_by field is missing.")
+        logger.warning("Search term or search_by field is missing.")
         return get_all_students() # Or return [] if preferred for empty search
 
-    query = "SELECT * FROM students WHERE "
-    term_with_wildcards = f"%{search_term}%"
+    query = f"SELECT {_STUDENT_SELECT} FROM students WHERE "
+    params = (f"%{search_term}%",)
 
     if search_by == 'name':
         query += "full_name LIKE ?"
     elif search_by == 'id':
         query += "student_id LIKE ?"
     else:
-        logging.warning(f"Unsupported search_by criteria: {search_by}. Defaulting to all students or empty.")
+        logger.warning("Unsupported search_by criteria: %s. Defaulting to all students or empty.", search_by)
         return get_all_students() # Or return []
 
     try:
         with get_db_connection() as conn:
+            if search_by == 'name' and _fts_name_search_available(conn):
+                fts_query = _build_fts_prefix_query(search_term)
+                if fts_query:
+                    query = f'''
+                        SELECT {', '.join('s.' + field for field in Student._fields)} FROM students_fts
+                        JOIN students s ON s.student_id = students_fts.student_id
+                        WHERE students_fts MATCH ?
+                        ORDER BY bm25(students_fts), s.full_name
+                    '''
+                    params = (fts_query,)
             cursor = conn.cursor()
-            cursor.execute(query, (term_with_wildcards,))
-            students = [dict(row) for row in cursor.fetchall()]
-            logging.info(f"Found {len(students)} students matching term '{search_term}' by {search_by}.")
+            cursor.row_factory = Student.from_row
+            cursor.execute(query, params)
+            students = cursor.fetchall()
+            logger.debug("Found %s students matching term '%s' by %s.", len(students), search_term, search_by)
     except sqlite3.Error as e:
-        logging.error(f"Database error searching students: {e}")
+        logger.error("Database error searching students: %s", e)
         return [] # Return empty list on error
     return students
 
 # --- Combined Student Details and Grades Fetching ---
-def get_student_details_with_grades(student_id: str) -> dict | None:
+
+STUDENT_COLUMNS = list(Student._fields)
+
+@db_metrics.timed
+def get_student_details_with_grades(student_id: str, columns: list[str] | None = None) -> dict | None:
     """
-    Retrieves a student's details and all their associated grades.
+    Retrieves a student's details and all their associated grades with a single
+    query (students LEFT JOIN student_grades), so both come from the same snapshot
+    and cost one round trip.
 
     Args:
         student_id (str): The ID of the student.
+        columns (list[str] | None): Student columns to include in 'details'. Defaults to
+                                    all columns; 'student_id' is always included.
 
     Returns:
         dict | None: A dictionary containing 'details' (student data) and 
                      'grades' (list of grade data). Returns None if student not found.
     """
-    student_details = get_student_by_id(student_id)
-    if not student_details:
+    if columns is None:
+        student_columns = STUDENT_COLUMNS
+    else:
+        unknown = [column for column in columns if column not in STUDENT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown student column(s): {', '.join(unknown)}")
+        student_columns = ['student_id'] + [column for column in columns if column != 'student_id']
+
+    select_columns = ', '.join(f"s.{column}" for column in student_columns)
+    sql = f'''
+        SELECT {select_columns}, g.grade_id, g.year_level, g.subject, g.grade
+        FROM students s
+        LEFT JOIN student_grades g ON g.student_id = s.student_id
+        WHERE s.student_id = ?
+        ORDER BY g.year_level, g.subject, g.grade
+    '''
+    try:
+        with get_db_connection() as conn:
+            rows = conn.execute(sql, (student_id,)).fetchall()
+    except sqlite3.Error as e:
+        logger.error("Database error retrieving details and grades for student %s: %s", student_id, e)
         return None
-    
-    student_grades = get_grades_for_student(student_id)
-    
+
+    if not rows:
+        logger.debug("Student %s not found.", student_id)
+        return None
+
+    student_details = {column: rows[0][column] for column in student_columns}
+    student_grades = [
+        {'grade_id': row['grade_id'], 'student_id': student_id, 'year_level': row['year_level'],
+         'subject': row['subject'], 'grade': row['grade']}
+        for row in rows if row['grade_id'] is not None
+    ]
+    logger.debug("Retrieved student %s with %s grades.", student_id, len(student_grades))
     return {
         'details': student_details,
         'grades': student_grades
     }
 
+# --- Dashboard Statistics ---
+
+STUDENT_STATUSES = ['active', 'graduated', 'dropped_out', 'inactive']
+DEFAULT_RECENT_DAYS = 7
+# Days of 'added_on' history kept by rebuild_student_stats()
+STATS_HISTORY_DAYS = 366
+
+def _recompute_student_stats(cursor: sqlite3.Cursor) -> None:
+    """Replaces the derived counters in 'student_stats' with fresh counts. 'added_on' history is kept."""
+    cursor.execute("DELETE FROM student_stats WHERE metric != 'added_on'")
+    cursor.execute("INSERT INTO student_stats (metric, bucket, value) SELECT 'students', 'total', COUNT(*) FROM students")
+    cursor.execute('''
+        INSERT INTO student_stats (metric, bucket, value)
+        SELECT 'status', COALESCE(status, 'unknown'), COUNT(*) FROM students GROUP BY 2
+    ''')
+    cursor.execute('''
+        INSERT INTO student_stats (metric, bucket, value)
+        SELECT 'enrollment_year', COALESCE(enrollment_year, 'unknown'), COUNT(*) FROM students GROUP BY 2
+    ''')
+    cursor.execute("INSERT INTO student_stats (metric, bucket, value) SELECT 'grades', 'total', COUNT(*) FROM student_grades")
+
+def _initialize_student_stats(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the 'student_stats' summary table and the triggers that keep it up to
+    date, so the dashboard reads a handful of counters instead of running
+    COUNT(*) ... GROUP BY over 'students' on every load.
+
+    Each row is a (metric, bucket, value) counter:
+        ('students', 'total')          number of students
+        ('status', <status>)           students per status
+        ('enrollment_year', <year>)    students per enrollment year ('unknown' if not set)
+        ('grades', 'total')            number of grade records
+        ('added_on', <YYYY-MM-DD>)     students added on that (UTC) day; never decremented
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'student_stats'")
+    already_exists = cursor.fetchone() is not None
+    # No declared type on 'bucket', so enrollment years stay integers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS student_stats (
+            metric TEXT NOT NULL,
+            bucket NOT NULL,
+            value INTEGER NOT NULL,
+            PRIMARY KEY (metric, bucket)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS student_stats_insert AFTER INSERT ON students BEGIN
+            INSERT INTO student_stats (metric, bucket, value) VALUES
+                ('students', 'total', 1),
+                ('status', COALESCE(new.status, 'unknown'), 1),
+                ('enrollment_year', COALESCE(new.enrollment_year, 'unknown'), 1),
+                ('added_on', date('now'), 1)
+            ON CONFLICT (metric, bucket) DO UPDATE SET value = value + excluded.value;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS student_stats_delete AFTER DELETE ON students BEGIN
+            INSERT INTO student_stats (metric, bucket, value) VALUES
+                ('students', 'total', -1),
+                ('status', COALESCE(old.status, 'unknown'), -1),
+                ('enrollment_year', COALESCE(old.enrollment_year, 'unknown'), -1)
+            ON CONFLICT (metric, bucket) DO UPDATE SET value = value + excluded.value;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS student_stats_update AFTER UPDATE OF status, enrollment_year ON students
+        WHEN old.status IS NOT new.status OR old.enrollment_year IS NOT new.enrollment_year BEGIN
+            INSERT INTO student_stats (metric, bucket, value) VALUES
+                ('status', COALESCE(old.status, 'unknown'), -1),
+                ('status', COALESCE(new.status, 'unknown'), 1),
+                ('enrollment_year', COALESCE(old.enrollment_year, 'unknown'), -1),
+                ('enrollment_year', COALESCE(new.enrollment_year, 'unknown'), 1)
+            ON CONFLICT (metric, bucket) DO UPDATE SET value = value + excluded.value;
+        END
+    ''')
+    # Also fired for grades removed by the ON DELETE CASCADE from students
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS student_stats_grade_insert AFTER INSERT ON student_grades BEGIN
+            INSERT INTO student_stats (metric, bucket, value) VALUES ('grades', 'total', 1)
+            ON CONFLICT (metric, bucket) DO UPDATE SET value = value + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS student_stats_grade_delete AFTER DELETE ON student_grades BEGIN
+            INSERT INTO student_stats (metric, bucket, value) VALUES ('grades', 'total', -1)
+            ON CONFLICT (metric, bucket) DO UPDATE SET value = value - 1;
+        END
+    ''')
+
+    if not already_exists:
+        # Count the students and grades that were added before the table existed
+        _recompute_student_stats(cursor)
+        logger.info("Built 'student_stats' counters for existing records.")
+    logger.info("Checked/created 'student_stats' summary table.")
+
+@db_metrics.timed
+def get_student_stats(recent_days: int = DEFAULT_RECENT_DAYS) -> dict:
+    """
+    Reads the dashboard figures from the trigger-maintained 'student_stats' table.
+    The cost depends on the number of counters (statuses, enrollment years and
+    days), not on the number of students.
+
+    Args:
+        recent_days (int): Number of days, including today, counted as recent additions.
+
+    Returns:
+        dict: {
+                  'total_students': int,
+                  'total_grades': int,
+                  'by_status': {'active': int, 'graduated': int, ...},
+                  'by_enrollment_year': {2021: int, ...},   # oldest first, 'unknown' last
+                  'recent_additions': int,
+                  'recent_days': int
+              }
+              All counts are 0 if an error occurs.
+    """
+    recent_days = max(1, int(recent_days))
+    stats = {'total_students': 0, 'total_grades': 0,
+             'by_status': dict.fromkeys(STUDENT_STATUSES, 0), 'by_enrollment_year': {},
+             'recent_additions': 0, 'recent_days': recent_days}
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            # Two primary key range reads; 'added_on' is limited to the requested days
+            cursor.execute('''
+                SELECT metric, bucket, value FROM student_stats
+                WHERE metric IN ('students', 'grades', 'status', 'enrollment_year')
+                UNION ALL
+                SELECT metric, bucket, value FROM student_stats
+                WHERE metric = 'added_on' AND bucket >= date('now', ?)
+            ''', (f"-{recent_days - 1} days",))
+            for metric, bucket, value in cursor.fetchall():
+                if metric == 'students':
+                    stats['total_students'] = value
+                elif metric == 'grades':
+                    stats['total_grades'] = value
+                elif metric == 'status':
+                    stats['by_status'][bucket] = value
+                elif metric == 'enrollment_year' and value:
+                    stats['by_enrollment_year'][bucket] = value
+                elif metric == 'added_on':
+                    stats['recent_additions'] += value
+            stats['by_enrollment_year'] = dict(sorted(
+                stats['by_enrollment_year'].items(), key=lambda item: (isinstance(item[0], str), item[0])))
+    except sqlite3.Error as e:
+        logger.error("Database error reading student statistics: %s", e)
+    return stats
+
+@db_metrics.timed
+@db_retry.retry_on_busy
+def rebuild_student_stats() -> dict | None:
+    """
+    Recomputes the 'student_stats' counters from the students and student_grades
+    tables, fixing any drift (e.g. rows changed while the triggers were missing),
+    and drops 'added_on' history older than STATS_HISTORY_DAYS. Daily addition
+    counts cannot be recomputed and are kept as they are.
+
+    Returns:
+        dict | None: {'counters': int, 'corrected': int} - the number of counters
+                     after the rebuild and how many of them had drifted,
+                     or None if an error occurs.
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT metric, bucket, value FROM student_stats WHERE metric != 'added_on'")
+            before = {(metric, bucket): value for metric, bucket, value in cursor.fetchall()}
+            _recompute_student_stats(cursor)
+            cursor.execute("SELECT metric, bucket, value FROM student_stats WHERE metric != 'added_on'")
+            after = {(metric, bucket): value for metric, bucket, value in cursor.fetchall()}
+            cursor.execute("DELETE FROM student_stats WHERE metric = 'added_on' AND bucket < date('now', ?)",
+                           (f"-{STATS_HISTORY_DAYS} days",))
+            conn.commit()
+            # A counter missing on one side counts as zero
+            corrected = sum(1 for key in before.keys() | after.keys() if before.get(key, 0) != after.get(key, 0))
+            logger.info("Rebuilt student statistics: %s counters, %s corrected.", len(after), corrected)
+            return {'counters': len(after), 'corrected': corrected}
+    except sqlite3.Error as e:
+        db_retry.raise_if_retryable(e)
+        logger.error("Database error rebuilding student statistics: %s", e)
+        return None
+
+# --- GPA and Class Ranking ---
+
+# Grade points on a 4.0 scale for letter grades. Lookups are case-insensitive
+# and ignore surrounding spaces. Change them with set_grade_points().
+DEFAULT_GRADE_POINTS = {
+    'A+': 4.0, 'A': 4.0, 'A-': 3.7,
+    'B+': 3.3, 'B': 3.0, 'B-': 2.7,
+    'C+': 2.3, 'C': 2.0, 'C-': 1.7,
+    'D+': 1.3, 'D': 1.0, 'E': 0.0, 'F': 0.0,
+}
+# Numeric grades (e.g. '85') are scaled linearly from 0..NUMERIC_GRADE_MAX onto
+# 0..GPA_SCALE_MAX. Grades that are neither a mapped letter nor a number
+# (e.g. 'Incomplete') are left out of the GPA.
+GPA_SCALE_MAX = float(os.environ.get('GPA_SCALE_MAX', 4.0))
+NUMERIC_GRADE_MAX = float(os.environ.get('NUMERIC_GRADE_MAX', 100.0))
+
+# A cohort is the students of one enrollment year at one year level. Students
+# without an enrollment year, and grades without a year level, are grouped under 0.
+_RECOMPUTE_RANKINGS_SQL = '''
+    INSERT INTO student_rankings (student_id, year_level, enrollment_year, gpa,
+                                  graded_count, cohort_rank, cohort_size)
+    WITH scored AS (
+        SELECT g.student_id,
+               d.enrollment_year,
+               d.year_level,
+               COALESCE(gp.points,
+                        CASE WHEN trim(g.grade) GLOB '*[0-9]*' AND trim(g.grade) NOT GLOB '*[^0-9.]*'
+                             THEN MIN(CAST(trim(g.grade) AS REAL), :numeric_max) * :scale_max / :numeric_max
+                        END) AS points
+        FROM students s
+        JOIN ranking_dirty_cohorts d ON d.enrollment_year = IFNULL(s.enrollment_year, 0)
+        JOIN student_grades g ON g.student_id = s.student_id AND IFNULL(g.year_level, 0) = d.year_level
+        LEFT JOIN grade_points gp ON gp.grade = upper(trim(g.grade))
+    ),
+    per_student AS (
+        SELECT student_id, enrollment_year, year_level, AVG(points) AS gpa, COUNT(points) AS graded_count
+        FROM scored
+        GROUP BY student_id, enrollment_year, year_level
+        HAVING COUNT(points) > 0
+    )
+    SELECT student_id, year_level, enrollment_year, round(gpa, 4), graded_count,
+           RANK() OVER (PARTITION BY enrollment_year, year_level ORDER BY round(gpa, 4) DESC),
+           COUNT(*) OVER (PARTITION BY enrollment_year, year_level)
+    FROM per_student
+'''
+
+_MARK_ALL_COHORTS_DIRTY_SQL = '''
+    INSERT OR IGNORE INTO ranking_dirty_cohorts (enrollment_year, year_level)
+    SELECT DISTINCT IFNULL(s.enrollment_year, 0), IFNULL(g.year_level, 0)
+    FROM student_grades g JOIN students s ON s.student_id = g.student_id
+'''
+
+def _initialize_rankings(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the tables behind the GPA/ranking engine:
+      - 'grade_points': the letter-to-point mapping, so GPAs are computed in SQL;
+      - 'student_rankings': GPA, rank and cohort size per student and year level;
+      - 'ranking_dirty_cohorts': cohorts whose grades or members changed since the
+        last recompute_rankings(), filled by triggers.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'student_rankings'")
+    already_exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS grade_points (
+            grade TEXT PRIMARY KEY,
+            points REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS student_rankings (
+            student_id TEXT NOT NULL,
+            year_level INTEGER NOT NULL,
+            enrollment_year INTEGER NOT NULL,
+            gpa REAL NOT NULL,
+            graded_count INTEGER NOT NULL,
+            cohort_rank INTEGER NOT NULL,
+            cohort_size INTEGER NOT NULL,
+            PRIMARY KEY (student_id, year_level)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_student_rankings_cohort
+        ON student_rankings (enrollment_year, year_level, cohort_rank)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ranking_dirty_cohorts (
+            enrollment_year INTEGER NOT NULL,
+            year_level INTEGER NOT NULL,
+            PRIMARY KEY (enrollment_year, year_level)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS rankings_grade_insert AFTER INSERT ON student_grades BEGIN
+            INSERT OR IGNORE INTO ranking_dirty_cohorts (enrollment_year, year_level)
+            SELECT IFNULL(enrollment_year, 0), IFNULL(new.year_level, 0) FROM students WHERE student_id = new.student_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS rankings_grade_update AFTER UPDATE OF student_id, year_level, grade ON student_grades BEGIN
+            INSERT OR IGNORE INTO ranking_dirty_cohorts (enrollment_year, year_level)
+            SELECT IFNULL(enrollment_year, 0), IFNULL(old.year_level, 0) FROM students WHERE student_id = old.student_id;
+            INSERT OR IGNORE INTO ranking_dirty_cohorts (enrollment_year, year_level)
+            SELECT IFNULL(enrollment_year, 0), IFNULL(new.year_level, 0) FROM students WHERE student_id = new.student_id;
+        END
+    ''')
+    # For grades removed by the ON DELETE CASCADE the student row is already gone;
+    # rankings_student_delete marks those cohorts instead.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS rankings_grade_delete AFTER DELETE ON student_grades BEGIN
+            INSERT OR IGNORE INTO ranking_dirty_cohorts (enrollment_year, year_level)
+            SELECT IFNULL(enrollment_year, 0), IFNULL(old.year_level, 0) FROM students WHERE student_id = old.student_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS rankings_student_delete BEFORE DELETE ON students BEGIN
+            INSERT OR IGNORE INTO ranking_dirty_cohorts (enrollment_year, year_level)
+            SELECT DISTINCT IFNULL(old.enrollment_year, 0), IFNULL(year_level, 0)
+            FROM student_grades WHERE student_id = old.student_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS rankings_student_update AFTER UPDATE OF enrollment_year ON students
+        WHEN old.enrollment_year IS NOT new.enrollment_year BEGIN
+            INSERT OR IGNORE INTO ranking_dirty_cohorts (enrollment_year, year_level)
+            SELECT DISTINCT IFNULL(old.enrollment_year, 0), IFNULL(year_level, 0)
+            FROM student_grades WHERE student_id = new.student_id;
+            INSERT OR IGNORE INTO ranking_dirty_cohorts (enrollment_year, year_level)
+            SELECT DISTINCT IFNULL(new.enrollment_year, 0), IFNULL(year_level, 0)
+            FROM student_grades WHERE student_id = new.student_id;
+        END
+    ''')
+
+    if not already_exists:
+        cursor.executemany("INSERT OR IGNORE INTO grade_points (grade, points) VALUES (?, ?)",
+                           DEFAULT_GRADE_POINTS.items())
+        # Existing grades are ranked by the first recompute_rankings()
+        cursor.execute(_MARK_ALL_COHORTS_DIRTY_SQL)
+    logger.info("Checked/created GPA and ranking tables.")
+
+@db_metrics.timed
+def get_grade_points() -> dict:
+    """Returns the letter-to-point mapping used for GPAs, or {} if an error occurs."""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT grade, points FROM grade_points ORDER BY points DESC, grade")
+            return {grade: points for grade, points in cursor.fetchall()}
+    except sqlite3.Error as e:
+        logger.error("Database error reading grade points: %s", e)
+        return {}
+
+@db_metrics.timed
+@db_retry.retry_on_busy
+def set_grade_points(grade_points: dict) -> bool:
+    """
+    Replaces the letter-to-point mapping and marks every cohort for recomputation.
+
+    Args:
+        grade_points (dict): Letter grade -> points, e.g. {'A': 4.0, 'B': 3.0}. Letters are
+                             matched case-insensitively.
+
+    Returns:
+        bool: True if the mapping was saved, False otherwise.
+    """
+    try:
+        rows = [(str(grade).strip().upper(), float(points)) for grade, points in grade_points.items()]
+    except (TypeError, ValueError) as e:
+        logger.error("Invalid grade point mapping: %s", e)
+        return False
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("DELETE FROM grade_points")
+            cursor.executemany("INSERT OR REPLACE INTO grade_points (grade, points) VALUES (?, ?)", rows)
+            cursor.execute(_MARK_ALL_COHORTS_DIRTY_SQL)
+            conn.commit()
+            logger.info("Saved %s grade point mappings. All cohorts will be re-ranked.", len(rows))
+            return True
+    except sqlite3.Error as e:
+        db_retry.raise_if_retryable(e)
+        logger.error("Database error saving grade points: %s", e)
+        return False
+
+@db_metrics.timed
+@db_retry.retry_on_busy
+def recompute_rankings(full: bool = False) -> dict | None:
+    """
+    Recomputes GPAs and class ranks for the cohorts whose grades or members changed
+    since the last run (or for every cohort with `full=True`). Each run is a single
+    INSERT ... SELECT that averages the grade points per student and ranks them
+    with RANK() OVER (PARTITION BY enrollment_year, year_level), so no grade rows
+    are loaded into Python. Students with equal GPAs share a rank.
+
+    Args:
+        full (bool): Rebuild all rankings instead of only the changed cohorts.
+
+    Returns:
+        dict | None: {'cohorts': int, 'students': int} - cohorts recomputed and the
+                     number of ranking rows written, or None if an error occurs.
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            if full:
+                cursor.execute("DELETE FROM student_rankings")
+                cursor.execute(_MARK_ALL_COHORTS_DIRTY_SQL)
+            cursor.execute("SELECT COUNT(*) FROM ranking_dirty_cohorts")
+            cohorts = cursor.fetchone()[0]
+            students = 0
+            if cohorts:
+                cursor.execute('''
+                    DELETE FROM student_rankings
+                    WHERE (enrollment_year, year_level) IN (SELECT enrollment_year, year_level FROM ranking_dirty_cohorts)
+                ''')
+                cursor.execute(_RECOMPUTE_RANKINGS_SQL,
+                               {'numeric_max': NUMERIC_GRADE_MAX, 'scale_max': GPA_SCALE_MAX})
+                students = cursor.rowcount
+                cursor.execute("DELETE FROM ranking_dirty_cohorts")
+            conn.commit()
+            if cohorts:
+                logger.info("Recomputed rankings for %s cohorts (%s students).", cohorts, students)
+            return {'cohorts': cohorts, 'students': students}
+    except sqlite3.Error as e:
+        db_retry.raise_if_retryable(e)
+        logger.error("Database error recomputing rankings: %s", e)
+        return None
+
+@db_metrics.timed
+def get_student_gpa(student_id: str) -> dict | None:
+    """
+    Returns a student's GPA and class rank per year level, plus the overall GPA
+    (weighted by the number of graded subjects), as of the last recompute_rankings().
+    Reads never recompute, so they never wait for the write lock; 'stale' is True
+    while any cohort has changes that are not ranked yet.
+
+    Returns:
+        dict | None: {
+                         'student_id': str,
+                         'gpa': float,              # overall
+                         'graded_count': int,
+                         'stale': bool,
+                         'by_year_level': [{'year_level', 'enrollment_year', 'gpa', 'graded_count',
+                                            'cohort_rank', 'cohort_size'}, ...]
+                     }
+                     or None if the student has no ranked grades or an error occurs.
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT year_level, enrollment_year, gpa, graded_count, cohort_rank, cohort_size,
+                       EXISTS (SELECT 1 FROM ranking_dirty_cohorts) AS stale
+                FROM student_rankings WHERE student_id = ? ORDER BY year_level
+            ''', (student_id,))
+            by_year_level = [dict(row) for row in cursor.fetchall()]
+            if not by_year_level:
+                return None
+            stale = bool(by_year_level[0]['stale'])
+            for row in by_year_level:
+                del row['stale']
+            graded_count = sum(row['graded_count'] for row in by_year_level)
+            gpa = sum(row['gpa'] * row['graded_count'] for row in by_year_level) / graded_count
+            return {'student_id': student_id, 'gpa': round(gpa, 4), 'graded_count': graded_count,
+                    'stale': stale, 'by_year_level': by_year_level}
+    except sqlite3.Error as e:
+        logger.error("Database error retrieving GPA for student %s: %s", student_id, e)
+        return None
+
+@db_metrics.timed
+def get_cohort_rankings(enrollment_year: int, year_level: int, limit: int | None = None) -> list[dict]:
+    """
+    Returns the class ranking of one cohort, best first, as of the last
+    recompute_rankings(). 'stale' is True on every row while the cohort has
+    changes that are not ranked yet.
+
+    Args:
+        enrollment_year (int): The cohort's enrollment year (0 for students without one).
+        year_level (int): The year level the grades belong to.
+        limit (int | None): Return only the top `limit` students.
+
+    Returns:
+        list[dict]: [{'student_id', 'full_name', 'gpa', 'graded_count', 'cohort_rank', 'cohort_size', 'stale'}, ...],
+                    or an empty list if the cohort has no ranked students or an error occurs.
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT r.student_id, s.full_name, r.gpa, r.graded_count, r.cohort_rank, r.cohort_size,
+                       EXISTS (SELECT 1 FROM ranking_dirty_cohorts d
+                               WHERE d.enrollment_year = r.enrollment_year AND d.year_level = r.year_level) AS stale
+                FROM student_rankings r JOIN students s ON s.student_id = r.student_id
+                WHERE r.enrollment_year = ? AND r.year_level = ?
+                ORDER BY r.cohort_rank, r.student_id
+                LIMIT ?
+            ''', (enrollment_year, year_level, -1 if limit is None else limit))
+            return [dict(row, stale=bool(row['stale'])) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error("Database error retrieving rankings for cohort %s/%s: %s", enrollment_year, year_level, e)
+        return []
+
+# --- Student Register (Buku Induk) Export ---
+
+REGISTER_STUDENT_COLUMNS = STUDENT_COLUMNS
+REGISTER_GRADE_COLUMNS = ['grade_id', 'year_level', 'subject', 'grade']
+EXPORT_FETCH_SIZE = 1000
+
+def iter_register_rows(status: str | None = None, enrollment_year: int | None = None):
+    """
+    Yields the full student register as flat dictionaries, one per grade (students
+    without grades get one row with empty grade columns). Pass `status` and/or
+    `enrollment_year` to export only matching students.
+
+    The data comes from a single LEFT JOIN ordered by student_id and read in batches
+    of EXPORT_FETCH_SIZE rows, so memory use does not grow with the number of
+    students or grades.
+
+    The database is resolved when this is called, not when iteration starts:
+    streamed responses are consumed after the request's tenant route has been
+    reset. The rows are read on a pooled connection the iterator owns
+    (db_connection.detach_connection) instead of the thread-bound one, because
+    the request's connections have been released by then as well.
+    """
+    student_columns = ', '.join(f"s.{column}" for column in REGISTER_STUDENT_COLUMNS)
+    grade_columns = ', '.join(f"g.{column}" for column in REGISTER_GRADE_COLUMNS)
+    conditions, params = [], []
+    if status is not None:
+        conditions.append("s.status = ?")
+        params.append(status)
+    if enrollment_year is not None:
+        conditions.append("s.enrollment_year = ?")
+        params.append(enrollment_year)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    sql = f'''
+        SELECT {student_columns}, {grade_columns}
+        FROM students s
+        LEFT JOIN student_grades g ON g.student_id = s.student_id
+        {where}
+        ORDER BY s.student_id, g.year_level, g.subject, g.grade
+    '''
+    return _stream_register_rows(current_database(), sql, params)
+
+def _stream_register_rows(database: str, sql: str, params: list):
+    conn = db_connection.detach_connection(database)
+    try:
+        cursor = conn.execute(sql, params)
+        rows_exported = 0
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+            rows_exported += len(rows)
+        logger.info("Exported %s register rows.", rows_exported)
+    finally:
+        db_connection.get_pool(database).release(conn)
+
+def iter_register_students(status: str | None = None, enrollment_year: int | None = None):
+    """
+    Yields the register one student at a time as {'details': {...}, 'grades': [...]},
+    grouping the ordered rows of iter_register_rows() (same filters). Only one
+    student's grades are held in memory at a time.
+    """
+    return _group_register_rows(iter_register_rows(status=status, enrollment_year=enrollment_year))
+
+def _group_register_rows(register_rows):
+    for _, rows in itertools.groupby(register_rows, key=lambda row: row['student_id']):
+        rows = list(rows)
+        details = {column: rows[0][column] for column in REGISTER_STUDENT_COLUMNS}
+        grades = [{column: row[column] for column in REGISTER_GRADE_COLUMNS}
+                  for row in rows if row['grade_id'] is not None]
+        yield {'details': details, 'grades': grades}
+
+def export_register(fmt: str = 'csv'):
+    """
+    Streams the student register as text chunks.
+
+    Args:
+        fmt (str): 'csv' for one row per grade with a header row, or 'jsonl' for one
+                   JSON object per student ({'details': ..., 'grades': [...]}) per line.
+
+    Returns:
+        Iterator[str]: Pieces of the export, each covering up to EXPORT_FETCH_SIZE records.
+                       Like iter_register_rows(), it reads the database current at the call.
+    """
+    if fmt not in ('csv', 'jsonl'):
+        raise ValueError(f"Unsupported export format '{fmt}'. Choose 'csv' or 'jsonl'.")
+    if fmt == 'csv':
+        return _export_chunks(fmt, iter_register_rows())
+    return _export_chunks(fmt, iter_register_students())
+
+def _export_chunks(fmt: str, source):
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(REGISTER_STUDENT_COLUMNS + REGISTER_GRADE_COLUMNS)
+        columns = REGISTER_STUDENT_COLUMNS + REGISTER_GRADE_COLUMNS
+        records = (writer.writerow([row[column] for column in columns]) for row in source)
+    else:
+        records = (buffer.write(json.dumps(student, ensure_ascii=False) + '\n') for student in source)
+
+    for count, _ in enumerate(records, start=1):
+        if count % EXPORT_FETCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gzip_stream(chunks):
+    """Compresses an iterable of text chunks into a stream of gzip bytes."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits=31 writes a gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
 
 if __name__ == '__main__':
     # Example Usage (for testing purposes)
-    logging.info("Running example database operations...")
+    import log_config
+    log_config.configure_logging()
+    logger.info("Running example database operations...")
     initialize_database()
 
     # Sample student data
@@ -489,28 +2433,28 @@ if __name__ == '__main__':
     s3_id = add_student(grad_student_data)
 
     if s1_id:
-        logging.info(f"Added student with ID: {s1_id}")
+        logger.info("Added student with ID: %s", s1_id)
     if s2_id:
-        logging.info(f"Added student with ID: {s2_id}")
+        logger.info("Added student with ID: %s", s2_id)
     if s3_id:
-        logging.info(f"Added graduated student with ID: {s3_id}")
+        logger.info("Added graduated student with ID: %s", s3_id)
 
 
     # Get all students
     all_students = get_all_students()
-    logging.info(f"All students: {all_students}")
+    logger.info("All students: %s", all_students)
 
     # Get a specific student
     if s1_id:
         student_detail = get_student_by_id(s1_id)
-        logging.info(f"Details for student {s1_id}: {student_detail}")
+        logger.info("Details for student %s: %s", s1_id, student_detail)
 
     # Update a student
     if s1_id:
         update_success = update_student(s1_id, {'phone_number': '555-4321', 'status': 'active'})
-        logging.info(f"Update status for {s1_id}: {update_success}")
+        logger.info("Update status for %s: %s", s1_id, update_success)
         student_detail_updated = get_student_by_id(s1_id)
-        logging.info(f"Updated details for student {s1_id}: {student_detail_updated}")
+        logger.info("Updated details for student %s: %s", s1_id, student_detail_updated)
 
     # Add grades for student1
     if s1_id:
@@ -518,8 +2462,8 @@ if __name__ == '__main__':
         grade2_data = {'student_id': s1_id, 'year_level': 1, 'subject': 'Science', 'grade': 'B+'}
         g1_id = add_student_grade(grade1_data)
         g2_id = add_student_grade(grade2_data)
-        if g1_id: logging.info(f"Added grade with ID: {g1_id}")
-        if g2_id: logging.info(f"Added grade with ID: {g2_id}")
+        if g1_id: logger.info("Added grade with ID: %s", g1_id)
+        if g2_id: logger.info("Added grade with ID: %s", g2_id)
     
     # Add grades for the graduated student
     if s3_id:
@@ -527,25 +2471,25 @@ if __name__ == '__main__':
         grad_grade2_data = {'student_id': s3_id, 'year_level': 4, 'subject': 'Advanced Topics', 'grade': 'A'}
         gg1_id = add_student_grade(grad_grade1_data)
         gg2_id = add_student_grade(grad_grade2_data)
-        if gg1_id: logging.info(f"Added grade ID {gg1_id} for graduated student {s3_id}")
-        if gg2_id: logging.info(f"Added grade ID {gg2_id} for graduated student {s3_id}")
+        if gg1_id: logger.info("Added grade ID %s for graduated student %s", gg1_id, s3_id)
+        if gg2_id: logger.info("Added grade ID %s for graduated student %s", gg2_id, s3_id)
 
 
     # Get grades for a student
     if s1_id:
         student_grades = get_grades_for_student(s1_id)
-        logging.info(f"Grades for student {s1_id}: {student_grades}")
+        logger.info("Grades for student %s: %s", s1_id, student_grades)
 
     # Update a grade
     if g1_id:
         grade_update_success = update_student_grade(g1_id, {'grade': 'A+'})
-        logging.info(f"Update status for grade {g1_id}: {grade_update_success}")
+        logger.info("Update status for grade %s: %s", g1_id, grade_update_success)
         if s1_id:
              student_grades_updated = get_grades_for_student(s1_id)
-             logging.info(f"Updated grades for student {s1_id}: {student_grades_updated}")
+             logger.info("Updated grades for student %s: %s", s1_id, student_grades_updated)
     
     # Attempt to add a grade for a non-existent student
-    logging.info("Attempting to add grade for non-existent student S9999...")
+    logger.info("Attempting to add grade for non-existent student S9999...")
     non_existent_grade = add_student_grade({
         'student_id': 'S9999', 
         'year_level': 1, 
@@ -553,95 +2497,95 @@ if __name__ == '__main__':
         'grade': 'X'
     })
     if not non_existent_grade:
-        logging.info("Correctly failed to add grade for S9999.")
+        logger.info("Correctly failed to add grade for S9999.")
 
 
     # Delete a grade
     if g2_id:
         delete_grade_success = delete_student_grade(g2_id)
-        logging.info(f"Deletion status for grade {g2_id}: {delete_grade_success}")
+        logger.info("Deletion status for grade %s: %s", g2_id, delete_grade_success)
         if s1_id:
             student_grades_after_delete = get_grades_for_student(s1_id)
-            logging.info(f"Grades for student {s1_id} after deleting grade {g2_id}: {student_grades_after_delete}")
+            logger.info("Grades for student %s after deleting grade %s: %s", s1_id, g2_id, student_grades_after_delete)
 
     # Delete a student (this should also delete their grades due to ON DELETE CASCADE)
     if s1_id:
         delete_student_success = delete_student(s1_id)
-        logging.info(f"Deletion status for student {s1_id}: {delete_student_success}")
+        logger.info("Deletion status for student %s: %s", s1_id, delete_student_success)
         student_after_delete = get_student_by_id(s1_id)
-        logging.info(f"Student {s1_id} after deletion: {student_after_delete}")
+        logger.info("Student %s after deletion: %s", s1_id, student_after_delete)
         grades_after_student_delete = get_grades_for_student(s1_id)
-        logging.info(f"Grades for student {s1_id} after deletion: {grades_after_student_delete}")
+        logger.info("Grades for student %s after deletion: %s", s1_id, grades_after_student_delete)
     
     # Test get_graduated_student_record
-    logging.info(f"\n--- Testing get_graduated_student_record ---")
+    logger.info("\n--- Testing get_graduated_student_record ---")
     if s3_id: # Test with the graduated student
         grad_record = get_graduated_student_record(s3_id)
         if grad_record:
-            logging.info(f"Graduated record for {s3_id}: {grad_record['details']['full_name']}")
-            logging.info(f"Grades: {grad_record['grades']}")
+            logger.info("Graduated record for %s: %s", s3_id, grad_record['details']['full_name'])
+            logger.info("Grades: %s", grad_record['grades'])
         else:
-            logging.error(f"Could not retrieve graduated record for {s3_id} (UNEXPECTED).")
+            logger.error("Could not retrieve graduated record for %s (UNEXPECTED).", s3_id)
 
     # Test search_students
-    logging.info(f"\n--- Testing search_students ---")
+    logger.info("\n--- Testing search_students ---")
     if s1_id:
-        logging.info(f"Searching for 'John' by name...")
+        logger.info("Searching for 'John' by name...")
         found_john = search_students(search_term="John", search_by="name")
-        logging.info(f"Found: {[s['full_name'] for s in found_john]}")
+        logger.info("Found: %s", [s['full_name'] for s in found_john])
         assert any(s['student_id'] == s1_id for s in found_john)
 
-        logging.info(f"Searching for '{s1_id}' by id...")
+        logger.info("Searching for '%s' by id...", s1_id)
         found_s1001 = search_students(search_term=s1_id, search_by="id")
-        logging.info(f"Found: {[s['full_name'] for s in found_s1001]}")
+        logger.info("Found: %s", [s['full_name'] for s in found_s1001])
         assert any(s['student_id'] == s1_id for s in found_s1001)
     
-    logging.info(f"Searching for 'Smith' by name...")
+    logger.info("Searching for 'Smith' by name...")
     found_smith = search_students(search_term="Smith", search_by="name")
-    logging.info(f"Found: {[s['full_name'] for s in found_smith]}")
+    logger.info("Found: %s", [s['full_name'] for s in found_smith])
     if s2_id: # s2_id corresponds to Jane Smith
       assert any(s['student_id'] == s2_id for s in found_smith)
     
     # Test get_student_details_with_grades
-    logging.info(f"\n--- Testing get_student_details_with_grades ---")
+    logger.info("\n--- Testing get_student_details_with_grades ---")
     if s1_id:
         s1_details_grades = get_student_details_with_grades(s1_id)
         if s1_details_grades:
-            logging.info(f"Details for {s1_id}: {s1_details_grades['details']}")
-            logging.info(f"Grades for {s1_id}: {s1_details_grades['grades']}")
+            logger.info("Details for %s: %s", s1_id, s1_details_grades['details'])
+            logger.info("Grades for %s: %s", s1_id, s1_details_grades['grades'])
             assert s1_details_grades['details']['student_id'] == s1_id
             # Check if grades added earlier for s1_id are present
             if g1_id: # g1_id was for a Math grade for s1_id
                  assert any(g['subject'] == 'Math' for g in s1_details_grades['grades'])
         else:
-            logging.error(f"Could not retrieve details with grades for {s1_id} (UNEXPECTED).")
+            logger.error("Could not retrieve details with grades for %s (UNEXPECTED).", s1_id)
 
 
     if s2_id: # Test with an active (non-graduated) student
         active_grad_record = get_graduated_student_record(s2_id)
         if active_grad_record is None:
-            logging.info(f"Correctly returned None for active student {s2_id} when fetching graduated record.")
+            logger.info("Correctly returned None for active student %s when fetching graduated record.", s2_id)
         else:
-            logging.error(f"Incorrectly retrieved a record for active student {s2_id} as graduated (UNEXPECTED).")
+            logger.error("Incorrectly retrieved a record for active student %s as graduated (UNEXPECTED).", s2_id)
 
     # Test with a non-existent student ID
     non_existent_grad_record = get_graduated_student_record('S9999')
     if non_existent_grad_record is None:
-        logging.info(f"Correctly returned None for non-existent student S9999 when fetching graduated record.")
+        logger.info("Correctly returned None for non-existent student S9999 when fetching graduated record.")
     else:
-        logging.error(f"Incorrectly retrieved a record for non-existent student S9999 (UNEXPECTED).")
+        logger.error("Incorrectly retrieved a record for non-existent student S9999 (UNEXPECTED).")
 
 
     # Clean up: delete the other students if they were added
     if s2_id:
         delete_student(s2_id)
-        logging.info(f"Cleaned up student {s2_id}")
+        logger.info("Cleaned up student %s", s2_id)
     if s3_id:
         delete_student(s3_id) # Clean up the graduated student
-        logging.info(f"Cleaned up student {s3_id}")
+        logger.info("Cleaned up student %s", s3_id)
 
 
-    logging.info("\nExample operations completed. Check 'student_records.db' and logs.")
+    logger.info("\nExample operations completed. Check 'student_records.db' and logs.")
     # To clean up the database file after testing:
     # import os
     # if os.path.exists(DATABASE_NAME):
@@ -0,0 +1,342 @@
+import sqlite3
+import contextlib
+import contextvars
+import logging
+import os
+import queue
+import threading
+
+import db_metrics
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of open connections kept per database file.
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+# Seconds to wait for a free connection before giving up.
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5.0))
+# Prepared statements kept per connection by the sqlite3 module (its default is 128).
+STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 256))
+
+# Named PRAGMA presets applied to every new connection. Order matters:
+# busy_timeout goes first so a journal_mode switch can wait for other writers.
+#   durable  - WAL with a full fsync on every commit; nothing committed is ever lost.
+#   balanced - WAL with fsync only at checkpoints; survives application crashes,
+#              may lose the last transactions on power loss. Recommended default.
+#   fast     - no fsync at all and larger caches; for bulk loads and throwaway copies.
+PRAGMA_PROFILES = {
+    'durable': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -2000,      # negative values are KiB, i.e. ~2 MB
+        'temp_store': 'DEFAULT',
+    },
+    'balanced': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+    },
+    'fast': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,
+        'temp_store': 'MEMORY',
+    },
+}
+
+_pragma_profile_name = os.environ.get('DB_PRAGMA_PROFILE', 'balanced')
+if _pragma_profile_name not in PRAGMA_PROFILES:
+    logger.warning("Unknown DB_PRAGMA_PROFILE '%s', falling back to 'balanced'.", _pragma_profile_name)
+    _pragma_profile_name = 'balanced'
+_pragma_settings = dict(PRAGMA_PROFILES[_pragma_profile_name])
+
+_SYNCHRONOUS_NAMES = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+_TEMP_STORE_NAMES = {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'}
+
+
+def set_pragma_profile(profile: str = 'balanced', **overrides) -> dict:
+    """
+    Selects the PRAGMA preset used for new connections, optionally overriding
+    individual settings (e.g. set_pragma_profile('balanced', mmap_size=0)).
+    Connections that are already open keep their settings until they are replaced.
+    Returns the resulting settings.
+    """
+    global _pragma_profile_name, _pragma_settings
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown PRAGMA profile '{profile}'. Choose from: {', '.join(PRAGMA_PROFILES)}.")
+    for key in overrides:
+        if key not in PRAGMA_PROFILES[profile]:
+            raise ValueError(f"Unsupported PRAGMA override '{key}'.")
+    settings = dict(PRAGMA_PROFILES[profile])
+    settings.update(overrides)
+    _pragma_profile_name = profile
+    _pragma_settings = settings
+    return dict(settings)
+
+
+def get_pragma_profile() -> tuple[str, dict]:
+    """Returns the name and settings of the active PRAGMA profile."""
+    return _pragma_profile_name, dict(_pragma_settings)
+
+
+def apply_pragma_profile(conn: sqlite3.Connection) -> None:
+    """Applies the active PRAGMA profile to a connection."""
+    for pragma, value in _pragma_settings.items():
+        # Values come from the fixed presets or trusted configuration, never from user input
+        conn.execute(f"PRAGMA {pragma} = {value}").fetchall()
+
+
+def get_effective_pragmas(conn: sqlite3.Connection) -> dict:
+    """Reads back the PRAGMA values SQLite actually uses on a connection."""
+    effective = {}
+    for pragma in _pragma_settings:
+        row = conn.execute(f"PRAGMA {pragma}").fetchone()
+        effective[pragma] = row[0] if row else None  # e.g. mmap_size reports nothing for :memory:
+    if 'synchronous' in effective:
+        effective['synchronous'] = _SYNCHRONOUS_NAMES.get(effective['synchronous'], effective['synchronous'])
+    if 'temp_store' in effective:
+        effective['temp_store'] = _TEMP_STORE_NAMES.get(effective['temp_store'], effective['temp_store'])
+    return effective
+
+
+def log_effective_pragmas(conn: sqlite3.Connection, database: str) -> None:
+    """Logs the effective SQLite settings for a database (called once at startup)."""
+    settings = ', '.join(f"{key}={value}" for key, value in get_effective_pragmas(conn).items())
+    logger.info("SQLite settings for %s (profile '%s'): %s", database, _pragma_profile_name, settings)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection used by the pool. While `in_unit_of_work` is set (see
+    database_operations.transaction()), leaving a `with conn:` block neither
+    commits nor rolls back, so the unit of work commits once at its end.
+    """
+    in_unit_of_work = False
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.in_unit_of_work:
+            return False
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+class ConnectionPool:
+    """
+    A bounded pool of SQLite connections for a single database file.
+
+    Connections are configured once when they are opened (row factory and the
+    active PRAGMA profile), health-checked when they are handed out again, and
+    closed when they turn out to be broken. At most `max_size` connections are
+    open at any time; `acquire()` waits up to `timeout` seconds for one to be
+    released.
+    """
+
+    def __init__(self, database: str, max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()  # LIFO keeps the most recently used (warm) connection on top
+        self._lock = threading.Lock()
+        self._open_count = 0
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """Opens a new connection and applies the per-connection setup."""
+        # Connections move between threads through the pool, but each one is
+        # only ever used by the thread that currently holds it.
+        conn = sqlite3.connect(self.database, check_same_thread=False, factory=PooledConnection,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row  # Access columns by name
+        conn.execute("PRAGMA foreign_keys = ON;") # Enforce foreign key constraints
+        apply_pragma_profile(conn)
+        db_metrics.install_trace(conn) # Lets the profiler attribute statements to database_operations calls
+        logger.info("Opened new pooled connection to %s.", self.database)
+        return conn
+
+    @staticmethod
+    def is_healthy(conn: sqlite3.Connection) -> bool:
+        """Returns True if the connection is open and can run a query."""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self) -> sqlite3.Connection:
+        """
+        Returns a healthy connection from the pool, opening a new one if the pool
+        is below its size limit. Raises sqlite3.OperationalError if no connection
+        becomes available within the timeout.
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._open_count < self.max_size
+                    if can_open:
+                        self._open_count += 1
+                if can_open:
+                    try:
+                        return self._create_connection()
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._open_count -= 1
+                        raise
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(
+                        f"Connection pool for {self.database} exhausted "
+                        f"({self.max_size} connections in use).")
+
+            if self.is_healthy(conn):
+                return conn
+            logger.warning("Discarding unhealthy pooled connection to %s.", self.database)
+            self.discard(conn)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Returns a connection to the pool, rolling back any unfinished transaction."""
+        conn.in_unit_of_work = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        self._idle.put(conn)
+
+    def discard(self, conn: sqlite3.Connection) -> None:
+        """Closes a connection and frees its slot in the pool."""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open_count -= 1
+
+    def close_all(self) -> None:
+        """Closes every idle connection. Connections currently in use are not affected."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+# Database file that the current request, thread or asyncio task is routed to
+# (e.g. one school's database, see tenants.py). None means the module default.
+_routed_database = contextvars.ContextVar('routed_database', default=None)
+
+
+def resolve_database(default: str) -> str:
+    """Returns the database the current context is routed to, or `default` if none is set."""
+    return _routed_database.get() or default
+
+
+def route_database(database: str | None) -> contextvars.Token:
+    """
+    Routes connections in the current context to `database` until reset_route()
+    is called with the returned token (e.g. in a Flask teardown handler).
+    """
+    return _routed_database.set(database)
+
+
+def reset_route(token: contextvars.Token) -> None:
+    """Undoes a route_database() call."""
+    _routed_database.reset(token)
+
+
+@contextlib.contextmanager
+def use_database(database: str):
+    """Routes connections in this block to `database`."""
+    token = route_database(database)
+    try:
+        yield database
+    finally:
+        reset_route(token)
+
+
+def get_pool(database: str) -> ConnectionPool:
+    """Returns the connection pool for a database file, creating it on first use."""
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            pool = ConnectionPool(database)
+            _pools[database] = pool
+        return pool
+
+
+def _bound_connections() -> dict:
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = {}
+        _local.connections = connections
+    return connections
+
+
+def get_connection(database: str) -> sqlite3.Connection:
+    """
+    Returns the connection bound to the current thread for `database`.
+
+    The first call in a thread (or request) checks a connection out of the pool;
+    later calls reuse it until release_connections() hands it back. This keeps
+    the PRAGMA setup to once per connection instead of once per query.
+    """
+    connections = _bound_connections()
+    conn = connections.get(database)
+    if conn is not None:
+        try:
+            conn.total_changes  # Cheap check that the connection was not closed by the caller
+            return conn
+        except sqlite3.ProgrammingError:
+            get_pool(database).discard(conn)
+    conn = get_pool(database).acquire()
+    connections[database] = conn
+    return conn
+
+
+def detach_connection(database: str) -> sqlite3.Connection:
+    """
+    Returns a pooled connection owned by the caller rather than the current thread,
+    for work that outlives the request (e.g. streamed responses). The thread's bound
+    connection is handed over if there is one, otherwise a connection is checked out.
+    The caller must give it back with get_pool(database).release(conn).
+    """
+    conn = _bound_connections().pop(database, None)
+    if conn is not None:
+        try:
+            conn.total_changes
+            return conn
+        except sqlite3.ProgrammingError:
+            get_pool(database).discard(conn)
+    return get_pool(database).acquire()
+
+
+def release_connections(exception=None) -> None:
+    """
+    Returns every connection bound to the current thread to its pool.
+    Registered as a Flask teardown handler so each request gives its
+    connections back when it finishes.
+    """
+    connections = _bound_connections()
+    while connections:
+        database, conn = connections.popitem()
+        get_pool(database).release(conn)
+
+
+def close_all_pools() -> None:
+    """Releases this thread's connections and closes all idle pooled connections."""
+    release_connections()
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
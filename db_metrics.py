@@ -0,0 +1,260 @@
+"""
+Profiling for the database layer.
+
+Functions decorated with @timed record call counts, latency (p50/p95/p99 over
+the most recent calls), rows returned and the number of SQL statements they
+ran. Statements are seen through sqlite3's set_trace_callback(), installed on
+every pooled connection by db_connection. A call slower than SLOW_QUERY_MS is
+logged as a warning together with its statements and their EXPLAIN QUERY PLAN.
+
+render_prometheus() formats everything in the Prometheus text exposition
+format for the app's /metrics route.
+"""
+import functools
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.environ.get('DB_PROFILING', '1').lower() not in ('0', 'false', 'no', 'off')
+# Calls slower than this are logged with their statements and query plans.
+SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', 200))
+# Latest call durations kept per function for the percentiles.
+LATENCY_WINDOW = 1024
+# Statements remembered per call for the slow-call log.
+MAX_TRACED_STATEMENTS = 20
+QUANTILES = (0.5, 0.95, 0.99)
+
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+# Literals are replaced before statements are logged, so student data stays out of the logs
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+_local = threading.local()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class _FunctionStats:
+    __slots__ = ('calls', 'exceptions', 'rows', 'statements', 'slow_calls', 'total_seconds', 'recent')
+
+    def __init__(self):
+        self.calls = 0
+        self.exceptions = 0
+        self.rows = 0
+        self.statements = 0
+        self.slow_calls = 0
+        self.total_seconds = 0.0
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+
+
+class _Call:
+    """Statements traced while one @timed call is running on this thread."""
+    __slots__ = ('statements', 'count')
+
+    def __init__(self):
+        self.statements = []  # (connection weakref, expanded SQL)
+        self.count = 0
+
+
+def normalize_sql(sql: str) -> str:
+    """Replaces literal values in an expanded statement with '?' and collapses whitespace."""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    return ' '.join(sql.split())
+
+
+def _trace(conn_ref, sql: str) -> None:
+    calls = getattr(_local, 'calls', None)
+    if not calls or getattr(_local, 'explaining', False):
+        return
+    if sql.startswith('--') or sql == 'SELECT 1':
+        return # Statements run inside virtual tables (FTS5), and the pool's health check
+    call = calls[-1]
+    call.count += 1
+    if len(call.statements) < MAX_TRACED_STATEMENTS:
+        call.statements.append((conn_ref, sql))
+
+
+def install_trace(conn: sqlite3.Connection) -> None:
+    """Lets @timed calls see the statements run on `conn` (called when the pool opens a connection)."""
+    if PROFILING_ENABLED:
+        conn_ref = weakref.ref(conn)
+        conn.set_trace_callback(lambda sql: _trace(conn_ref, sql))
+
+
+def count_rows(result) -> int:
+    """Rows returned by a database function: list length, the 'students' of a page, 1 for a single record."""
+    if result is None or result is False:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    if isinstance(result, dict) and isinstance(result.get('students'), list):
+        return len(result['students'])
+    return 1
+
+
+def _explain(conn_ref, sql: str) -> str:
+    conn = conn_ref()
+    if conn is None:
+        return '(connection closed)'
+    _local.explaining = True
+    try:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        return '; '.join(row[3] for row in plan) or '(no plan)'
+    except sqlite3.Error as e:
+        return f"(unavailable: {e})"
+    finally:
+        _local.explaining = False
+
+
+def _log_slow_call(name: str, seconds: float, call: _Call) -> None:
+    lines = [f"Slow database call {name}: {seconds * 1000:.1f} ms, {call.count} statements."]
+    seen = set()
+    for conn_ref, sql in call.statements:
+        normalized = normalize_sql(sql)
+        if normalized in seen:
+            continue
+        seen.add(normalized)
+        lines.append(f"  SQL: {normalized}")
+        if sql.lstrip().split(None, 1)[0].upper() in _EXPLAINABLE:
+            lines.append(f"  QUERY PLAN: {_explain(conn_ref, sql)}")
+    logger.warning('\n'.join(lines))
+
+
+def _record(name: str, seconds: float, call: _Call, rows: int, failed: bool) -> None:
+    with _stats_lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = _FunctionStats()
+        stats.calls += 1
+        stats.exceptions += failed
+        stats.rows += rows
+        stats.statements += call.count
+        stats.total_seconds += seconds
+        stats.recent.append(seconds)
+        slow = seconds * 1000 >= SLOW_QUERY_MS
+        stats.slow_calls += slow
+    if slow and logger.isEnabledFor(logging.WARNING):
+        _log_slow_call(name, seconds, call)  # Skips the EXPLAINs when the warning would be dropped
+
+
+def timed(func):
+    """Decorator recording latency, rows returned and statements of every call to `func`."""
+    if not PROFILING_ENABLED:
+        return func
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        calls = getattr(_local, 'calls', None)
+        if calls is None:
+            calls = _local.calls = []
+        call = _Call()
+        calls.append(call)
+        started = time.perf_counter()
+        failed = True
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            calls.pop()
+            if calls:
+                # Nested calls count towards their caller too
+                caller = calls[-1]
+                caller.count += call.count
+                caller.statements.extend(call.statements[:MAX_TRACED_STATEMENTS - len(caller.statements)])
+            _record(name, seconds, call, count_rows(result), failed)
+    return wrapper
+
+
+def _quantile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def get_call_stats() -> dict:
+    """
+    Returns per-function statistics:
+    {'get_student_by_id': {'calls', 'exceptions', 'rows', 'statements', 'slow_calls',
+                           'total_seconds', 'p50', 'p95', 'p99'}, ...}
+    Percentiles are in seconds over the last LATENCY_WINDOW calls.
+    """
+    with _stats_lock:
+        snapshot = {name: (stats, sorted(stats.recent)) for name, stats in _stats.items()}
+        result = {}
+        for name, (stats, recent) in sorted(snapshot.items()):
+            entry = {'calls': stats.calls, 'exceptions': stats.exceptions, 'rows': stats.rows,
+                     'statements': stats.statements, 'slow_calls': stats.slow_calls,
+                     'total_seconds': round(stats.total_seconds, 6)}
+            for q in QUANTILES:
+                entry[f"p{round(q * 100)}"] = round(_quantile(recent, q), 6)
+            result[name] = entry
+        return result
+
+
+def reset_call_stats() -> None:
+    """Clears all recorded calls."""
+    with _stats_lock:
+        _stats.clear()
+
+
+# --- Prometheus text format ---
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_sample(name: str, labels: dict, value) -> str:
+    label_text = ','.join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+    return f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}"
+
+
+def family(name: str, metric_type: str, help_text: str, samples) -> list[str]:
+    """
+    Formats one metric family. `samples` is an iterable of (labels dict, value)
+    or (name suffix, labels dict, value) tuples.
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for sample in samples:
+        suffix, labels, value = sample if len(sample) == 3 else ('', *sample)
+        lines.append(_format_sample(name + suffix, labels, value))
+    return lines
+
+
+def render_prometheus(extra_families=()) -> str:
+    """
+    Returns the database call metrics (and any `extra_families` built with
+    family()) in the Prometheus text exposition format.
+    """
+    stats = get_call_stats()
+    lines = []
+    latency = []
+    for name, entry in stats.items():
+        for q in QUANTILES:
+            latency.append(('', {'function': name, 'quantile': str(q)}, entry[f"p{round(q * 100)}"]))
+        latency.append(('_sum', {'function': name}, entry['total_seconds']))
+        latency.append(('_count', {'function': name}, entry['calls']))
+    lines += family('db_call_duration_seconds', 'summary', 'Latency of database_operations/auth calls.', latency)
+    for metric, key, help_text in (
+            ('db_call_rows_total', 'rows', 'Rows returned by database calls.'),
+            ('db_call_statements_total', 'statements', 'SQL statements executed by database calls.'),
+            ('db_call_exceptions_total', 'exceptions', 'Database calls that raised an exception.'),
+            ('db_call_slow_total', 'slow_calls', f'Database calls slower than {SLOW_QUERY_MS:g} ms.')):
+        lines += family(metric, 'counter', help_text,
+                        [({'function': name}, entry[key]) for name, entry in stats.items()])
+    for extra in extra_families:
+        lines += extra
+    return '\n'.join(lines) + '\n'
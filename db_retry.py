@@ -0,0 +1,161 @@
+"""
+Retry policy for transient SQLite lock contention ('database is locked',
+'database table is locked', SQLITE_BUSY/SQLITE_LOCKED).
+
+busy_timeout (see db_connection.PRAGMA_PROFILES) already makes SQLite wait for
+the write lock, but some conflicts are reported at once without waiting, e.g.
+a transaction that started as a reader and can no longer upgrade to a writer,
+and a timeout under a burst of writers is not permanent either. Functions
+decorated with @retry_on_busy are re-run with bounded exponential backoff and
+full jitter:
+
+    @db_retry.retry_on_busy
+    def update_student(...):
+        try:
+            with conn:
+                ...
+        except sqlite3.Error as e:
+            db_retry.raise_if_retryable(e)
+            logging.error(...)
+            return False
+
+raise_if_retryable() hands a transient error to the decorator while attempts
+and time budget are left; on the last attempt it returns and the function's
+usual error handling runs. Calls that run inside a caller's transaction
+(`tx=` given) are not retried, because one statement cannot be replayed on
+its own; the transaction's owner has to retry the whole unit.
+
+Retries, time spent waiting and eventual failures are counted per function
+(get_retry_stats()).
+"""
+import functools
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Attempts per call, including the first one.
+RETRY_ATTEMPTS = int(os.environ.get('DB_RETRY_ATTEMPTS', 5))
+# Backoff before retry n is a random delay in [0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**(n-1))].
+RETRY_BASE_DELAY = float(os.environ.get('DB_RETRY_BASE_DELAY', 0.05))
+RETRY_MAX_DELAY = float(os.environ.get('DB_RETRY_MAX_DELAY', 1.0))
+# No retry is started once a call has been running for this many seconds in total.
+RETRY_BUDGET = float(os.environ.get('DB_RETRY_BUDGET', 10.0))
+
+_TRANSIENT_CODES = {5, 6}  # SQLITE_BUSY, SQLITE_LOCKED
+_TRANSIENT_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')
+
+_local = threading.local()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Returns True if `error` is lock contention that may succeed when retried."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in _TRANSIENT_CODES  # Extended codes such as SQLITE_BUSY_SNAPSHOT keep the primary code
+    message = str(error).lower()
+    return any(text in message for text in _TRANSIENT_MESSAGES)
+
+
+def raise_if_retryable(error: BaseException) -> None:
+    """
+    Called first in an `except sqlite3.Error` handler of a @retry_on_busy
+    function: re-raises `error` if it is transient and the call will be retried.
+    Otherwise it returns, so the handler can report the failure as usual.
+    """
+    if not is_transient_error(error):
+        return
+    if getattr(_local, 'retry_allowed', False):
+        raise error
+    _local.gave_up = True
+
+
+def _backoff_delay(retry: int) -> float:
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (retry - 1)))
+
+
+def _record(name: str, **counts) -> None:
+    with _stats_lock:
+        stats = _stats.setdefault(name, {'calls': 0, 'retries': 0, 'retry_wait_seconds': 0.0,
+                                         'recovered': 0, 'failures': 0})
+        for key, value in counts.items():
+            stats[key] += value
+
+
+def call_with_retry(func, *args, name: str | None = None, **kwargs):
+    """Calls `func(*args, **kwargs)` under the retry policy and returns its result (see module docstring)."""
+    name = name or getattr(func, '__qualname__', repr(func))
+    started = time.monotonic()
+    attempt = 0
+    previous = (getattr(_local, 'retry_allowed', False), getattr(_local, 'gave_up', False))
+    try:
+        while True:
+            attempt += 1
+            delay = _backoff_delay(attempt)
+            allowed = attempt < RETRY_ATTEMPTS and time.monotonic() - started + delay <= RETRY_BUDGET
+            _local.retry_allowed, _local.gave_up = allowed, False
+            try:
+                result = func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_transient_error(e):
+                    raise
+                if not allowed:
+                    _record(name, calls=1, failures=1)
+                    logger.error("%s failed after %s attempts on lock contention: %s", name, attempt, e)
+                    raise
+                _record(name, retries=1, retry_wait_seconds=delay)
+                logger.warning("%s hit lock contention (%s); retry %s in %.0f ms.", name, e, attempt, delay * 1000)
+                time.sleep(delay)
+                continue
+            if _local.gave_up:
+                # The function reported the transient error itself on its last attempt
+                _record(name, calls=1, failures=1)
+                logger.error("%s failed after %s attempts on lock contention.", name, attempt)
+            else:
+                _record(name, calls=1, recovered=1 if attempt > 1 else 0)
+            return result
+    finally:
+        _local.retry_allowed, _local.gave_up = previous
+
+
+def retry_on_busy(func):
+    """Decorator applying call_with_retry() to every call that does not run in a caller's transaction."""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if kwargs.get('tx') is not None:
+            previous = getattr(_local, 'retry_allowed', False)
+            _local.retry_allowed = False
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _local.retry_allowed = previous
+        return call_with_retry(func, *args, name=name, **kwargs)
+    return wrapper
+
+
+def get_retry_stats() -> dict:
+    """
+    Returns the counters per function name:
+    {'calls', 'retries', 'retry_wait_seconds', 'recovered', 'failures'}.
+    'recovered' counts calls that succeeded after at least one retry, 'failures'
+    calls that still hit lock contention on their last attempt.
+    """
+    with _stats_lock:
+        return {name: dict(stats, retry_wait_seconds=round(stats['retry_wait_seconds'], 3))
+                for name, stats in sorted(_stats.items())}
+
+
+def reset_retry_stats() -> None:
+    """Clears all counters."""
+    with _stats_lock:
+        _stats.clear()
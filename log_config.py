@@ -0,0 +1,147 @@
+"""
+Logging setup for the app, applied once at startup by configure_logging().
+
+Loggers are per module (logging.getLogger(__name__)) and messages use lazy
+%-style arguments, so a message below its logger's level costs one level check
+and is never formatted. Records that pass are handed to a QueueHandler; a
+QueueListener thread writes them to stderr, so request handling never blocks
+on the output stream.
+
+Settings (environment):
+
+    LOG_LEVEL=INFO                                      root level
+    LOG_LEVELS=database_operations=WARNING,auth=DEBUG   levels per module logger
+    LOG_SAMPLE_RATE=0.1                                 keep 10% of INFO/DEBUG records
+
+Sampling only drops routine messages ("Student S001 added successfully.");
+warnings and errors are always kept.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+# Fraction of INFO and DEBUG records kept; 1 keeps all of them.
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+
+logger = logging.getLogger(__name__)
+
+_listener = None
+_queue_handler = None
+_configure_lock = threading.Lock()
+
+
+class SuccessSampler(logging.Filter):
+    """Passes every WARNING and above, and a random `rate` fraction of INFO and DEBUG records."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.rate >= 1 or random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+def parse_level(value) -> int | None:
+    """Returns the numeric level for a name such as 'warning' or a number such as '30', or None if invalid."""
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value.upper())
+    return level if isinstance(level, int) else None
+
+
+def parse_module_levels(text: str) -> tuple[dict, list]:
+    """
+    Parses 'module=LEVEL,module=LEVEL' into ({'module': level, ...}, [invalid entries]).
+    """
+    levels = {}
+    invalid = []
+    for entry in filter(None, (part.strip() for part in text.split(','))):
+        name, _, value = entry.partition('=')
+        level = parse_level(value) if name.strip() else None
+        if level is None:
+            invalid.append(entry)
+        else:
+            levels[name.strip()] = level
+    return levels, invalid
+
+
+def configure_logging(level=None, module_levels=None, sample_rate: float | None = None,
+                      stream=None) -> logging.handlers.QueueListener:
+    """
+    Installs the queue-based logging pipeline on the root logger and returns
+    its listener. Only the first call configures anything; later calls return
+    the running listener.
+
+    Args:
+        level: Root level (name or number). Defaults to LOG_LEVEL.
+        module_levels: {'logger name': level} overrides. Defaults to LOG_LEVELS.
+        sample_rate: Fraction of INFO/DEBUG records kept. Defaults to LOG_SAMPLE_RATE.
+        stream: Output stream of the listener. Defaults to sys.stderr.
+    """
+    global _listener, _queue_handler
+    with _configure_lock:
+        if _listener is not None:
+            return _listener
+
+        invalid = []
+        root_level = parse_level(LOG_LEVEL if level is None else level)
+        if root_level is None:
+            invalid.append(f"LOG_LEVEL={LOG_LEVEL if level is None else level}")
+            root_level = logging.INFO
+        if module_levels is None:
+            module_levels, invalid_modules = parse_module_levels(LOG_LEVELS)
+            invalid += invalid_modules
+        rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(logging.Formatter(LOG_FORMAT))
+        _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        _queue_handler.addFilter(SuccessSampler(rate))
+
+        root = logging.getLogger()
+        root.setLevel(root_level)
+        root.addHandler(_queue_handler)
+        for name, module_level in module_levels.items():
+            logging.getLogger(name).setLevel(parse_level(module_level) or root_level)
+
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+    for entry in invalid:
+        logger.warning("Ignoring invalid log level setting '%s'.", entry)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Writes out the queued records, stops the listener and removes the queue handler from the root logger."""
+    global _listener, _queue_handler
+    with _configure_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener = None
+        _queue_handler = None
+
+
+def get_logging_stats() -> dict:
+    """Returns {'configured', 'sample_rate', 'sampled_out'}; 'sampled_out' counts records dropped by sampling."""
+    with _configure_lock:
+        if _queue_handler is None:
+            return {'configured': False, 'sample_rate': 1.0, 'sampled_out': 0}
+        sampler = next(f for f in _queue_handler.filters if isinstance(f, SuccessSampler))
+        return {'configured': True, 'sample_rate': sampler.rate, 'sampled_out': sampler.dropped}
@@ -0,0 +1,130 @@
+import operator
+
+
+class Record(tuple):
+    """
+    Compact, immutable row object returned by the list queries in database_operations.
+
+    A record is a tuple of the column values (like a namedtuple, with no per-row
+    dict), yet it reads like the dictionaries the queries used to return:
+    record['full_name'], record.get(...), keys()/values()/items(), `'field' in
+    record`, dict(record) and equality with a plain dict all work, and Jinja
+    templates can use record.full_name. Positional access (record[0]) and
+    iteration yield the values, as for any tuple.
+
+    Subclasses list their columns in `_fields`, in SELECT order; an attribute is
+    generated for each.
+
+    The json module writes tuples, including records, as arrays. Pass data
+    holding records through jsonable() before serializing it (the Flask app's
+    JSON provider does this for jsonify()).
+    """
+    __slots__ = ()
+    _fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for index, name in enumerate(cls._fields):
+            setattr(cls, name, property(operator.itemgetter(index), doc=f"Alias for field {index}"))
+        cls._index = {name: index for index, name in enumerate(cls._fields)}
+
+    def __new__(cls, *values, **named):
+        if len(values) > len(cls._fields):
+            raise TypeError(f"{cls.__name__} takes at most {len(cls._fields)} values")
+        values += tuple(named.pop(name, None) for name in cls._fields[len(values):])
+        if named:
+            raise TypeError(f"Unknown {cls.__name__} field(s): {', '.join(named)}")
+        return tuple.__new__(cls, values)
+
+    @classmethod
+    def from_row(cls, cursor, row: tuple):
+        """sqlite3 row factory; the query must select the columns in `_fields` order."""
+        return tuple.__new__(cls, row)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return tuple.__new__(cls, (data.get(name) for name in cls._fields))
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key: str, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def to_dict(self) -> dict:
+        return dict(zip(self._fields, self))
+
+    _asdict = to_dict  # namedtuple spelling
+
+    def replace(self, **changes):
+        """Returns a copy with some fields changed (records are immutable)."""
+        values = tuple(changes.pop(name, value) for name, value in zip(self._fields, self))
+        if changes:
+            raise TypeError(f"Unknown {type(self).__name__} field(s): {', '.join(changes)}")
+        return tuple.__new__(type(self), values)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = tuple.__hash__
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self  # Immutable and made of SQLite scalars, so it can be shared
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={value!r}" for name, value in zip(self._fields, self))
+        return f"{type(self).__name__}({fields})"
+
+
+class Student(Record):
+    """A row of the students table."""
+    __slots__ = ()
+    _fields = ('student_id', 'full_name', 'date_of_birth', 'gender', 'address',
+               'phone_number', 'email', 'enrollment_year', 'graduation_year', 'status')
+
+
+class Grade(Record):
+    """A row of the student_grades table."""
+    __slots__ = ()
+    _fields = ('grade_id', 'student_id', 'year_level', 'subject', 'grade')
+
+
+def jsonable(value):
+    """Returns `value` with every Record in it, at any depth of dicts, lists and tuples, turned into a dict."""
+    if isinstance(value, Record):
+        return {name: jsonable(item) for name, item in zip(value._fields, value)}
+    if isinstance(value, dict):
+        return {key: jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    return value
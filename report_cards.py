@@ -0,0 +1,171 @@
+import concurrent.futures
+import datetime
+import itertools
+import logging
+import os
+import re
+import time
+import zipfile
+
+import jinja2
+
+import database_operations as db_ops
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+# Graduates get a transcript, everyone else a report card
+DOCUMENT_TEMPLATES = {
+    'report_card': 'report_card.html',
+    'transcript': 'transcript.html',
+}
+SCHOOL_NAME = os.environ.get('SCHOOL_NAME', 'Student Records')
+# Worker processes used by render_documents(); defaults to one per core.
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1))
+# Students sent to a worker at a time. Larger batches mean less inter-process
+# overhead, smaller ones smoother progress reporting.
+RENDER_BATCH_SIZE = 50
+
+_environment = None
+
+
+def _get_environment() -> jinja2.Environment:
+    """Returns the Jinja environment for document templates (one per process)."""
+    global _environment
+    if _environment is None:
+        _environment = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+                                          autoescape=jinja2.select_autoescape(['html']))
+    return _environment
+
+
+def pdf_available() -> bool:
+    """Returns True if WeasyPrint (the optional PDF renderer) is installed."""
+    try:
+        import weasyprint  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def document_kind(details: dict) -> str:
+    """Returns 'transcript' for graduates and 'report_card' for everyone else."""
+    return 'transcript' if details.get('status') == 'graduated' else 'report_card'
+
+
+def render_document(student: dict, pdf: bool = False, generated_on: str | None = None) -> tuple[str, bytes]:
+    """
+    Renders one report card or transcript.
+
+    Args:
+        student (dict): {'details': {...}, 'grades': [...]} as yielded by
+                        database_operations.iter_register_students().
+        pdf (bool): Convert the HTML to PDF (requires WeasyPrint).
+        generated_on (str | None): Date printed on the document; defaults to today.
+
+    Returns:
+        tuple[str, bytes]: The file name inside the archive and the document contents.
+    """
+    details = student['details']
+    kind = document_kind(details)
+    # Grades arrive ordered by year level, so they can be grouped without sorting
+    grades_by_year = [(year_level, list(grades)) for year_level, grades
+                      in itertools.groupby(student['grades'], key=lambda grade: grade['year_level'])]
+    html = _get_environment().get_template(DOCUMENT_TEMPLATES[kind]).render(
+        details=details, grades_by_year=grades_by_year, school_name=SCHOOL_NAME,
+        generated_on=generated_on or datetime.date.today().isoformat())
+    safe_id = re.sub(r'[^\w.-]', '_', str(details['student_id']))
+    if pdf:
+        from weasyprint import HTML
+        return f"{kind}s/{safe_id}.pdf", HTML(string=html).write_pdf()
+    return f"{kind}s/{safe_id}.html", html.encode('utf-8')
+
+
+def _render_batch(students: list, pdf: bool, generated_on: str) -> list:
+    """
+    Worker entry point: renders a batch of students. Returns (name, data, None)
+    per document, or (None, None, error) with the student ID for failures.
+    """
+    results = []
+    for student in students:
+        try:
+            name, data = render_document(student, pdf=pdf, generated_on=generated_on)
+            results.append((name, data, None))
+        except Exception as e:
+            results.append((None, None, {'student_id': student['details']['student_id'], 'error': str(e)}))
+    return results
+
+
+def render_documents(output, status: str | None = None, enrollment_year: int | None = None,
+                     pdf: bool = False, workers: int | None = None, batch_size: int = RENDER_BATCH_SIZE,
+                     progress=None) -> dict:
+    """
+    Renders report cards/transcripts for every matching student into a zip archive.
+
+    Student and grade data is streamed once from the register export query and
+    sent to a process pool in batches; finished documents are written to the zip
+    as they arrive, and at most a few batches per worker are in flight, so memory
+    use does not grow with the number of students.
+
+    Args:
+        output: Path or writable binary file object for the zip (it does not need to be seekable).
+        status (str | None): Only students with this status (e.g. 'active', 'graduated').
+        enrollment_year (int | None): Only students of this enrollment year.
+        pdf (bool): Render PDF instead of HTML (requires WeasyPrint).
+        workers (int | None): Worker processes; defaults to RENDER_WORKERS. 1 renders in this process.
+        batch_size (int): Students per worker task.
+        progress (callable | None): Called as progress(documents_done, elapsed_seconds) after each batch.
+
+    Returns:
+        dict: {'documents': int, 'errors': [{'student_id', 'error'}, ...], 'seconds': float,
+               'documents_per_second': float, 'workers': int, 'format': 'html' | 'pdf'}
+    """
+    if pdf and not pdf_available():
+        raise RuntimeError("PDF output requires WeasyPrint (pip install weasyprint).")
+    workers = max(1, int(workers or RENDER_WORKERS))
+    batch_size = max(1, int(batch_size))
+    generated_on = datetime.date.today().isoformat()
+    students = db_ops.iter_register_students(status=status, enrollment_year=enrollment_year)
+    batches = iter(lambda: list(itertools.islice(students, batch_size)), [])
+
+    report = {'documents': 0, 'errors': [], 'seconds': 0.0, 'documents_per_second': 0.0,
+              'workers': workers, 'format': 'pdf' if pdf else 'html'}
+    started = time.perf_counter()
+    # PDFs are already compressed
+    compression = zipfile.ZIP_STORED if pdf else zipfile.ZIP_DEFLATED
+
+    try:
+        with zipfile.ZipFile(output, 'w', compression=compression) as archive:
+            def write(results):
+                for name, data, error in results:
+                    if error:
+                        report['errors'].append(error)
+                    else:
+                        archive.writestr(name, data)
+                        report['documents'] += 1
+                if progress:
+                    progress(report['documents'], time.perf_counter() - started)
+
+            if workers == 1:
+                for batch in batches:
+                    write(_render_batch(batch, pdf, generated_on))
+            else:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                    pending = set()
+                    for batch in batches:
+                        pending.add(pool.submit(_render_batch, batch, pdf, generated_on))
+                        if len(pending) >= workers * 2:
+                            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                            for future in done:
+                                write(future.result())
+                    for future in concurrent.futures.as_completed(pending):
+                        write(future.result())
+    finally:
+        students.close() # Returns the export connection if rendering stopped early
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    if report['seconds']:
+        report['documents_per_second'] = round(report['documents'] / report['seconds'], 1)
+    logger.info("Rendered %s documents (%s failed) in %ss with %s workers, %s documents/sec.",
+                report['documents'], len(report['errors']), report['seconds'], workers,
+                report['documents_per_second'])
+    return report
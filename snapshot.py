@@ -0,0 +1,232 @@
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds between snapshot refreshes; 0 disables snapshots (reads go to the live database).
+SNAPSHOT_REFRESH_SECONDS = float(os.environ.get('SNAPSHOT_REFRESH_SECONDS', 300))
+# Directory for snapshot files; defaults to the directory of the database they copy.
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR') or None
+
+# Suffix of snapshot files after the database name: '.snapshot-<pid>-<generation>[.partial]'
+_SNAPSHOT_SUFFIX = re.compile(r"\.snapshot-(\d+)-\d+(?:\.partial)?")
+
+
+def _process_alive(pid: int) -> bool:
+    """True unless process `pid` is known to have exited."""
+    if pid == os.getpid() or os.name == 'nt':
+        return True  # os.kill() cannot probe a process on Windows; leave its files alone
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # e.g. PermissionError: it exists but belongs to another user
+    return True
+
+
+class Snapshot:
+    """
+    A periodically refreshed, read-only copy of a database file, for read-heavy
+    public traffic that should not compete with writers on the live file.
+
+    Each refresh copies the database with the sqlite3 backup API into a new file
+    and switches readers over to it; files are never modified after they are
+    written, so readers open them with `mode=ro&immutable=1`, which skips all
+    locking and change detection. Readers get a per-thread connection from
+    connection(). When the snapshot is older than `refresh_interval` the next
+    reader starts a refresh in the background and keeps using the current copy
+    until the new one is ready; only the very first read waits for a copy.
+
+    The previous copy is kept until the next refresh, so a reader that looked up
+    the path just before a switch can still open it.
+    """
+
+    def __init__(self, database: str, refresh_interval: float = SNAPSHOT_REFRESH_SECONDS,
+                 directory: str | None = SNAPSHOT_DIR):
+        self.database = database
+        self.refresh_interval = refresh_interval
+        self.directory = directory or os.path.dirname(os.path.abspath(database))
+        self.generation = 0
+        self.taken_at = None  # Wall-clock time of the current copy, for display
+        self.refreshes = 0
+        self.failures = 0
+        self._path = None
+        self._previous_path = None
+        self._taken_monotonic = None
+        self._refreshing = False  # A background refresh has been started
+        self._lock = threading.Lock()  # Guards the fields describing the current copy
+        self._refresh_lock = threading.Lock()  # At most one copy is being made at a time
+        self._local = threading.local()
+        self._remove_leftovers()
+
+    def _remove_leftovers(self) -> None:
+        """Deletes copies of this database left behind by app processes that have exited (e.g. after a crash)."""
+        prefix = os.path.basename(self.database)
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            match = _SNAPSHOT_SUFFIX.fullmatch(name[len(prefix):]) if name.startswith(prefix) else None
+            if match and not _process_alive(int(match.group(1))):
+                logger.info("Removing snapshot file %s left by an earlier process.", name)
+                self._remove(os.path.join(self.directory, name))
+
+    def _new_path(self) -> str:
+        # The process ID keeps copies made by different app workers apart
+        name = f"{os.path.basename(self.database)}.snapshot-{os.getpid()}-{self.generation + 1}"
+        return os.path.join(self.directory, name)
+
+    def refresh(self) -> None:
+        """
+        Takes a new copy of the database and switches readers to it. Blocks
+        while another refresh is running. Raises sqlite3.Error if the copy fails;
+        readers then keep using the previous copy.
+        """
+        with self._refresh_lock:
+            self._take_copy()
+
+    def _take_copy(self) -> None:
+        """Copies the database into a new snapshot file. Called with _refresh_lock held."""
+        started = time.perf_counter()
+        path = self._new_path()
+        partial_path = path + '.partial'
+        source = sqlite3.connect(self.database, timeout=5.0)
+        target = sqlite3.connect(partial_path)
+        try:
+            # One step: in WAL mode that is a single read transaction, which does not
+            # block writers, whereas a stepped copy restarts whenever someone commits
+            source.backup(target)
+            # The copy inherits WAL mode from the source; immutable readers need a plain file
+            target.execute("PRAGMA journal_mode = DELETE").fetchall()
+            target.close()
+            os.replace(partial_path, path)
+        except (sqlite3.Error, OSError):
+            target.close()
+            self._remove(partial_path)
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            source.close()
+
+        with self._lock:
+            expired, self._previous_path = self._previous_path, self._path
+            self._path = path
+            self.generation += 1
+            self.refreshes += 1
+            self.taken_at = time.time()
+            self._taken_monotonic = time.monotonic()
+        if expired:
+            # Two generations old: readers have switched or still hold it open (which keeps it readable)
+            self._remove(expired)
+        logger.info("Refreshed read-only snapshot of %s (generation %s) in %.3fs.",
+                    self.database, self.generation, time.perf_counter() - started)
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except (sqlite3.Error, OSError) as e:
+            logger.error("Refreshing the snapshot of %s failed, serving the previous copy: %s", self.database, e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def age(self) -> float | None:
+        """Seconds since the current copy was taken, or None if there is none yet."""
+        with self._lock:
+            if self._taken_monotonic is None:
+                return None
+            return time.monotonic() - self._taken_monotonic
+
+    def _current_path(self) -> str:
+        """Returns the current copy, taking the first one or starting a background refresh when due."""
+        with self._lock:
+            path = self._path
+            due = (path is not None and not self._refreshing
+                   and time.monotonic() - self._taken_monotonic >= self.refresh_interval)
+            if due:
+                self._refreshing = True
+        if path is None:
+            with self._refresh_lock:
+                if self._path is None: # Another reader may have taken it while we waited
+                    self._take_copy()
+                return self._path
+        if due:
+            threading.Thread(target=self._refresh_in_background, name='snapshot-refresh', daemon=True).start()
+        return path
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns this thread's read-only connection to the current copy, reopening
+        it after a refresh. Rows are sqlite3.Row objects, as with pooled connections.
+        """
+        path = self._current_path()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.path == path:
+            return conn
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        try:
+            conn = self._open(path)
+        except sqlite3.OperationalError:
+            # Refreshes overtook this reader and deleted the copy it was about to open
+            path = self._current_path()
+            conn = self._open(path)
+        conn.row_factory = sqlite3.Row
+        self._local.conn, self._local.path = conn, path
+        return conn
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        return sqlite3.connect(f"{pathlib.Path(path).as_uri()}?mode=ro&immutable=1", uri=True)
+
+    def status(self) -> dict:
+        """
+        Returns {'taken_at': float | None, 'age_seconds': float | None,
+                 'refresh_interval': float, 'stale': bool, 'generation': int,
+                 'refreshes': int, 'failures': int}.
+        'stale' means the copy is older than the refresh interval (a refresh is
+        in progress or has been failing) or has not been taken yet.
+        """
+        age = self.age()
+        with self._lock:
+            return {
+                'taken_at': self.taken_at,
+                'age_seconds': round(age, 3) if age is not None else None,
+                'refresh_interval': self.refresh_interval,
+                'stale': age is None or age >= self.refresh_interval,
+                'generation': self.generation,
+                'refreshes': self.refreshes,
+                'failures': self.failures,
+            }
+
+    def close(self) -> None:
+        """Closes this thread's reader and deletes the current and previous copies (e.g. at shutdown)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        with self._refresh_lock, self._lock:
+            paths = (self._path, self._previous_path)
+            self._path = self._previous_path = None
+            self._taken_monotonic = None
+        for path in filter(None, paths):
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # e.g. still open by a reader on Windows; the file is left behind
+            logger.warning("Could not remove snapshot file %s: %s", path, e)
@@ -0,0 +1,183 @@
+"""
+Multi-school tenancy: each school (tenant) has its own SQLite database file in
+TENANT_DATA_DIR, so schools do not share a writer lock, and db_connection keeps
+a separate connection pool per file.
+
+Requests are routed to a school's database with use_tenant() (or, in the Flask
+app, per request from the subdomain or the logged-in user's school); all of
+database_operations and auth then work on that file unchanged:
+
+    with tenants.use_tenant('sman1'):
+        students = database_operations.get_all_students()
+
+Cross-school admin queries run the same function against every school in
+parallel with fan_out().
+
+When TENANT_DATA_DIR is not set the app serves a single school from
+database_operations.DATABASE_NAME, as before.
+"""
+import concurrent.futures
+import contextlib
+import logging
+import os
+import re
+
+import auth
+import database_operations as db_ops
+import db_connection
+
+logger = logging.getLogger(__name__)
+
+# Directory holding one '<tenant_id>.db' file per school; None disables multi-tenancy.
+TENANT_DATA_DIR = os.environ.get('TENANT_DATA_DIR') or None
+# Domain under which each school has a subdomain, e.g. 'records.example.org' maps
+# 'sman1.records.example.org' to tenant 'sman1'. None disables subdomain routing.
+TENANT_BASE_DOMAIN = os.environ.get('TENANT_BASE_DOMAIN') or None
+# Threads used by fan_out(); each holds at most one connection per school at a time.
+FAN_OUT_WORKERS = int(os.environ.get('TENANT_FAN_OUT_WORKERS', 8))
+
+# Tenant IDs become file names, so only allow a safe subset (no dots or slashes)
+_TENANT_ID_PATTERN = re.compile(r'[a-z0-9][a-z0-9_-]{0,62}')
+_DATABASE_SUFFIX = '.db'
+
+
+def multi_tenant_enabled() -> bool:
+    """Returns True if schools are served from separate databases in TENANT_DATA_DIR."""
+    return TENANT_DATA_DIR is not None
+
+
+def is_valid_tenant_id(tenant_id) -> bool:
+    """Returns True if `tenant_id` is a well-formed tenant ID (lowercase letters, digits, '-' and '_')."""
+    return isinstance(tenant_id, str) and _TENANT_ID_PATTERN.fullmatch(tenant_id) is not None
+
+
+def tenant_database(tenant_id: str) -> str:
+    """
+    Returns the database file of a school.
+
+    Raises:
+        ValueError: If multi-tenancy is disabled or the tenant ID is malformed.
+    """
+    if not multi_tenant_enabled():
+        raise ValueError("Multi-tenancy is disabled; set TENANT_DATA_DIR.")
+    if not is_valid_tenant_id(tenant_id):
+        raise ValueError(f"Invalid tenant ID '{tenant_id}'.")
+    return os.path.join(TENANT_DATA_DIR, tenant_id + _DATABASE_SUFFIX)
+
+
+def list_tenants() -> list[str]:
+    """Returns the IDs of all schools that have a database, sorted."""
+    if not multi_tenant_enabled() or not os.path.isdir(TENANT_DATA_DIR):
+        return []
+    tenant_ids = []
+    for name in os.listdir(TENANT_DATA_DIR):
+        tenant_id, suffix = os.path.splitext(name)
+        if suffix == _DATABASE_SUFFIX and is_valid_tenant_id(tenant_id):
+            tenant_ids.append(tenant_id)
+    return sorted(tenant_ids)
+
+
+def tenant_exists(tenant_id: str) -> bool:
+    """Returns True if the school has been created with initialize_tenant()."""
+    return (multi_tenant_enabled() and is_valid_tenant_id(tenant_id)
+            and os.path.isfile(tenant_database(tenant_id)))
+
+
+def tenant_from_host(host: str | None) -> str | None:
+    """
+    Returns the tenant ID encoded in a request's Host header as a subdomain of
+    TENANT_BASE_DOMAIN, or None if subdomain routing is off or does not apply.
+    """
+    if not TENANT_BASE_DOMAIN or not host:
+        return None
+    hostname = host.split(':', 1)[0].lower()
+    suffix = '.' + TENANT_BASE_DOMAIN.lower()
+    if not hostname.endswith(suffix):
+        return None
+    tenant_id = hostname[:-len(suffix)]
+    return tenant_id if is_valid_tenant_id(tenant_id) else None
+
+
+@contextlib.contextmanager
+def use_tenant(tenant_id: str):
+    """Routes all database and auth calls in this block (in this thread or task) to the school's database."""
+    with db_connection.use_database(tenant_database(tenant_id)):
+        yield tenant_id
+
+
+def initialize_tenant(tenant_id: str, admin_username: str | None = None, admin_password: str | None = None) -> bool:
+    """
+    Creates (or upgrades) a school's database and, if it has no users yet, its
+    first admin account.
+
+    Args:
+        tenant_id (str): The school's tenant ID.
+        admin_username (str | None): Defaults to the ADMIN_USER environment variable or 'admin'.
+        admin_password (str | None): Defaults to the ADMIN_PASS environment variable or 'password'.
+
+    Returns:
+        bool: True if the database is ready, False if initialization failed.
+    """
+    database = tenant_database(tenant_id)
+    os.makedirs(TENANT_DATA_DIR, exist_ok=True)
+    try:
+        with use_tenant(tenant_id):
+            db_ops.initialize_database()
+            auth.initialize_auth_database()
+            if auth.get_user_count() == 0:
+                username = admin_username or os.environ.get('ADMIN_USER', 'admin')
+                password = admin_password or os.environ.get('ADMIN_PASS', 'password')
+                if not auth.create_user(username, password, role='admin'):
+                    logger.error("Failed to create admin user '%s' for tenant '%s'.", username, tenant_id)
+                    return False
+                logger.info("Created admin user '%s' for tenant '%s'.", username, tenant_id)
+    finally:
+        db_connection.release_connections()
+    logger.info("Tenant '%s' initialized at %s.", tenant_id, database)
+    return True
+
+
+def _run_for_tenant(tenant_id, func, args, kwargs):
+    try:
+        with use_tenant(tenant_id):
+            return func(*args, **kwargs)
+    finally:
+        # Pool threads are reused for other schools; do not keep this one's connection
+        db_connection.release_connections()
+
+
+def fan_out(func, *args, tenants: list[str] | None = None, workers: int | None = None, **kwargs) -> dict:
+    """
+    Runs `func(*args, **kwargs)` against every school's database in parallel,
+    e.g. fan_out(database_operations.get_student_stats) for a cross-school
+    dashboard. Schools have separate database files, so the calls do not
+    contend for a writer lock.
+
+    Args:
+        func (callable): A database_operations/auth function (or any function using them).
+        tenants (list[str] | None): The schools to query; defaults to list_tenants().
+        workers (int | None): Threads to use; defaults to FAN_OUT_WORKERS.
+
+    Returns:
+        dict: {'results': {tenant_id: result, ...}, 'errors': {tenant_id: message, ...}}
+              A school whose call raised is listed under 'errors' instead of 'results'.
+    """
+    tenant_ids = list_tenants() if tenants is None else list(tenants)
+    outcome = {'results': {}, 'errors': {}}
+    if not tenant_ids:
+        return outcome
+    workers = max(1, min(int(workers or FAN_OUT_WORKERS), len(tenant_ids)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tenant-fan-out') as pool:
+        futures = {pool.submit(_run_for_tenant, tenant_id, func, args, kwargs): tenant_id
+                   for tenant_id in tenant_ids}
+        for future in concurrent.futures.as_completed(futures):
+            tenant_id = futures[future]
+            try:
+                outcome['results'][tenant_id] = future.result()
+            except Exception as e:
+                logger.error("Fan-out of %s failed for tenant '%s': %s", getattr(func, '__name__', func), tenant_id, e)
+                outcome['errors'][tenant_id] = str(e)
+    # Keep the caller's tenant order rather than completion order
+    outcome['results'] = {tenant_id: outcome['results'][tenant_id]
+                          for tenant_id in tenant_ids if tenant_id in outcome['results']}
+    return outcome
@@ -1,6 +1,19 @@
 import unittest
 import logging
+import asyncio
+import concurrent.futures
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import subprocess
 import sys
+import tempfile
+import threading
+import time
+import zipfile
 
 # --- Monkey-patching DATABASE_NAME before importing modules ---
 # This is a common way to redirect database operations to an in-memory DB for tests.
@@ -18,6 +31,19 @@ sys.modules['db_config'] = MockDbModule()
 # Now, we can import the modules. They should pick up the patched DATABASE_NAME.
 import auth
 import database_operations
+import db_connection
+import record_cache
+import records
+import async_operations
+import report_cards
+import tenants
+import snapshot
+import write_queue
+import db_retry
+import update_statements
+import db_metrics
+import archive
+import log_config
 
 # Set the DATABASE_NAME in the actual modules to :memory:
 auth.DATABASE_NAME = ':memory:'
@@ -60,6 +86,38 @@ class BaseTestCase(unittest.TestCase):
         auth.initialize_auth_database() # Re-create tables in the in-memory DB
         database_operations.initialize_database() # Re-create tables in the in-memory DB
 
+class FileDatabaseTestCase(unittest.TestCase):
+    """
+    Base for tests that need a database file instead of the per-thread :memory:
+    database: other threads, extra connections, snapshots or archives. Each test
+    gets a fresh temporary directory holding an initialized `self.db_path`.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(original_logging_level)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'records.db')
+        db_connection.release_connections()
+        database_operations.clear_record_cache()
+        auth.DATABASE_NAME = database_operations.DATABASE_NAME = self.db_path
+        auth.initialize_auth_database()
+        database_operations.initialize_database()
+
+    def tearDown(self):
+        database_operations.close_snapshots()
+        database_operations.close_archives()
+        db_connection.close_all_pools()
+        database_operations.clear_record_cache()
+        auth.DATABASE_NAME = database_operations.DATABASE_NAME = ':memory:'
+        self.tmp_dir.cleanup()
+
 class TestAuth(BaseTestCase):
 
     def test_create_user_successful(self):
@@ -309,6 +367,1561 @@ class TestGraduatedStudent(BaseTestCase):
         self.assertIsNone(record, "Should return None for a non-existent student.")
 
 
+
+class TestConnectionPool(BaseTestCase):
+    def test_connection_reused_within_thread(self):
+        conn1 = database_operations.get_db_connection()
+        conn2 = database_operations.get_db_connection()
+        self.assertIs(conn1, conn2, "Repeated calls in one thread should reuse the pooled connection.")
+        self.assertIs(auth.get_db_connection(), conn1, "auth and database_operations should share the pool.")
+
+    def test_foreign_keys_enabled_on_pooled_connection(self):
+        conn = database_operations.get_db_connection()
+        self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+
+    def test_closed_connection_is_replaced(self):
+        conn = database_operations.get_db_connection()
+        conn.close()
+        new_conn = database_operations.get_db_connection()
+        self.assertIsNot(conn, new_conn)
+        self.assertTrue(db_connection.ConnectionPool.is_healthy(new_conn))
+
+    def test_pool_is_bounded(self):
+        pool = db_connection.ConnectionPool(':memory:', max_size=1, timeout=0.01)
+        conn = pool.acquire()
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn, "Released connection should be handed out again.")
+        pool.close_all()
+
+    def test_release_rolls_back_open_transaction(self):
+        pool = db_connection.ConnectionPool(':memory:', max_size=1)
+        conn = pool.acquire()
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+        pool.release(conn)
+        conn = pool.acquire()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+        pool.close_all()
+
+
+
+class TestPragmaProfile(unittest.TestCase):
+    def tearDown(self):
+        db_connection.set_pragma_profile('balanced')
+
+    def test_balanced_profile_applied_to_new_connections(self):
+        db_connection.set_pragma_profile('balanced')
+        pool = db_connection.ConnectionPool(':memory:', max_size=1)
+        conn = pool.acquire()
+        effective = db_connection.get_effective_pragmas(conn)
+        self.assertEqual(effective['synchronous'], 'NORMAL')
+        self.assertEqual(effective['temp_store'], 'MEMORY')
+        self.assertEqual(effective['cache_size'], -16000)
+        pool.close_all()
+
+    def test_profile_overrides(self):
+        settings = db_connection.set_pragma_profile('durable', busy_timeout=1234)
+        self.assertEqual(settings['synchronous'], 'FULL')
+        self.assertEqual(settings['busy_timeout'], 1234)
+        pool = db_connection.ConnectionPool(':memory:', max_size=1)
+        conn = pool.acquire()
+        self.assertEqual(db_connection.get_effective_pragmas(conn)['busy_timeout'], 1234)
+        pool.close_all()
+
+    def test_unknown_profile_rejected(self):
+        with self.assertRaises(ValueError):
+            db_connection.set_pragma_profile('reckless')
+        with self.assertRaises(ValueError):
+            db_connection.set_pragma_profile('fast', page_size=1)
+
+
+
+class TestIndexes(BaseTestCase):
+    def test_secondary_indexes_created(self):
+        conn = database_operations.get_db_connection()
+        names = {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn('idx_student_grades_student', names)
+        self.assertIn('idx_students_status', names)
+        self.assertIn('idx_students_full_name', names)
+
+    def test_initialize_database_is_idempotent(self):
+        database_operations.initialize_database()
+        database_operations.initialize_database()
+
+    def test_grade_lookup_uses_covering_index(self):
+        conn = database_operations.get_db_connection()
+        # The columns get_grades_for_student() reads
+        plan = ' '.join(row['detail'] for row in conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT {database_operations._GRADE_SELECT} FROM student_grades WHERE student_id = ?",
+            ('S001',)))
+        self.assertIn('COVERING INDEX idx_student_grades_student', plan)
+
+
+
+class TestNameSearch(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for student_id, name in [('S001', 'Siti Nurhaliza'), ('S002', 'José Rizal'),
+                                 ('S003', 'Budi Santoso'), ('S004', 'Santi Budiman')]:
+            database_operations.add_student({'student_id': student_id, 'full_name': name, 'enrollment_year': 2022})
+
+    def _names(self, term):
+        return [s['full_name'] for s in database_operations.search_students(term, 'name')]
+
+    def test_prefix_search(self):
+        self.assertEqual(self._names('nurh'), ['Siti Nurhaliza'])
+        self.assertEqual(sorted(self._names('bud')), ['Budi Santoso', 'Santi Budiman'])
+        self.assertEqual(self._names('budi santo'), ['Budi Santoso'])
+
+    def test_diacritic_insensitive(self):
+        self.assertEqual(self._names('jose'), ['José Rizal'])
+        self.assertEqual(self._names('JOSÉ'), ['José Rizal'])
+
+    def test_index_follows_updates_and_deletes(self):
+        database_operations.update_student('S003', {'full_name': 'Bambang Pamungkas'})
+        self.assertEqual(self._names('budi'), ['Santi Budiman'])
+        self.assertEqual(self._names('bamb'), ['Bambang Pamungkas'])
+        database_operations.delete_student('S004')
+        self.assertEqual(self._names('budi'), [])
+
+    def test_fts_operators_are_literal(self):
+        self.assertEqual(self._names('"siti" OR'), [])
+        self.assertEqual(self._names('***'), [])
+
+    def test_like_fallback_without_fts(self):
+        database = database_operations.current_database()
+        database_operations._fts_name_search[database] = False
+        try:
+            self.assertEqual(self._names('aliz'), ['Siti Nurhaliza'])
+        finally:
+            del database_operations._fts_name_search[database]
+
+    def test_triggers_find_index_rows_by_rowid(self):
+        conn = database_operations.get_db_connection()
+        trigger_sql = conn.execute(
+            "SELECT group_concat(sql, ' ') FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'students_fts_%'"
+        ).fetchone()[0]
+        self.assertEqual(trigger_sql.count('WHERE rowid'), 2)
+        plan = ' '.join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN DELETE FROM students_fts WHERE rowid = "
+            "(SELECT fts_rowid FROM students_fts_keys WHERE student_id = 'S001')"))
+        self.assertIn('INDEX 0:=', plan) # A rowid lookup, not a full scan
+        with conn:
+            conn.execute("UPDATE students SET student_id = 'S101' WHERE student_id = 'S001'")
+        self.assertEqual([s['student_id'] for s in database_operations.search_students('nurh', 'name')], ['S101'])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM students_fts").fetchone()[0],
+                         conn.execute("SELECT COUNT(*) FROM students_fts_keys").fetchone()[0])
+
+    def test_rebuilds_an_index_keyed_by_student_id(self):
+        conn = database_operations.get_db_connection()
+        with conn:
+            conn.execute("DROP TABLE students_fts_keys")
+            conn.execute("DROP TRIGGER students_fts_delete")
+            conn.execute("CREATE TRIGGER students_fts_delete AFTER DELETE ON students BEGIN "
+                         "DELETE FROM students_fts WHERE student_id = old.student_id; END")
+        database_operations.initialize_database()
+        self.assertIn('WHERE rowid', conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'students_fts_delete'").fetchone()[0])
+        self.assertEqual(self._names('nurh'), ['Siti Nurhaliza'])
+        database_operations.delete_student('S004')
+        self.assertEqual(self._names('budi'), ['Budi Santoso'])
+
+
+
+class TestStudentPagination(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        names = ['Eka', 'Dewi', 'Citra', 'Bayu', 'Agus', 'Fajar', 'Gita']
+        for i, name in enumerate(names, start=1):
+            database_operations.add_student({'student_id': f'S{i:03d}', 'full_name': name, 'enrollment_year': 2022})
+
+    def _ids(self, page):
+        return [s['student_id'] for s in page['students']]
+
+    def test_first_page(self):
+        page = database_operations.get_students_page(page_size=3)
+        self.assertEqual(self._ids(page), ['S001', 'S002', 'S003'])
+        self.assertIsNone(page['prev_cursor'])
+        self.assertIsNotNone(page['next_cursor'])
+        self.assertEqual(page['total_estimate'], 7)
+
+    def test_walk_forward_and_back(self):
+        page1 = database_operations.get_students_page(page_size=3)
+        page2 = database_operations.get_students_page(page_size=3, after=page1['next_cursor'])
+        page3 = database_operations.get_students_page(page_size=3, after=page2['next_cursor'])
+        self.assertEqual(self._ids(page2), ['S004', 'S005', 'S006'])
+        self.assertEqual(self._ids(page3), ['S007'])
+        self.assertIsNone(page3['next_cursor'])
+
+        back = database_operations.get_students_page(page_size=3, before=page3['prev_cursor'])
+        self.assertEqual(self._ids(back), ['S004', 'S005', 'S006'])
+        back = database_operations.get_students_page(page_size=3, before=back['prev_cursor'])
+        self.assertEqual(self._ids(back), ['S001', 'S002', 'S003'])
+        self.assertIsNone(back['prev_cursor'])
+
+    def test_sort_by_full_name(self):
+        page1 = database_operations.get_students_page(page_size=4, sort_by='full_name')
+        self.assertEqual([s['full_name'] for s in page1['students']], ['Agus', 'Bayu', 'Citra', 'Dewi'])
+        page2 = database_operations.get_students_page(page_size=4, after=page1['next_cursor'], sort_by='full_name')
+        self.assertEqual([s['full_name'] for s in page2['students']], ['Eka', 'Fajar', 'Gita'])
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        page = database_operations.get_students_page(page_size=2, after='not-a-cursor')
+        self.assertEqual(self._ids(page), ['S001', 'S002'])
+
+    def test_page_size_is_clamped(self):
+        page = database_operations.get_students_page(page_size=10000)
+        self.assertEqual(page['page_size'], database_operations.MAX_PAGE_SIZE)
+
+
+
+class TestBulkIngestion(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write_csv(self, name, text):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_add_students_bulk(self):
+        students = [{'student_id': f'S{i:03d}', 'full_name': f'Student {i}', 'enrollment_year': 2023}
+                    for i in range(1, 11)]
+        report = database_operations.add_students_bulk(students, chunk_size=3)
+        self.assertEqual(report['inserted'], 10)
+        self.assertEqual(report['chunks'], 4)
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(len(database_operations.get_all_students()), 10)
+        self.assertEqual(database_operations.get_student_by_id('S005')['status'], 'active')
+
+    def test_add_students_bulk_reports_bad_rows(self):
+        database_operations.add_student({'student_id': 'S002', 'full_name': 'Existing', 'enrollment_year': 2020})
+        students = [
+            {'student_id': 'S001', 'full_name': 'Ani', 'enrollment_year': 2023},
+            {'student_id': 'S002', 'full_name': 'Duplicate', 'enrollment_year': 2023},
+            {'student_id': 'S003', 'full_name': 'No Year'},
+            {'student_id': 'S004', 'full_name': 'Dodi', 'enrollment_year': 2023},
+        ]
+        report = database_operations.add_students_bulk(students, chunk_size=10)
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual([(e['row'], e['student_id']) for e in report['errors']], [(2, 'S002'), (3, 'S003')])
+        self.assertEqual(database_operations.get_student_by_id('S002')['full_name'], 'Existing')
+        self.assertIsNotNone(database_operations.get_student_by_id('S004'))
+
+    def test_add_student_grades_bulk_rejects_unknown_students(self):
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani', 'enrollment_year': 2023})
+        grades = [
+            {'student_id': 'S001', 'year_level': 1, 'subject': 'Math', 'grade': 'A'},
+            {'student_id': 'S999', 'year_level': 1, 'subject': 'Math', 'grade': 'B'},
+            {'student_id': 'S001', 'year_level': 1, 'subject': 'Art', 'grade': 'B+'},
+        ]
+        report = database_operations.add_student_grades_bulk(grades)
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual([e['student_id'] for e in report['errors']], ['S999'])
+        self.assertEqual(len(database_operations.get_grades_for_student('S001')), 2)
+
+    def test_import_csv_with_row_errors(self):
+        path = self._write_csv('students.csv',
+                               "student_id,full_name,enrollment_year,status\n"
+                               "S001,Ani,2023,\n"
+                               "S002,Budi,next year,active\n"
+                               "S003,Citra,2021,graduated\n")
+        report = database_operations.import_csv(path, kind='students', chunk_size=2)
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual(len(report['errors']), 1)
+        self.assertEqual(report['errors'][0]['row'], 2)
+        self.assertIn('enrollment_year', report['errors'][0]['error'])
+        self.assertEqual(database_operations.get_student_by_id('S001')['status'], 'active')
+        self.assertEqual(database_operations.get_student_by_id('S003')['status'], 'graduated')
+
+    def test_import_csv_resumes_after_committed_chunks(self):
+        path = self._write_csv('students.csv',
+                               "student_id,full_name,enrollment_year\n" +
+                               ''.join(f"S{i:03d},Student {i},2023\n" for i in range(1, 6)))
+        # Simulate an earlier run that committed the first chunk before being interrupted
+        first = database_operations.import_csv(path, chunk_size=2)
+        self.assertEqual(first['inserted'], 5)
+        conn = database_operations.get_db_connection()
+        conn.execute("UPDATE import_progress SET rows_done = 2")
+        conn.execute("DELETE FROM students WHERE student_id IN ('S003', 'S004', 'S005')")
+        conn.commit()
+
+        resumed = database_operations.import_csv(path, chunk_size=2)
+        self.assertEqual(resumed['skipped'], 2)
+        self.assertEqual(resumed['inserted'], 3)
+        self.assertEqual(resumed['errors'], [])
+
+        again = database_operations.import_csv(path, chunk_size=2)
+        self.assertEqual((again['skipped'], again['inserted']), (5, 0))
+
+        restarted = database_operations.import_csv(path, chunk_size=2, resume=False)
+        self.assertEqual(len(restarted['errors']), 5, "Restarting re-imports every row (all duplicates here).")
+
+
+
+class TestRegisterExport(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        database_operations.add_student({'student_id': 'S002', 'full_name': 'Budi', 'enrollment_year': 2021})
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani', 'enrollment_year': 2020})
+        database_operations.add_student_grade({'student_id': 'S001', 'year_level': 2, 'subject': 'Math', 'grade': 'B'})
+        database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1, 'subject': 'Math', 'grade': 'A'})
+
+    def test_register_rows_are_ordered_and_include_students_without_grades(self):
+        rows = list(database_operations.iter_register_rows())
+        self.assertEqual([(r['student_id'], r['year_level']) for r in rows], [('S001', 1), ('S001', 2), ('S002', None)])
+
+    def test_register_students_grouping(self):
+        students = list(database_operations.iter_register_students())
+        self.assertEqual([s['details']['student_id'] for s in students], ['S001', 'S002'])
+        self.assertEqual([g['grade'] for g in students[0]['grades']], ['A', 'B'])
+        self.assertEqual(students[1]['grades'], [])
+
+    def test_export_csv(self):
+        text = ''.join(database_operations.export_register('csv'))
+        rows = list(csv.DictReader(io.StringIO(text)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['full_name'], 'Ani')
+        self.assertEqual(rows[2]['subject'], '')
+
+    def test_export_jsonl_gzip(self):
+        data = b''.join(database_operations.gzip_stream(database_operations.export_register('jsonl')))
+        lines = gzip.decompress(data).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['details']['student_id'] for line in lines], ['S001', 'S002'])
+
+    def test_export_streams_in_chunks(self):
+        original = database_operations.EXPORT_FETCH_SIZE
+        database_operations.EXPORT_FETCH_SIZE = 1
+        try:
+            chunks = list(database_operations.export_register('csv'))
+        finally:
+            database_operations.EXPORT_FETCH_SIZE = original
+        self.assertEqual(len(chunks), 3)
+
+    def test_unknown_format_rejected(self):
+        with self.assertRaises(ValueError):
+            list(database_operations.export_register('xml'))
+
+
+
+class TestStudentDetailsWithGrades(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani', 'enrollment_year': 2020,
+                                         'email': 'ani@example.com'})
+        database_operations.add_student({'student_id': 'S002', 'full_name': 'Budi', 'enrollment_year': 2021})
+        self.g1 = database_operations.add_student_grade({'student_id': 'S001', 'year_level': 2, 'subject': 'Math', 'grade': 'B'})
+        self.g2 = database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1, 'subject': 'Art', 'grade': 'A'})
+
+    def test_details_and_grades(self):
+        info = database_operations.get_student_details_with_grades('S001')
+        self.assertEqual(info['details'], database_operations.get_student_by_id('S001'))
+        self.assertEqual([g['grade_id'] for g in info['grades']], [self.g2, self.g1])
+        self.assertEqual(info['grades'][0], {'grade_id': self.g2, 'student_id': 'S001', 'year_level': 1,
+                                             'subject': 'Art', 'grade': 'A'})
+
+    def test_student_without_grades(self):
+        info = database_operations.get_student_details_with_grades('S002')
+        self.assertEqual(info['details']['full_name'], 'Budi')
+        self.assertEqual(info['grades'], [])
+
+    def test_missing_student(self):
+        self.assertIsNone(database_operations.get_student_details_with_grades('S999'))
+
+    def test_column_projection(self):
+        info = database_operations.get_student_details_with_grades('S001', columns=['full_name', 'email'])
+        self.assertEqual(info['details'], {'student_id': 'S001', 'full_name': 'Ani', 'email': 'ani@example.com'})
+        self.assertEqual(len(info['grades']), 2)
+        with self.assertRaises(ValueError):
+            database_operations.get_student_details_with_grades('S001', columns=['password'])
+
+
+
+class TestTransaction(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.student = {'student_id': 'S001', 'full_name': 'Ani', 'enrollment_year': 2020}
+        self.grade = {'student_id': 'S001', 'year_level': 1, 'subject': 'Math', 'grade': 'A'}
+
+    def test_student_and_grades_commit_together(self):
+        conn = database_operations.get_db_connection()
+        with database_operations.transaction() as tx:
+            self.assertEqual(database_operations.add_student(self.student, tx=tx), 'S001')
+            self.assertIsNotNone(database_operations.add_student_grade(self.grade, tx=tx))
+            # Reads on the same thread see the uncommitted writes without committing them
+            self.assertIsNotNone(database_operations.get_student_by_id('S001'))
+            self.assertTrue(conn.in_transaction)
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(len(database_operations.get_grades_for_student('S001')), 1)
+
+    def test_exception_rolls_back_everything(self):
+        with self.assertRaises(RuntimeError):
+            with database_operations.transaction() as tx:
+                database_operations.add_student(self.student, tx=tx)
+                database_operations.add_student_grade(self.grade, tx=tx)
+                raise RuntimeError("abort")
+        self.assertIsNone(database_operations.get_student_by_id('S001'))
+        self.assertEqual(database_operations.get_grades_for_student('S001'), [])
+
+    def test_failed_statement_keeps_other_writes(self):
+        with database_operations.transaction() as tx:
+            database_operations.add_student(self.student, tx=tx)
+            bad_grade = dict(self.grade, student_id='S999')
+            self.assertIsNone(database_operations.add_student_grade(bad_grade, tx=tx))
+            database_operations.add_student_grade(self.grade, tx=tx)
+        self.assertEqual(len(database_operations.get_grades_for_student('S001')), 1)
+
+    def test_nested_transaction_joins_outer(self):
+        with self.assertRaises(RuntimeError):
+            with database_operations.transaction() as outer:
+                with database_operations.transaction() as inner:
+                    database_operations.add_student(self.student, tx=inner)
+                self.assertIsNotNone(database_operations.get_student_by_id('S001'))
+                raise RuntimeError("abort outer")
+        self.assertIsNone(database_operations.get_student_by_id('S001'))
+
+class TestRecordCache(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani', 'enrollment_year': 2020,
+                                         'status': 'graduated'})
+        self.grade_id = database_operations.add_student_grade(
+            {'student_id': 'S001', 'year_level': 1, 'subject': 'Math', 'grade': 'A'})
+
+    def test_repeated_reads_hit_cache(self):
+        before = database_operations.get_cache_stats()
+        first = database_operations.get_student_by_id('S001')
+        second = database_operations.get_student_by_id('S001')
+        self.assertEqual(first, second)
+        stats = database_operations.get_cache_stats()
+        self.assertEqual(stats['misses'] - before['misses'], 1)
+        self.assertEqual(stats['hits'] - before['hits'], 1)
+
+    def test_cached_values_are_copies(self):
+        database_operations.get_student_by_id('S001')['full_name'] = 'Changed'
+        self.assertEqual(database_operations.get_student_by_id('S001')['full_name'], 'Ani')
+
+    def test_not_found_is_cached_until_student_added(self):
+        self.assertIsNone(database_operations.get_student_by_id('S002'))
+        database_operations.add_student({'student_id': 'S002', 'full_name': 'Budi', 'enrollment_year': 2021})
+        self.assertEqual(database_operations.get_student_by_id('S002')['full_name'], 'Budi')
+
+    def test_update_and_delete_invalidate(self):
+        database_operations.get_student_by_id('S001')
+        database_operations.get_graduated_student_record('S001')
+        database_operations.update_student('S001', {'full_name': 'Ani Wijaya'})
+        self.assertEqual(database_operations.get_student_by_id('S001')['full_name'], 'Ani Wijaya')
+        self.assertEqual(database_operations.get_graduated_student_record('S001')['details']['full_name'], 'Ani Wijaya')
+        database_operations.delete_student('S001')
+        self.assertIsNone(database_operations.get_student_by_id('S001'))
+        self.assertEqual(database_operations.get_grades_for_student('S001'), [])
+
+    def test_grade_changes_invalidate(self):
+        self.assertEqual(database_operations.get_grades_for_student('S001')[0]['grade'], 'A')
+        database_operations.update_student_grade(self.grade_id, {'grade': 'B'})
+        self.assertEqual(database_operations.get_grades_for_student('S001')[0]['grade'], 'B')
+        self.assertEqual(database_operations.get_graduated_student_record('S001')['grades'][0]['grade'], 'B')
+        database_operations.delete_student_grade(self.grade_id)
+        self.assertEqual(database_operations.get_grades_for_student('S001'), [])
+        database_operations.add_student_grades_bulk([{'student_id': 'S001', 'year_level': 2, 'subject': 'Art', 'grade': 'C'}])
+        self.assertEqual(len(database_operations.get_grades_for_student('S001')), 1)
+
+    def test_transaction_reads_bypass_cache(self):
+        database_operations.get_grades_for_student('S001')
+        with database_operations.transaction() as tx:
+            database_operations.add_student_grade(
+                {'student_id': 'S001', 'year_level': 2, 'subject': 'Art', 'grade': 'C'}, tx=tx)
+            self.assertEqual(len(database_operations.get_grades_for_student('S001')), 2)
+        self.assertEqual(len(database_operations.get_grades_for_student('S001')), 2)
+
+    def test_eviction_counter(self):
+        cache = record_cache.LRUCache(max_size=2, ttl=60)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, key)
+        self.assertEqual(cache.get('a'), (False, None))
+        self.assertEqual(cache.get('c'), (True, 'c'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expired_entries_miss(self):
+        cache = record_cache.LRUCache(max_size=2, ttl=0)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), (False, None))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+class TestRecords(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani', 'enrollment_year': 2020})
+        database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1, 'subject': 'Math', 'grade': 'A'})
+
+    def test_list_queries_return_records(self):
+        student = database_operations.get_all_students()[0]
+        self.assertIsInstance(student, records.Student)
+        self.assertIsInstance(database_operations.search_students('Ani', 'name')[0], records.Student)
+        self.assertIsInstance(database_operations.get_students_page()['students'][0], records.Student)
+        self.assertIsInstance(database_operations.get_grades_for_student('S001')[0], records.Grade)
+        self.assertFalse(hasattr(student, '__dict__'))
+
+    def test_dict_compatible_access(self):
+        student = database_operations.get_all_students()[0]
+        self.assertEqual(student['full_name'], 'Ani')
+        self.assertEqual(student.full_name, 'Ani')
+        self.assertEqual(student.get('status'), 'active')
+        self.assertIsNone(student.get('missing'))
+        self.assertIn('email', student)
+        self.assertEqual(dict(student), database_operations.get_student_by_id('S001'))
+        self.assertEqual(student, database_operations.get_student_by_id('S001'))
+        with self.assertRaises(KeyError):
+            student['missing']
+
+    def test_records_are_immutable(self):
+        grade = database_operations.get_grades_for_student('S001')[0]
+        with self.assertRaises(TypeError):
+            grade['grade'] = 'B'
+        self.assertEqual(grade.replace(grade='B').grade, 'B')
+        self.assertEqual(grade.grade, 'A')
+
+    def test_json_payloads_are_objects(self):
+        import app  # Imported here: importing it sets up the app and its logging
+        log_config.stop_logging()
+        page = database_operations.get_students_page()
+        grades = database_operations.get_grades_for_student('S001')
+        self.assertEqual(records.jsonable({'grades': (grades[0],)})['grades'][0], grades[0].to_dict())
+
+        with app.app.test_request_context():
+            payload = app.jsonify({'students': page['students'], 'grades': grades}).get_json()
+        self.assertEqual(payload['students'][0]['student_id'], 'S001')
+        self.assertEqual(payload['students'][0]['full_name'], 'Ani')
+        self.assertEqual(payload['grades'], [{'grade_id': grades[0].grade_id, 'student_id': 'S001',
+                                              'year_level': 1, 'subject': 'Math', 'grade': 'A'}])
+
+class TestStudentStats(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani', 'enrollment_year': 2020})
+        database_operations.add_student({'student_id': 'S002', 'full_name': 'Budi', 'enrollment_year': 2021,
+                                         'status': 'graduated'})
+        database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1, 'subject': 'Math', 'grade': 'A'})
+
+    def test_counters_follow_inserts(self):
+        stats = database_operations.get_student_stats()
+        self.assertEqual(stats['total_students'], 2)
+        self.assertEqual(stats['total_grades'], 1)
+        self.assertEqual(stats['by_status'], {'active': 1, 'graduated': 1, 'dropped_out': 0, 'inactive': 0})
+        self.assertEqual(stats['by_enrollment_year'], {2020: 1, 2021: 1})
+        self.assertEqual(stats['recent_additions'], 2)
+
+    def test_counters_follow_updates_and_deletes(self):
+        database_operations.update_student('S001', {'status': 'dropped_out', 'enrollment_year': 2021})
+        database_operations.delete_student('S002')
+        stats = database_operations.get_student_stats()
+        self.assertEqual(stats['total_students'], 1)
+        self.assertEqual(stats['by_status']['dropped_out'], 1)
+        self.assertEqual(stats['by_status']['graduated'], 0)
+        self.assertEqual(stats['by_enrollment_year'], {2021: 1})
+        database_operations.delete_student('S001') # Cascades to the grade
+        self.assertEqual(database_operations.get_student_stats()['total_grades'], 0)
+
+    def test_bulk_inserts_are_counted(self):
+        database_operations.add_students_bulk([{'student_id': f"B{i}", 'full_name': 'Bulk', 'enrollment_year': 2022}
+                                               for i in range(5)])
+        self.assertEqual(database_operations.get_student_stats()['by_enrollment_year'][2022], 5)
+
+    def test_rebuild_fixes_drift(self):
+        conn = database_operations.get_db_connection()
+        conn.execute("UPDATE student_stats SET value = 99 WHERE metric = 'students'")
+        conn.execute("DELETE FROM student_stats WHERE metric = 'status' AND bucket = 'graduated'")
+        conn.commit()
+        self.assertEqual(database_operations.rebuild_student_stats(), {'counters': 6, 'corrected': 2})
+        stats = database_operations.get_student_stats()
+        self.assertEqual(stats['total_students'], 2)
+        self.assertEqual(stats['by_status']['graduated'], 1)
+        self.assertEqual(stats['recent_additions'], 2)
+
+class TestAsyncOperations(FileDatabaseTestCase):
+    """
+    Runs the same checks through the sync functions and their async_operations
+    counterparts. The async calls run on other threads, so both paths use a
+    shared database file instead of the per-thread :memory: database.
+    """
+    PATHS = ('sync', 'async')
+
+    @classmethod
+    def tearDownClass(cls):
+        async_operations.shutdown()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        auth.create_user('teacher', 'secret123')
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani Lestari', 'enrollment_year': 2020,
+                                         'status': 'graduated'})
+        database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1, 'subject': 'Math', 'grade': 'A'})
+
+    def call(self, path: str, name: str, *args, **kwargs):
+        if path == 'sync':
+            module = auth if hasattr(auth, name) else database_operations
+            return getattr(module, name)(*args, **kwargs)
+        return asyncio.run(getattr(async_operations, name)(*args, **kwargs))
+
+    def test_reads(self):
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                self.assertEqual(self.call(path, 'get_student_by_id', 'S001')['full_name'], 'Ani Lestari')
+                self.assertIsNone(self.call(path, 'get_student_by_id', 'S999'))
+                self.assertEqual([s['student_id'] for s in self.call(path, 'search_students', 'lest', 'name')], ['S001'])
+                self.assertEqual(len(self.call(path, 'get_grades_for_student', 'S001')), 1)
+                self.assertEqual(len(self.call(path, 'get_graduated_student_record', 'S001')['grades']), 1)
+                self.assertEqual(self.call(path, 'get_user_count'), 1)
+
+    def test_verify_user(self):
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                self.assertTrue(self.call(path, 'verify_user', 'teacher', 'secret123'))
+                self.assertFalse(self.call(path, 'verify_user', 'teacher', 'wrong'))
+                self.assertFalse(self.call(path, 'verify_user', 'nobody', 'secret123'))
+
+    def test_writes(self):
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                student_id = f"S-{path}"
+                self.assertEqual(self.call(path, 'add_student', {'student_id': student_id, 'full_name': 'Budi',
+                                                                 'enrollment_year': 2021}), student_id)
+                self.assertTrue(self.call(path, 'update_student', student_id, {'full_name': 'Budi Santoso'}))
+                self.assertEqual(database_operations.get_student_by_id(student_id)['full_name'], 'Budi Santoso')
+                self.assertTrue(self.call(path, 'delete_student', student_id))
+
+    def test_async_transaction(self):
+        def enroll(tx, student_id):
+            database_operations.add_student({'student_id': student_id, 'full_name': 'Citra', 'enrollment_year': 2022}, tx=tx)
+            database_operations.add_student_grade({'student_id': student_id, 'year_level': 1, 'subject': 'Art',
+                                                   'grade': 'B'}, tx=tx)
+            raise RuntimeError("abort")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(async_operations.run_in_transaction(enroll, 'S002'))
+        self.assertIsNone(database_operations.get_student_by_id('S002'))
+        with self.assertRaises(ValueError):
+            asyncio.run(async_operations.add_student({'student_id': 'S003'}, tx=object()))
+
+    def test_async_export(self):
+        async def collect():
+            return ''.join([chunk async for chunk in async_operations.export_register('csv')])
+        self.assertEqual(asyncio.run(collect()), ''.join(database_operations.export_register('csv')))
+
+class TestRankings(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for student_id, year in (('S001', 2020), ('S002', 2020), ('S003', 2020), ('S004', 2021)):
+            database_operations.add_student({'student_id': student_id, 'full_name': student_id, 'enrollment_year': year})
+        grades = [('S001', 'A'), ('S001', 'b+'), ('S002', '90'), ('S002', 'B'),
+                  ('S003', 'A'), ('S003', 'B+'), ('S003', 'Incomplete'), ('S004', 'C')]
+        database_operations.add_student_grades_bulk(
+            [{'student_id': student_id, 'year_level': 1, 'subject': f"Subject {i}", 'grade': grade}
+             for i, (student_id, grade) in enumerate(grades)])
+        database_operations.recompute_rankings()
+
+    def test_gpa_and_cohort_ranks(self):
+        ranking = database_operations.get_cohort_rankings(2020, 1)
+        self.assertEqual([(r['student_id'], r['gpa'], r['cohort_rank']) for r in ranking],
+                         [('S001', 3.65, 1), ('S003', 3.65, 1), ('S002', 3.3, 3)])
+        self.assertEqual(ranking[0]['cohort_size'], 3)
+        gpa = database_operations.get_student_gpa('S003')
+        self.assertEqual(gpa['graded_count'], 2) # 'Incomplete' is not graded
+        self.assertEqual(gpa['by_year_level'][0]['cohort_rank'], 1)
+        self.assertFalse(gpa['stale'])
+        self.assertEqual(database_operations.get_cohort_rankings(2021, 1)[0]['cohort_size'], 1)
+
+    def test_reads_do_not_recompute(self):
+        database_operations.add_student_grade({'student_id': 'S002', 'year_level': 1, 'subject': 'Art', 'grade': 'A'})
+        gpa = database_operations.get_student_gpa('S002')
+        self.assertEqual((gpa['gpa'], gpa['stale']), (3.3, True))
+        self.assertTrue(all(r['stale'] for r in database_operations.get_cohort_rankings(2020, 1)))
+        self.assertFalse(database_operations.get_cohort_rankings(2021, 1)[0]['stale'])
+        conn = database_operations.get_db_connection()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM ranking_dirty_cohorts").fetchone()[0], 1)
+
+        database_operations.recompute_rankings()
+        gpa = database_operations.get_student_gpa('S002')
+        self.assertEqual((gpa['gpa'], gpa['stale']), (3.5333, False))
+
+    def test_only_touched_cohorts_are_recomputed(self):
+        self.assertEqual(database_operations.recompute_rankings(), {'cohorts': 0, 'students': 0})
+        database_operations.add_student_grade({'student_id': 'S002', 'year_level': 1, 'subject': 'Art', 'grade': 'A'})
+        self.assertEqual(database_operations.recompute_rankings(), {'cohorts': 1, 'students': 3})
+        self.assertEqual(database_operations.get_student_gpa('S002')['gpa'], 3.5333)
+        self.assertEqual(len(database_operations.get_cohort_rankings(2020, 1, limit=2)), 2)
+
+    def test_changes_mark_cohorts(self):
+        database_operations.update_student('S003', {'enrollment_year': 2021})
+        self.assertEqual(database_operations.recompute_rankings()['cohorts'], 2)
+        self.assertEqual(len(database_operations.get_cohort_rankings(2021, 1)), 2)
+        database_operations.delete_student('S004')
+        database_operations.recompute_rankings()
+        self.assertEqual([r['student_id'] for r in database_operations.get_cohort_rankings(2021, 1)], ['S003'])
+
+    def test_custom_grade_points(self):
+        self.assertTrue(database_operations.set_grade_points({'a': 5, 'B+': 1, 'B': 1, 'C': 0}))
+        self.assertEqual(database_operations.get_grade_points()['A'], 5.0)
+        self.assertTrue(database_operations.get_student_gpa('S001')['stale'])
+        self.assertEqual(database_operations.recompute_rankings()['cohorts'], 2)
+        self.assertEqual(database_operations.get_student_gpa('S001')['gpa'], 3.0)
+        self.assertFalse(database_operations.set_grade_points({'A': 'excellent'}))
+
+class TestReportCards(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani <Lestari>', 'enrollment_year': 2020})
+        database_operations.add_student({'student_id': 'S002', 'full_name': 'Budi', 'enrollment_year': 2019,
+                                         'status': 'graduated'})
+        database_operations.add_student({'student_id': 'S003', 'full_name': 'Citra', 'enrollment_year': 2021})
+        database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1, 'subject': 'Math', 'grade': 'A'})
+        database_operations.add_student_grade({'student_id': 'S002', 'year_level': 2, 'subject': 'Art', 'grade': 'B'})
+
+    def render(self, **kwargs):
+        output = io.BytesIO()
+        progress = []
+        report = report_cards.render_documents(output, progress=lambda done, _: progress.append(done), **kwargs)
+        output.seek(0)
+        with zipfile.ZipFile(output) as archive:
+            documents = {name: archive.read(name).decode('utf-8') for name in archive.namelist()}
+        return report, documents, progress
+
+    def test_renders_report_cards_and_transcripts(self):
+        report, documents, progress = self.render(workers=1, batch_size=2)
+        self.assertEqual(sorted(documents), ['report_cards/S001.html', 'report_cards/S003.html',
+                                             'transcripts/S002.html'])
+        self.assertIn('Ani &lt;Lestari&gt;', documents['report_cards/S001.html'])
+        self.assertIn('Academic Transcript', documents['transcripts/S002.html'])
+        self.assertIn('No grades recorded', documents['report_cards/S003.html'])
+        self.assertEqual(report['documents'], 3)
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(progress, [2, 3])
+        self.assertGreater(report['documents_per_second'], 0)
+
+    def test_filters(self):
+        _, documents, _ = self.render(workers=1, status='active', enrollment_year=2021)
+        self.assertEqual(list(documents), ['report_cards/S003.html'])
+
+    def test_process_pool(self):
+        report, documents, _ = self.render(workers=2, batch_size=1)
+        self.assertEqual(report['workers'], 2)
+        self.assertEqual(len(documents), 3)
+
+
+class TestTenants(FileDatabaseTestCase):
+    """Each school gets its own database file in a temporary TENANT_DATA_DIR."""
+
+    def setUp(self):
+        super().setUp()
+        self.original_data_dir = tenants.TENANT_DATA_DIR
+        tenants.TENANT_DATA_DIR = os.path.join(self.tmp_dir.name, 'tenants')
+        for tenant_id, student_ids in (('sman1', ['S001', 'S002']), ('smk-2', ['S001'])):
+            self.assertTrue(tenants.initialize_tenant(tenant_id, 'admin', f'{tenant_id}-pass'))
+            with tenants.use_tenant(tenant_id):
+                for student_id in student_ids:
+                    database_operations.add_student({'student_id': student_id, 'full_name': f'{tenant_id} {student_id}',
+                                                     'enrollment_year': 2021, 'status': 'active'})
+        db_connection.release_connections()
+
+    def tearDown(self):
+        tenants.TENANT_DATA_DIR = self.original_data_dir
+        super().tearDown()
+
+    def test_tenant_ids(self):
+        self.assertEqual(tenants.list_tenants(), ['sman1', 'smk-2'])
+        self.assertTrue(tenants.tenant_exists('sman1'))
+        self.assertFalse(tenants.tenant_exists('sma3'))
+        for bad_id in ('../etc', 'a/b', 'Upper', '', '.db', None):
+            self.assertFalse(tenants.is_valid_tenant_id(bad_id))
+            self.assertFalse(tenants.tenant_exists(bad_id))
+        with self.assertRaises(ValueError):
+            tenants.tenant_database('../outside')
+
+    def test_tenant_from_host(self):
+        original_domain = tenants.TENANT_BASE_DOMAIN
+        tenants.TENANT_BASE_DOMAIN = 'records.example.org'
+        try:
+            self.assertEqual(tenants.tenant_from_host('sman1.records.example.org:8080'), 'sman1')
+            self.assertIsNone(tenants.tenant_from_host('records.example.org'))
+            self.assertIsNone(tenants.tenant_from_host('a.b.records.example.org'))
+            self.assertIsNone(tenants.tenant_from_host('sman1.other.org'))
+        finally:
+            tenants.TENANT_BASE_DOMAIN = original_domain
+
+    def test_data_and_users_are_isolated(self):
+        with tenants.use_tenant('sman1'):
+            self.assertEqual(len(database_operations.get_all_students()), 2)
+            self.assertTrue(auth.verify_user('admin', 'sman1-pass'))
+            self.assertFalse(auth.verify_user('admin', 'smk-2-pass'))
+        with tenants.use_tenant('smk-2'):
+            self.assertEqual([s['student_id'] for s in database_operations.get_all_students()], ['S001'])
+            self.assertTrue(auth.verify_user('admin', 'smk-2-pass'))
+        # Outside use_tenant() the default database is used again
+        self.assertEqual(database_operations.current_database(), database_operations.DATABASE_NAME)
+
+    def test_cache_is_per_tenant(self):
+        with tenants.use_tenant('sman1'):
+            self.assertEqual(database_operations.get_student_by_id('S001')['full_name'], 'sman1 S001')
+        with tenants.use_tenant('smk-2'):
+            self.assertEqual(database_operations.get_student_by_id('S001')['full_name'], 'smk-2 S001')
+            database_operations.update_student('S001', {'full_name': 'Renamed'})
+        with tenants.use_tenant('sman1'):
+            self.assertEqual(database_operations.get_student_by_id('S001')['full_name'], 'sman1 S001')
+
+    def test_fan_out(self):
+        outcome = tenants.fan_out(database_operations.get_student_stats, workers=2)
+        self.assertEqual(list(outcome['results']), ['sman1', 'smk-2'])
+        self.assertEqual(outcome['results']['sman1']['total_students'], 2)
+        self.assertEqual(outcome['results']['smk-2']['total_students'], 1)
+        self.assertEqual(outcome['errors'], {})
+
+        def fail_for_smk():
+            if database_operations.current_database().endswith('smk-2.db'):
+                raise RuntimeError('boom')
+            return 'ok'
+        outcome = tenants.fan_out(fail_for_smk)
+        self.assertEqual(outcome['results'], {'sman1': 'ok'})
+        self.assertEqual(outcome['errors'], {'smk-2': 'boom'})
+
+    def test_export_reads_the_tenant_it_was_started_for(self):
+        database_operations.add_student({'student_id': 'X001', 'full_name': 'Default school', 'enrollment_year': 2021})
+        with tenants.use_tenant('smk-2'):
+            chunks = database_operations.export_register('csv')
+            students = database_operations.iter_register_students()
+        # Streamed responses are consumed after the request's route has been reset
+        text = ''.join(chunks)
+        self.assertIn('smk-2 S001', text)
+        self.assertNotIn('Default school', text)
+        self.assertEqual([s['details']['full_name'] for s in students], ['smk-2 S001'])
+
+    def test_async_calls_follow_the_route(self):
+        async def count_students():
+            with tenants.use_tenant('sman1'):
+                return len(await async_operations.get_all_students())
+        try:
+            self.assertEqual(asyncio.run(count_students()), 2)
+        finally:
+            async_operations.shutdown()
+
+class TestGraduatedSnapshot(FileDatabaseTestCase):
+    """The graduate lookup reads a read-only snapshot of a database file."""
+
+    def setUp(self):
+        super().setUp()
+        self.original_interval = snapshot.SNAPSHOT_REFRESH_SECONDS
+        snapshot.SNAPSHOT_REFRESH_SECONDS = 300
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani Lestari', 'enrollment_year': 2020,
+                                         'status': 'graduated'})
+        database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1, 'subject': 'Math', 'grade': 'A'})
+
+    def tearDown(self):
+        super().tearDown()
+        snapshot.SNAPSHOT_REFRESH_SECONDS = self.original_interval
+
+    def snapshot_files(self):
+        return [name for name in os.listdir(self.tmp_dir.name) if '.snapshot-' in name]
+
+    def test_reads_from_snapshot_until_refreshed(self):
+        self.assertIsNone(database_operations.get_snapshot_status()['taken_at'])
+        record = database_operations.get_graduated_student_record('S001')
+        self.assertEqual(record['details']['full_name'], 'Ani Lestari')
+        self.assertEqual(len(record['grades']), 1)
+        status = database_operations.get_snapshot_status()
+        self.assertEqual(status['generation'], 1)
+        self.assertFalse(status['stale'])
+
+        database_operations.update_student('S001', {'full_name': 'Ani Wijaya'})
+        database_operations.add_student({'student_id': 'S002', 'full_name': 'Budi', 'enrollment_year': 2020,
+                                         'status': 'graduated'})
+        self.assertEqual(database_operations.get_graduated_student_record('S001')['details']['full_name'], 'Ani Lestari')
+        self.assertIsNone(database_operations.get_graduated_student_record('S002'))
+
+        self.assertEqual(database_operations.refresh_snapshot()['generation'], 2)
+        self.assertEqual(database_operations.get_graduated_student_record('S001')['details']['full_name'], 'Ani Wijaya')
+        self.assertIsNotNone(database_operations.get_graduated_student_record('S002'))
+        # The previous copy is kept for readers that looked it up just before the switch...
+        self.assertEqual(len(self.snapshot_files()), 2)
+        # ...and deleted by the refresh after that
+        database_operations.refresh_snapshot()
+        self.assertEqual(sorted(name[-1] for name in self.snapshot_files()), ['2', '3'])
+
+    def test_reader_overtaken_by_refreshes_opens_the_current_copy(self):
+        replica = database_operations._get_snapshot()
+        replica.connection()
+        deleted_path = replica._path
+        replica.refresh()
+        replica.refresh()
+        self.assertFalse(os.path.exists(deleted_path))
+
+        # This reader looked up the path before both refreshes and opens it after them
+        replica._local.conn.close()
+        replica._local.conn = None
+        lookups = iter([deleted_path])
+        current_path = replica._current_path
+        replica._current_path = lambda: next(lookups, None) or current_path()
+        conn = replica.connection()
+        self.assertEqual(conn.execute("SELECT full_name FROM students").fetchone()[0], 'Ani Lestari')
+        self.assertEqual(replica._local.path, replica._path)
+
+    @unittest.skipIf(os.name == 'nt', "processes are not probed on Windows")
+    def test_removes_files_left_by_exited_processes(self):
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        names = [f"records.db.snapshot-{exited.pid}-4", f"records.db.snapshot-{exited.pid}-5.partial",
+                 f"records.db.snapshot-{os.getppid()}-1", "other.db.snapshot-1-1"]
+        for name in names:
+            open(os.path.join(self.tmp_dir.name, name), 'w').close()
+        database_operations.get_graduated_student_record('S001')
+        self.assertEqual(sorted(self.snapshot_files()),
+                         sorted(names[2:] + [f"records.db.snapshot-{os.getpid()}-1"]))
+
+    def test_snapshot_is_read_only(self):
+        database_operations.get_graduated_student_record('S001')
+        conn = database_operations._get_snapshot().connection()
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM students")
+
+    def test_background_refresh_when_stale(self):
+        snapshot.SNAPSHOT_REFRESH_SECONDS = 0.01
+        database_operations.get_graduated_student_record('S001')
+        time.sleep(0.02)
+        self.assertTrue(database_operations.get_snapshot_status()['stale'])
+        database_operations.update_student('S001', {'full_name': 'Ani Wijaya'})
+        # The stale copy is still served while the refresh runs in the background
+        database_operations.get_graduated_student_record('S001')
+        deadline = time.monotonic() + 5
+        while database_operations.get_snapshot_status()['generation'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(database_operations.get_graduated_student_record('S001')['details']['full_name'], 'Ani Wijaya')
+
+    def test_disabled(self):
+        snapshot.SNAPSHOT_REFRESH_SECONDS = 0
+        self.assertIsNone(database_operations.get_snapshot_status())
+        self.assertIsNotNone(database_operations.get_graduated_student_record('S001'))
+        self.assertEqual(self.snapshot_files(), [])
+
+    def test_close_removes_files(self):
+        database_operations.get_graduated_student_record('S001')
+        self.assertEqual(len(self.snapshot_files()), 1)
+        database_operations.close_snapshots()
+        self.assertEqual(self.snapshot_files(), [])
+
+class TestWriteQueue(FileDatabaseTestCase):
+    """The writer thread uses its own connection, so these tests use a database file."""
+
+    def setUp(self):
+        super().setUp()
+        self.original_settings = (write_queue.WRITE_QUEUE_ENABLED, write_queue.GROUP_COMMIT_WINDOW)
+        write_queue.WRITE_QUEUE_ENABLED = True
+        self.writer = write_queue.get_writer()
+
+    def tearDown(self):
+        write_queue.WRITE_QUEUE_ENABLED, write_queue.GROUP_COMMIT_WINDOW = self.original_settings
+        with write_queue._writers_lock:
+            write_queue._writers.clear()
+        super().tearDown()
+
+    def student(self, number: int) -> dict:
+        return {'student_id': f'S{number:03d}', 'full_name': f'Student {number}', 'enrollment_year': 2023}
+
+    def test_busy_group_commit_is_retried(self):
+        original_commit = db_connection.PooledConnection.commit
+        original_retry = (db_retry.RETRY_ATTEMPTS, db_retry.RETRY_BASE_DELAY)
+        db_retry.RETRY_ATTEMPTS, db_retry.RETRY_BASE_DELAY = 5, 0.001
+        db_retry.reset_retry_stats()
+        busy_commits = []
+
+        def commit(conn):
+            if self.writer.in_writer_thread() and len(busy_commits) < 2:
+                busy_commits.append(1)
+                raise sqlite3.OperationalError('database is locked')
+            original_commit(conn)
+
+        db_connection.PooledConnection.commit = commit
+        try:
+            self.assertEqual(write_queue.add_student(self.student(1)), 'S001')
+        finally:
+            db_connection.PooledConnection.commit = original_commit
+            db_retry.RETRY_ATTEMPTS, db_retry.RETRY_BASE_DELAY = original_retry
+        self.assertEqual(len(busy_commits), 2)
+        self.assertIsNotNone(database_operations.get_student_by_id('S001'))
+        self.assertEqual(db_retry.get_retry_stats()['transaction commit']['recovered'], 1)
+
+    def test_concurrent_writes_are_grouped(self):
+        write_queue.GROUP_COMMIT_WINDOW = 0.05
+        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as pool:
+            student_ids = list(pool.map(lambda n: write_queue.add_student(self.student(n)), range(20)))
+        self.assertEqual(student_ids, [f'S{n:03d}' for n in range(20)])
+        self.assertEqual(len(database_operations.get_all_students()), 20)
+        stats = write_queue.get_write_queue_stats()[database_operations.DATABASE_NAME]
+        self.assertEqual(stats['writes'], 20)
+        self.assertLess(stats['groups'], 20)
+        self.assertGreater(stats['largest_group'], 1)
+
+    def test_failing_unit_does_not_affect_its_group(self):
+        write_queue.GROUP_COMMIT_WINDOW = 0.05
+
+        def add_then_fail(tx):
+            database_operations.add_student(self.student(2), tx=tx)
+            raise RuntimeError('rejected')
+
+        futures = [write_queue.submit(lambda tx: database_operations.add_student(self.student(1), tx=tx)),
+                   write_queue.submit(add_then_fail),
+                   write_queue.submit(lambda tx: database_operations.add_student(self.student(3), tx=tx))]
+        self.assertEqual(futures[0].result(), 'S001')
+        with self.assertRaisesRegex(RuntimeError, 'rejected'):
+            futures[1].result()
+        self.assertEqual(futures[2].result(), 'S003')
+        self.assertEqual([s['student_id'] for s in database_operations.get_all_students()], ['S001', 'S003'])
+
+    def test_run_in_transaction_and_wrappers(self):
+        def enroll(tx, student, grade):
+            student_id = database_operations.add_student(student, tx=tx)
+            database_operations.add_student_grade(dict(grade, student_id=student_id), tx=tx)
+            # Queued writes issued from inside a queued unit join it instead of deadlocking
+            write_queue.update_student(student_id, {'status': 'graduated'})
+            return student_id
+
+        grade = {'year_level': 1, 'subject': 'Math', 'grade': 'A'}
+        self.assertEqual(write_queue.run_in_transaction(enroll, self.student(1), grade), 'S001')
+        self.assertEqual(database_operations.get_student_by_id('S001')['status'], 'graduated')
+        self.assertEqual(len(database_operations.get_grades_for_student('S001')), 1)
+        # The wrappers keep the return conventions of the wrapped functions
+        self.assertIsNone(write_queue.add_student(self.student(1)))
+        self.assertFalse(write_queue.delete_student('S999'))
+        self.assertTrue(write_queue.delete_student('S001'))
+        with self.assertRaises(ValueError):
+            write_queue.add_student(self.student(2), tx=object())
+
+    def test_disabled_runs_on_caller_thread(self):
+        write_queue.WRITE_QUEUE_ENABLED = False
+        self.assertEqual(write_queue.add_student(self.student(1)), 'S001')
+        self.assertEqual(write_queue.run_in_transaction(lambda tx: threading.current_thread()),
+                         threading.current_thread())
+        self.assertEqual(write_queue.get_write_queue_stats()[database_operations.DATABASE_NAME]['writes'], 0)
+
+class TestRetryPolicy(FileDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.original_settings = (db_retry.RETRY_ATTEMPTS, db_retry.RETRY_BASE_DELAY, db_retry.RETRY_BUDGET)
+        db_retry.RETRY_ATTEMPTS, db_retry.RETRY_BASE_DELAY, db_retry.RETRY_BUDGET = 5, 0.001, 10.0
+        db_retry.reset_retry_stats()
+
+    def tearDown(self):
+        super().tearDown()
+        db_retry.RETRY_ATTEMPTS, db_retry.RETRY_BASE_DELAY, db_retry.RETRY_BUDGET = self.original_settings
+        db_retry.reset_retry_stats()
+
+    def test_is_transient_error(self):
+        self.assertTrue(db_retry.is_transient_error(sqlite3.OperationalError('database is locked')))
+        self.assertTrue(db_retry.is_transient_error(sqlite3.OperationalError('database table is locked')))
+        self.assertFalse(db_retry.is_transient_error(sqlite3.OperationalError('no such table: x')))
+        self.assertFalse(db_retry.is_transient_error(sqlite3.IntegrityError('UNIQUE constraint failed')))
+
+    def test_recovers_after_retries(self):
+        attempts = []
+
+        @db_retry.retry_on_busy
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise sqlite3.OperationalError('database is locked')
+            return 'done'
+
+        self.assertEqual(flaky(), 'done')
+        stats = db_retry.get_retry_stats()['TestRetryPolicy.test_recovers_after_retries.<locals>.flaky']
+        self.assertEqual((stats['calls'], stats['retries'], stats['recovered'], stats['failures']), (1, 2, 1, 0))
+
+    def test_gives_up_with_the_functions_failure_value(self):
+        attempts = []
+
+        @db_retry.retry_on_busy
+        def always_locked(tx=None):
+            try:
+                attempts.append(1)
+                raise sqlite3.OperationalError('database is locked')
+            except sqlite3.Error as e:
+                db_retry.raise_if_retryable(e)
+                return False
+
+        self.assertFalse(always_locked())
+        self.assertEqual(len(attempts), db_retry.RETRY_ATTEMPTS)
+        name = 'TestRetryPolicy.test_gives_up_with_the_functions_failure_value.<locals>.always_locked'
+        stats = db_retry.get_retry_stats()[name]
+        self.assertEqual((stats['calls'], stats['retries'], stats['failures']), (1, db_retry.RETRY_ATTEMPTS - 1, 1))
+
+        # Inside a caller's transaction the statement is not replayed
+        attempts.clear()
+        self.assertFalse(always_locked(tx=object()))
+        self.assertEqual(len(attempts), 1)
+
+    def test_budget_limits_retries(self):
+        db_retry.RETRY_BUDGET = 0
+
+        @db_retry.retry_on_busy
+        def locked():
+            raise sqlite3.OperationalError('database is locked')
+
+        with self.assertRaises(sqlite3.OperationalError):
+            locked()
+        self.assertEqual(list(db_retry.get_retry_stats().values())[0]['retries'], 0)
+
+    def test_waits_out_a_competing_writer(self):
+        original_profile = db_connection.get_pragma_profile()
+        db_connection.set_pragma_profile('balanced', busy_timeout=20)
+        db_retry.RETRY_ATTEMPTS, db_retry.RETRY_BASE_DELAY = 20, 0.05
+        try:
+            db_connection.close_all_pools() # Reopen with the short busy_timeout
+            database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani', 'enrollment_year': 2020})
+
+            other = sqlite3.connect(database_operations.DATABASE_NAME, check_same_thread=False)
+            other.execute("BEGIN IMMEDIATE")
+            release = threading.Timer(0.3, other.commit)
+            release.start()
+            self.assertTrue(database_operations.update_student('S001', {'full_name': 'Ani Wijaya'}))
+            release.join()
+            other.close()
+            stats = db_retry.get_retry_stats()['update_student']
+            self.assertGreater(stats['retries'], 0)
+            self.assertEqual((stats['recovered'], stats['failures']), (1, 0))
+        finally:
+            db_connection.set_pragma_profile(original_profile[0], **original_profile[1])
+
+class TestUpdateStatements(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani', 'enrollment_year': 2020,
+                                         'email': 'ani@example.com'})
+        self.grade_id = database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1,
+                                                               'subject': 'Math', 'grade': 'A'})
+        for family in (database_operations._STUDENT_UPDATES, database_operations._GRADE_UPDATES):
+            family.clear()
+
+    def test_same_columns_share_one_statement(self):
+        family = update_statements.UpdateStatementFamily('students', 'student_id', ['full_name', 'email', 'status'])
+        first_sql, first_params = family.build('S001', {'email': 'a@x', 'full_name': 'A', 'unknown': 1})
+        second_sql, _ = family.build('S002', {'full_name': 'B', 'email': 'b@x'})
+        self.assertIs(first_sql, second_sql)
+        self.assertEqual(first_params, {'full_name': 'A', 'email': 'a@x', 'where_key': 'S001'})
+        self.assertNotIn('status', first_sql)
+        self.assertIsNone(family.build('S001', {'unknown': 1}))
+        self.assertEqual((family.stats()['hits'], family.stats()['misses']), (1, 1))
+
+    def test_cache_is_bounded(self):
+        family = update_statements.UpdateStatementFamily('students', 'student_id', ['a', 'b', 'c'], max_size=2)
+        for data in ({'a': 1}, {'b': 1}, {'c': 1}, {'a': 1}):
+            family.build('S001', data)
+        stats = family.stats()
+        self.assertEqual((stats['size'], stats['evictions'], stats['hits']), (2, 2, 0))
+
+    def test_update_student_uses_compiled_statements(self):
+        self.assertTrue(database_operations.update_student('S001', {'full_name': 'Ani W', 'email': None}))
+        student = database_operations.get_student_by_id('S001')
+        self.assertEqual((student['full_name'], student['email']), ('Ani W', None))
+        self.assertTrue(database_operations.update_student('S001', {'email': 'new@example.com', 'full_name': 'Ani'}))
+        # Nothing changes, so no row is updated
+        self.assertFalse(database_operations.update_student('S001', {'full_name': 'Ani'}))
+        self.assertFalse(database_operations.update_student('S001', {'enrollment_year': '2020'}))
+        stats = database_operations.get_statement_cache_stats()['students']
+        self.assertEqual((stats['misses'], stats['hits']), (3, 1))
+
+    def test_update_student_grade_uses_compiled_statements(self):
+        self.assertTrue(database_operations.update_student_grade(self.grade_id, {'grade': 'B', 'student_id': 'S999'}))
+        self.assertFalse(database_operations.update_student_grade(self.grade_id, {'grade': 'B'}))
+        self.assertFalse(database_operations.update_student_grade(self.grade_id, {'student_id': 'S999'}))
+        grades = database_operations.get_grades_for_student('S001')
+        self.assertEqual((grades[0]['grade'], grades[0]['student_id']), ('B', 'S001'))
+        self.assertEqual(database_operations.get_statement_cache_stats()['student_grades']['hit_rate'], 0.5)
+
+class TestDbMetrics(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        db_metrics.reset_call_stats()
+        database_operations.add_student({'student_id': 'S001', 'full_name': 'Ani Lestari', 'enrollment_year': 2020})
+        database_operations.add_student({'student_id': 'S002', 'full_name': 'Budi', 'enrollment_year': 2020})
+
+    def tearDown(self):
+        db_metrics.reset_call_stats()
+
+    def test_records_calls_rows_and_statements(self):
+        for _ in range(3):
+            database_operations.get_all_students()
+        database_operations.get_student_by_id('S999')
+        stats = db_metrics.get_call_stats()
+        self.assertEqual(stats['add_student']['calls'], 2)
+        self.assertEqual((stats['get_all_students']['calls'], stats['get_all_students']['rows']), (3, 6))
+        self.assertGreaterEqual(stats['get_all_students']['statements'], 3)
+        self.assertEqual(stats['get_student_by_id']['rows'], 0)
+        self.assertLessEqual(stats['get_all_students']['p50'], stats['get_all_students']['p99'])
+
+    def test_slow_calls_are_logged_with_query_plans(self):
+        original_threshold = db_metrics.SLOW_QUERY_MS
+        db_metrics.SLOW_QUERY_MS = 0
+        logging.disable(logging.NOTSET)
+        try:
+            with self.assertLogs(level='WARNING') as logs:
+                database_operations.get_student_by_id('S001')
+        finally:
+            db_metrics.SLOW_QUERY_MS = original_threshold
+            logging.disable(logging.CRITICAL)
+        message = '\n'.join(logs.output)
+        self.assertIn('Slow database call get_student_by_id', message)
+        self.assertIn('QUERY PLAN: SEARCH students', message)
+        # Literal values are not logged
+        self.assertNotIn("'S001'", message)
+        self.assertEqual(db_metrics.get_call_stats()['get_student_by_id']['slow_calls'], 1)
+
+    def test_password_hashing_is_not_timed(self):
+        auth.initialize_auth_database()
+        self.assertTrue(auth.create_user('teacher', 'secret123'))
+        stats = db_metrics.get_call_stats()
+        self.assertNotIn('create_user', stats)
+        self.assertEqual(stats['_insert_user']['calls'], 1)
+
+    def test_normalize_sql(self):
+        self.assertEqual(db_metrics.normalize_sql("SELECT * FROM  t1 WHERE a = 'it''s' AND b = 2.5"),
+                         "SELECT * FROM t1 WHERE a = ? AND b = ?")
+
+    def test_prometheus_format(self):
+        database_operations.get_all_students()
+        text = db_metrics.render_prometheus([db_metrics.family('extra_total', 'counter', 'Extra.',
+                                                               [({'name': 'a"b'}, 1)])])
+        self.assertIn('# TYPE db_call_duration_seconds summary', text)
+        self.assertIn('db_call_duration_seconds{function="get_all_students",quantile="0.99"}', text)
+        self.assertIn('db_call_duration_seconds_count{function="get_all_students"} 1', text)
+        self.assertIn('db_call_rows_total{function="get_all_students"} 2', text)
+        self.assertIn('extra_total{name="a\\"b"} 1', text)
+
+class TestLogConfig(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.NOTSET)
+        self.root_level = logging.getLogger().level
+        self.stream = io.StringIO()
+
+    def tearDown(self):
+        log_config.stop_logging()
+        for name in ('database_operations', 'auth'):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+        logging.getLogger().setLevel(self.root_level)
+        logging.disable(original_logging_level)
+
+    def test_parse_module_levels(self):
+        levels, invalid = log_config.parse_module_levels('database_operations=warning, auth=10,bad,x=LOUD')
+        self.assertEqual(levels, {'database_operations': logging.WARNING, 'auth': logging.DEBUG})
+        self.assertEqual(invalid, ['bad', 'x=LOUD'])
+
+    def test_module_levels_and_sampling(self):
+        listener = log_config.configure_logging(level='INFO', module_levels={'database_operations': 'WARNING'},
+                                                sample_rate=0, stream=self.stream)
+        # Configured once: later calls keep the running pipeline
+        self.assertIs(log_config.configure_logging(stream=io.StringIO()), listener)
+
+        logging.getLogger('database_operations').info("Student %s added successfully.", 'S001')
+        logging.getLogger('database_operations').warning("Student %s not found for deletion.", 'S002')
+        logging.getLogger('auth').info("User '%s' created.", 'alice')
+        logging.getLogger('auth').error("Database error creating user '%s'.", 'bob')
+        stats = log_config.get_logging_stats()
+        log_config.stop_logging()  # Writes out the queue
+
+        output = self.stream.getvalue()
+        self.assertNotIn('S001', output)  # Below the module's level
+        self.assertIn('WARNING - database_operations - Student S002 not found for deletion.', output)
+        self.assertNotIn('alice', output)  # Sampled out
+        self.assertIn("ERROR - auth - Database error creating user 'bob'.", output)
+        self.assertEqual(stats, {'configured': True, 'sample_rate': 0, 'sampled_out': 1})
+        self.assertFalse(log_config.get_logging_stats()['configured'])
+
+    def test_messages_below_level_are_not_formatted(self):
+        log_config.configure_logging(level='INFO', module_levels={}, stream=self.stream)
+
+        class Exploding:
+            def __str__(self):
+                raise AssertionError("formatted a suppressed message")
+
+        logging.getLogger('database_operations').debug("Retrieved %s students.", Exploding())
+        log_config.stop_logging()
+        self.assertEqual(self.stream.getvalue(), '')
+
+class TestArchive(FileDatabaseTestCase):
+    """Former students are moved to the archive database and graduates stay findable."""
+
+    def setUp(self):
+        super().setUp()
+        self.original_interval = snapshot.SNAPSHOT_REFRESH_SECONDS
+        self.original_pause = archive.ARCHIVE_BATCH_PAUSE
+        snapshot.SNAPSHOT_REFRESH_SECONDS = 0
+        self.original_max_lock = archive.ARCHIVE_MAX_LOCK_SECONDS
+        archive.ARCHIVE_BATCH_PAUSE = 0
+        students = [
+            ('G001', 'graduated', 2010, 2013),
+            ('G002', 'graduated', 2011, 2014),
+            ('G003', 'graduated', 2020, 2023),  # Too recent
+            ('D001', 'dropped_out', 2012, None),
+            ('A001', 'active', 2010, None),
+        ]
+        for student_id, status, enrolled, graduated in students:
+            database_operations.add_student({'student_id': student_id, 'full_name': f"Student {student_id}",
+                                             'enrollment_year': enrolled, 'graduation_year': graduated,
+                                             'status': status})
+            database_operations.add_student_grade({'student_id': student_id, 'year_level': 1,
+                                                   'subject': 'Math', 'grade': 'B'})
+
+    def tearDown(self):
+        super().tearDown()
+        snapshot.SNAPSHOT_REFRESH_SECONDS = self.original_interval
+        archive.ARCHIVE_BATCH_PAUSE = self.original_pause
+        archive.ARCHIVE_MAX_LOCK_SECONDS = self.original_max_lock
+
+    def add_graduates(self, count: int):
+        database_operations.add_students_bulk(
+            [{'student_id': f"H{n:04d}", 'full_name': f"Graduate {n}", 'enrollment_year': 2008,
+              'graduation_year': 2011, 'status': 'graduated'} for n in range(count)])
+        database_operations.add_student_grades_bulk(
+            [{'student_id': f"H{n:04d}", 'year_level': year_level, 'subject': 'Math', 'grade': 'A'}
+             for n in range(count) for year_level in (1, 2, 3)])
+
+    def test_moves_old_former_students_in_batches(self):
+        report = database_operations.archive_students(older_than_years=5, batch_size=2, current_year=2024)
+        self.assertEqual(report, {'archived': 3, 'kept': 0, 'batches': 2, 'cutoff_year': 2019})
+        remaining = sorted(s['student_id'] for s in database_operations.get_all_students())
+        self.assertEqual(remaining, ['A001', 'G003'])
+        self.assertEqual(database_operations.get_grades_for_student('G001'), [])
+        stats = database_operations.get_archive_stats()
+        self.assertEqual(stats['by_status'], {'graduated': 2, 'dropped_out': 1})
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, 'records.archive.db')))
+        # Dashboard counters follow the move
+        self.assertEqual(database_operations.get_student_stats()['total_students'], 2)
+        # Nothing left to do on a second run
+        self.assertEqual(database_operations.archive_students(5, current_year=2024)['archived'], 0)
+
+    def test_graduate_lookup_falls_back_to_archive(self):
+        before = database_operations.get_graduated_student_record('G001')
+        database_operations.archive_students(older_than_years=5, current_year=2024)
+        database_operations.clear_record_cache()
+        after = database_operations.get_graduated_student_record('G001')
+        self.assertEqual(after, before)
+        self.assertEqual(after['grades'], [{'subject': 'Math', 'grade': 'B', 'year_level': 1}])
+        # Dropped-out students are archived but are not graduates
+        self.assertIsNone(database_operations.get_graduated_student_record('D001'))
+        self.assertIsNone(database_operations.get_graduated_student_record('NOPE'))
+
+    def test_students_changed_during_the_run_stay_live(self):
+        original_store = archive.Archive.store
+
+        def store_then_change(archive_self, records):
+            original_store(archive_self, records)
+            # Another writer updates a student between the copy and the delete
+            database_operations.update_student('G002', {'full_name': 'Renamed'})
+
+        archive.Archive.store = store_then_change
+        try:
+            report = database_operations.archive_students(older_than_years=5, current_year=2024)
+        finally:
+            archive.Archive.store = original_store
+        self.assertEqual((report['archived'], report['kept']), (2, 1))
+        self.assertEqual(database_operations.get_student_by_id('G002')['full_name'], 'Renamed')
+        self.assertEqual(database_operations.get_archive_stats()['by_status']['graduated'], 1)
+
+    def test_batches_shrink_when_they_hold_the_lock_too_long(self):
+        self.add_graduates(40)
+        archive.ARCHIVE_MAX_LOCK_SECONDS = 0
+        report = database_operations.archive_students(older_than_years=5, batch_size=16, current_year=2024)
+        # 16, 8, 4, 2, then one student per batch for the remaining 13
+        self.assertEqual((report['archived'], report['batches']), (43, 17))
+
+    def test_concurrent_writer_makes_progress(self):
+        self.add_graduates(600)
+        archive.ARCHIVE_BATCH_PAUSE = 0.005
+        done = threading.Event()
+        results = []
+
+        def write_while_archiving():
+            try:
+                n = 0
+                while not done.is_set():
+                    results.append(database_operations.add_student(
+                        {'student_id': f"N{n:04d}", 'full_name': f"New {n}", 'enrollment_year': 2024}))
+                    n += 1
+            finally:
+                db_connection.release_connections()
+
+        writer = threading.Thread(target=write_while_archiving)
+        writer.start()
+        try:
+            report = database_operations.archive_students(older_than_years=5, batch_size=50, current_year=2024)
+        finally:
+            done.set()
+            writer.join()
+        self.assertEqual(report['archived'], 603)
+        self.assertGreater(len(results), 0)
+        self.assertNotIn(None, results)
+        self.assertEqual(database_operations.get_archive_stats()['students'], 603)
+
+class TestChangeLog(BaseTestCase):
+    """Trigger-maintained change log and incremental sync."""
+
+    def add(self, student_id, name):
+        database_operations.add_student({'student_id': student_id, 'full_name': name, 'enrollment_year': 2020})
+
+    def sync_all(self, since=0, limit=2):
+        """Replays every page into a dict mirror, the way a client would."""
+        mirror = {'students': {}, 'student_grades': {}}
+        while True:
+            page = database_operations.get_changes_since(since, limit)
+            for change in page['changes']:
+                if change['operation'] == 'delete':
+                    mirror[change['table']].pop(change['key'], None)
+                else:
+                    mirror[change['table']][change['key']] = change['data']
+            since = page['next_version']
+            if not page['has_more']:
+                return mirror, since
+
+    def test_records_inserts_updates_and_deletes(self):
+        self.add('S001', 'Ani')
+        grade_id = database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1,
+                                                          'subject': 'Math', 'grade': 'A'})
+        first = database_operations.get_changes_since(0)
+        self.assertEqual([(c['table'], c['operation'], c['key']) for c in first['changes']],
+                         [('students', 'insert', 'S001'), ('student_grades', 'insert', grade_id)])
+        self.assertEqual(first['changes'][1]['data']['grade'], 'A')
+        self.assertEqual(first['next_version'], first['current_version'])
+
+        database_operations.update_student('S001', {'full_name': 'Ani Lestari'})
+        database_operations.update_student('S001', {'full_name': 'Ani Lestari'})  # No change, not logged
+        second = database_operations.get_changes_since(first['next_version'])
+        self.assertEqual([(c['operation'], c['data']['full_name']) for c in second['changes']],
+                         [('update', 'Ani Lestari')])
+
+        # Deleting the student also logs the grade removed by the cascade
+        database_operations.delete_student('S001')
+        third = database_operations.get_changes_since(second['next_version'])
+        self.assertEqual(sorted((c['table'], c['operation'], c['data']) for c in third['changes']),
+                         [('student_grades', 'delete', None), ('students', 'delete', None)])
+        self.assertFalse(third['has_more'])
+
+    def test_paged_sync_matches_the_database(self):
+        for number in range(1, 6):
+            self.add(f"S00{number}", f"Student {number}")
+        database_operations.update_student('S002', {'full_name': 'Renamed'})
+        database_operations.delete_student('S004')
+        database_operations.add_student_grade({'student_id': 'S003', 'year_level': 1, 'subject': 'Art', 'grade': 'B'})
+        mirror, version = self.sync_all(limit=2)
+        expected = {s['student_id']: s['full_name'] for s in database_operations.get_all_students()}
+        self.assertEqual({key: row['full_name'] for key, row in mirror['students'].items()}, expected)
+        self.assertEqual(len(mirror['student_grades']), 1)
+        # Nothing new since then
+        self.assertEqual(database_operations.get_changes_since(version)['changes'], [])
+
+    def test_compaction(self):
+        self.add('S001', 'Ani')
+        self.add('S002', 'Budi')
+        for name in ('Ani L', 'Ani Lestari'):
+            database_operations.update_student('S001', {'full_name': name})
+        result = database_operations.compact_change_log(max_entries=100, retention_days=30)
+        self.assertEqual((result['superseded'], result['expired'], result['remaining']), (2, 0, 2))
+        # Superseded entries are gone, but a full sync still sees the latest state
+        mirror, _ = self.sync_all(limit=1)
+        self.assertEqual(mirror['students']['S001']['full_name'], 'Ani Lestari')
+
+        result = database_operations.compact_change_log(max_entries=1, retention_days=30)
+        self.assertEqual((result['expired'], result['remaining']), (1, 1))
+        behind = database_operations.get_changes_since(0)
+        self.assertTrue(behind['resync_required'])
+        self.assertEqual(behind['next_version'], behind['current_version'])
+        self.assertFalse(database_operations.get_changes_since(result['compacted_through'])['resync_required'])
+
+class TestSubjects(BaseTestCase):
+    """Subject ids and numeric grade values stored next to the grade text."""
+
+    def setUp(self):
+        super().setUp()
+        for student_id in ('S001', 'S002'):
+            database_operations.add_student({'student_id': student_id, 'full_name': student_id, 'enrollment_year': 2020})
+
+    def grade_columns(self):
+        conn = database_operations.get_db_connection()
+        return [tuple(row) for row in conn.execute('''
+            SELECT g.subject, s.name, g.grade, g.grade_value FROM student_grades g
+            LEFT JOIN subjects s ON s.subject_id = g.subject_id ORDER BY g.grade_id''')]
+
+    def cached_subjects(self):
+        return {name for (database, name) in database_operations._subject_ids
+                if database == database_operations.current_database()}
+
+    def test_parse_grade_value(self):
+        self.assertEqual(database_operations.parse_grade_value(' 85 '), 85.0)
+        self.assertEqual(database_operations.parse_grade_value('92.5'), 92.5)
+        self.assertEqual(database_operations.parse_grade_value(90), 90.0)
+        for text in ('B+', 'Incomplete', '', '8.5.1', None):
+            self.assertIsNone(database_operations.parse_grade_value(text))
+
+    def test_writes_intern_subjects(self):
+        database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1, 'subject': 'Matematika', 'grade': '85'})
+        grade_id = database_operations.add_student_grade({'student_id': 'S002', 'year_level': 1,
+                                                          'subject': 'Matematika', 'grade': 'B+'})
+        database_operations.add_student_grades_bulk([
+            {'student_id': 'S001', 'year_level': 1, 'subject': 'Biologi', 'grade': '70'},
+            {'student_id': 'S002', 'year_level': 1, 'subject': 'Matematika', 'grade': '91'},
+        ])
+        conn = database_operations.get_db_connection()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM subjects").fetchone()[0], 2)
+        self.assertEqual(self.cached_subjects(), {'Matematika', 'Biologi'})
+
+        self.assertTrue(database_operations.update_student_grade(grade_id, {'subject': 'Fisika', 'grade': '60'}))
+        self.assertEqual(self.grade_columns(), [
+            ('Matematika', 'Matematika', '85', 85.0),
+            ('Fisika', 'Fisika', '60', 60.0),
+            ('Biologi', 'Biologi', '70', 70.0),
+            ('Matematika', 'Matematika', '91', 91.0),
+        ])
+
+    def test_update_of_missing_grade_adds_no_subject(self):
+        self.assertFalse(database_operations.update_student_grade(999, {'subject': 'Astronomi', 'grade': '80'}))
+        conn = database_operations.get_db_connection()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM subjects").fetchone()[0], 0)
+        self.assertNotIn('Astronomi', self.cached_subjects())
+
+    def test_subjects_of_rolled_back_writes_are_not_cached(self):
+        with self.assertRaises(RuntimeError):
+            with database_operations.transaction() as tx:
+                database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1,
+                                                       'subject': 'Kimia', 'grade': 'A'}, tx=tx)
+                raise RuntimeError("abort")
+        self.assertNotIn('Kimia', self.cached_subjects())
+        # A later write creates the subject again instead of using the rolled-back id
+        database_operations.add_student_grade({'student_id': 'S001', 'year_level': 1, 'subject': 'Kimia', 'grade': 'A'})
+        self.assertEqual(self.grade_columns(), [('Kimia', 'Kimia', 'A', None)])
+        self.assertIn('Kimia', self.cached_subjects())
+
+    def test_migration_fills_existing_rows_in_batches(self):
+        conn = database_operations.get_db_connection()
+        with conn:
+            conn.executemany("INSERT INTO student_grades (student_id, year_level, subject, grade) VALUES (?, 1, ?, ?)",
+                             [('S001', 'Sejarah', '80'), ('S001', 'Geografi', 'A-'), ('S002', 'Sejarah', '75.5')])
+        report = database_operations.migrate_grade_columns(batch_size=2)
+        self.assertEqual(report, {'migrated': 3, 'batches': 2})
+        self.assertEqual(self.grade_columns(), [
+            ('Sejarah', 'Sejarah', '80', 80.0),
+            ('Geografi', 'Geografi', 'A-', None),
+            ('Sejarah', 'Sejarah', '75.5', 75.5),
+        ])
+        self.assertEqual(database_operations.migrate_grade_columns()['migrated'], 0)
+
+        stats = database_operations.get_subject_statistics()
+        self.assertEqual([(s['subject'], s['grades'], s['numeric_grades'], s['average']) for s in stats],
+                         [('Geografi', 1, 0, None), ('Sejarah', 2, 2, 77.75)])
+
 if __name__ == '__main__':
     # You can run the tests from the command line using:
     # python -m unittest test_backend.py
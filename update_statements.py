@@ -0,0 +1,107 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Compiled UPDATE statements kept per table (one per distinct set of updated columns).
+UPDATE_STATEMENT_CACHE_SIZE = int(os.environ.get('UPDATE_STATEMENT_CACHE_SIZE', 64))
+
+
+class UpdateStatementFamily:
+    """
+    Builds the partial UPDATE statements of one table from a fixed list of
+    updatable columns.
+
+    The columns present in an update are reduced to a bitmask over that list,
+    and each mask maps to exactly one SQL text with the columns in a fixed
+    order. Updates touching the same columns therefore always reuse the same
+    statement, whatever the order of the keys in the caller's dict, so the
+    sqlite3 per-connection statement cache keeps it prepared. Only the columns
+    being updated appear in the SET list, so `AFTER UPDATE OF <column>` triggers
+    fire only when those columns are written.
+
+    The WHERE clause also requires at least one column to actually change
+    (`column IS NOT :column`), so an update that would leave the row as it is
+    matches no row and does not fire triggers.
+
+    Compiled statements are kept in a bounded LRU cache (`max_size`, 0 disables
+    it); hits, misses and evictions are reported by stats().
+    """
+
+    def __init__(self, table: str, key_column: str, columns: list[str], returning: str | None = None,
+                 max_size: int = UPDATE_STATEMENT_CACHE_SIZE):
+        self.table = table
+        self.key_column = key_column
+        self.columns = tuple(columns)
+        self.returning = returning
+        self.max_size = max_size
+        self._bits = {column: 1 << position for position, column in enumerate(self.columns)}
+        self._statements = OrderedDict()  # mask -> SQL, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def mask(self, data: dict) -> int:
+        """Returns the bitmask of the updatable columns present in `data`; other keys are ignored."""
+        mask = 0
+        for key in data:
+            mask |= self._bits.get(key, 0)
+        return mask
+
+    def _compile(self, mask: int) -> str:
+        columns = [column for column in self.columns if mask & self._bits[column]]
+        assignments = ', '.join(f"{column} = :{column}" for column in columns)
+        changed = ' OR '.join(f"{column} IS NOT :{column}" for column in columns)
+        sql = f"UPDATE {self.table} SET {assignments} WHERE {self.key_column} = :where_key AND ({changed})"
+        if self.returning:
+            sql += f" RETURNING {self.returning}"
+        return sql
+
+    def statement(self, mask: int) -> str:
+        """Returns the SQL for a non-zero column mask, compiling it on first use."""
+        with self._lock:
+            sql = self._statements.get(mask)
+            if sql is not None:
+                self._statements.move_to_end(mask)
+                self.hits += 1
+                return sql
+            self.misses += 1
+        sql = self._compile(mask)
+        if self.max_size > 0:
+            with self._lock:
+                self._statements[mask] = sql
+                while len(self._statements) > self.max_size:
+                    self._statements.popitem(last=False)
+                    self.evictions += 1
+        return sql
+
+    def build(self, key, data: dict) -> tuple[str, dict] | None:
+        """
+        Returns (sql, params) updating the row `key` with the updatable columns
+        in `data`, or None if `data` contains none of them.
+        """
+        mask = self.mask(data)
+        if not mask:
+            return None
+        params = {column: data[column] for column in self.columns if mask & self._bits[column]}
+        params['where_key'] = key
+        return self.statement(mask), params
+
+    def stats(self) -> dict:
+        """Returns {'hits', 'misses', 'evictions', 'size', 'max_size', 'hit_rate'}."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._statements),
+                'max_size': self.max_size,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        """Drops all compiled statements and resets the counters."""
+        with self._lock:
+            self._statements.clear()
+            self.hits = self.misses = self.evictions = 0
@@ -0,0 +1,229 @@
+"""
+Optional single-writer layer: all writes of this process to a database go
+through one writer thread, which commits whatever has queued up in one shared
+transaction (group commit) and hands each caller its result through a future.
+
+    student_id = write_queue.add_student(student_data)
+
+    def enroll(tx, student, grades):
+        student_id = database_operations.add_student(student, tx=tx)
+        for grade in grades:
+            database_operations.add_student_grade(grade, tx=tx)
+        return student_id
+
+    student_id = write_queue.run_in_transaction(enroll, student, grades)
+
+Because writes of one process never compete with each other, each app worker
+holds at most one connection that waits for the SQLite write lock, and one
+commit (and fsync) covers many small writes. Each queued unit runs inside its
+own SAVEPOINT, so a unit that raises is rolled back without affecting the
+others in its group.
+
+Enable with WRITE_QUEUE=1. When disabled, the same functions run the write
+directly in a transaction() on the caller's thread, so callers do not need to
+know which mode is active.
+"""
+import concurrent.futures
+import functools
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import database_operations
+import db_connection
+
+logger = logging.getLogger(__name__)
+
+WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE', '0').lower() in ('1', 'true', 'yes', 'on')
+# Most queued units committed together in one transaction.
+GROUP_COMMIT_MAX = int(os.environ.get('WRITE_GROUP_MAX', 64))
+# Extra time (seconds) the writer waits for more units before committing a group.
+# 0 commits what is queued right away; writes arriving during a commit still share the next one.
+GROUP_COMMIT_WINDOW = float(os.environ.get('WRITE_GROUP_WINDOW_MS', 0)) / 1000
+# Seconds without writes after which a writer thread exits and returns its connection.
+WRITER_IDLE_SECONDS = 30.0
+
+
+class _Unit:
+    __slots__ = ('func', 'args', 'kwargs', 'future', 'result', 'error')
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = concurrent.futures.Future()
+        self.result = None
+        self.error = None
+
+
+class Writer:
+    """The writer thread and queue for one database file. Use submit() rather than creating these directly."""
+
+    def __init__(self, database: str):
+        self.database = database
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()  # Guards starting and stopping the thread
+        self._thread = None
+        self.groups = 0
+        self.writes = 0
+        self.largest_group = 0
+
+    def submit(self, func, *args, **kwargs) -> concurrent.futures.Future:
+        """Queues `func(tx, *args, **kwargs)` and returns a future for its return value."""
+        unit = _Unit(func, args, kwargs)
+        with self._lock:
+            self._queue.put(unit)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+        return unit.future
+
+    def in_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def _next_group(self) -> list | None:
+        """Waits for the next units to commit; returns None once the writer has been idle too long."""
+        try:
+            group = [self._queue.get(timeout=WRITER_IDLE_SECONDS)]
+        except queue.Empty:
+            with self._lock:
+                if self._queue.empty():
+                    self._thread = None
+                    return None
+            group = [self._queue.get_nowait()]
+        deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+        while len(group) < GROUP_COMMIT_MAX:
+            try:
+                remaining = deadline - time.monotonic()
+                group.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return group
+
+    def _run(self) -> None:
+        try:
+            with db_connection.use_database(self.database):
+                while True:
+                    group = self._next_group()
+                    if group is None:
+                        return
+                    self._commit_group(group)
+        finally:
+            db_connection.release_connections()
+
+    def _commit_group(self, group: list) -> None:
+        # Skip units whose caller cancelled the future before the writer got to them
+        group = [unit for unit in group if unit.future.set_running_or_notify_cancel()]
+        if not group:
+            return
+        try:
+            with database_operations.transaction() as tx:
+                for unit in group:
+                    tx.conn.execute("SAVEPOINT queued_write")
+                    try:
+                        unit.result = unit.func(tx, *unit.args, **unit.kwargs)
+                    except Exception as e:
+                        tx.conn.execute("ROLLBACK TO queued_write")
+                        unit.error = e
+                    tx.conn.execute("RELEASE queued_write")
+        except Exception as e:
+            # BEGIN or COMMIT failed even after transaction() retried it, so nothing in the group was written
+            logger.error("Group commit of %s writes to %s failed: %s", len(group), self.database, e)
+            for unit in group:
+                unit.future.set_exception(e)
+            return
+
+        self.groups += 1
+        self.writes += len(group)
+        self.largest_group = max(self.largest_group, len(group))
+        # Results are only handed out once they are committed
+        for unit in group:
+            if unit.error is not None:
+                unit.future.set_exception(unit.error)
+            else:
+                unit.future.set_result(unit.result)
+
+    def stats(self) -> dict:
+        """Returns {'groups', 'writes', 'largest_group', 'average_group', 'queued'}."""
+        return {
+            'groups': self.groups,
+            'writes': self.writes,
+            'largest_group': self.largest_group,
+            'average_group': round(self.writes / self.groups, 2) if self.groups else 0.0,
+            'queued': self._queue.qsize(),
+        }
+
+
+_writers: dict[str, Writer] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(database: str | None = None) -> Writer:
+    """Returns the writer of `database` (default: the current context's database), creating it on first use."""
+    database = database or database_operations.current_database()
+    with _writers_lock:
+        writer = _writers.get(database)
+        if writer is None:
+            writer = Writer(database)
+            _writers[database] = writer
+        return writer
+
+
+def submit(func, *args, **kwargs) -> concurrent.futures.Future:
+    """
+    Queues `func(tx, *args, **kwargs)` on the writer of the current database and
+    returns a future. The future's result is the function's return value once the
+    group it was committed with is durable; its exception is whatever the function
+    raised, or the sqlite3.Error that made the group commit fail.
+    """
+    return get_writer().submit(func, *args, **kwargs)
+
+
+def run_in_transaction(func, *args, **kwargs):
+    """
+    Runs `func(tx, *args, **kwargs)` as one atomic unit and returns its result:
+    through the writer queue when WRITE_QUEUE is enabled, otherwise directly in
+    a database_operations.transaction() block. Exceptions are re-raised.
+    """
+    if WRITE_QUEUE_ENABLED:
+        writer = get_writer()
+        if not writer.in_writer_thread():
+            return writer.submit(func, *args, **kwargs).result()
+    with database_operations.transaction() as tx:
+        return func(tx, *args, **kwargs)
+
+
+def _queued_version(func, failure):
+    """
+    Wraps a CRUD function taking `tx=` so it runs through run_in_transaction().
+    Like the function itself, the wrapper logs database errors and returns
+    `failure` instead of raising.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if kwargs.pop('tx', None) is not None:
+            raise ValueError("Queued writes run in the writer's transaction; use run_in_transaction().")
+        try:
+            return run_in_transaction(lambda tx: func(*args, tx=tx, **kwargs))
+        except sqlite3.Error as e:
+            logger.error("Queued %s failed: %s", func.__name__, e)
+            return failure
+    return wrapper
+
+
+add_student = _queued_version(database_operations.add_student, None)
+update_student = _queued_version(database_operations.update_student, False)
+delete_student = _queued_version(database_operations.delete_student, False)
+add_student_grade = _queued_version(database_operations.add_student_grade, None)
+update_student_grade = _queued_version(database_operations.update_student_grade, False)
+delete_student_grade = _queued_version(database_operations.delete_student_grade, False)
+
+
+def get_write_queue_stats() -> dict:
+    """Returns the writer statistics per database, e.g. {'student_records.db': {'groups': 12, ...}}."""
+    with _writers_lock:
+        writers = list(_writers.values())
+    return {writer.database: writer.stats() for writer in writers}